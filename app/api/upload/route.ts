@@ -1,46 +1,8 @@
-import { writeFile, readFile } from 'fs/promises'
+import { writeFile } from 'fs/promises'
 import { mkdir } from 'fs/promises'
 import { NextRequest, NextResponse } from 'next/server'
 import path from 'path'
-
-interface Upload {
-  id: string
-  fileName: string
-  queuePath: string
-  uploadedAt: string
-  status: 'queued' | 'processing' | 'completed' | 'error'
-  fileSize: number
-}
-
-interface UploadsData {
-  uploads: Upload[]
-}
-
-async function updateUploadsJson(newUpload: Upload) {
-  const uploadsPath = path.join(process.cwd(), 'database', 'uploads.json')
-  
-  try {
-    // Read existing uploads
-    const uploadsContent = await readFile(uploadsPath, 'utf-8')
-    const uploadsData: UploadsData = JSON.parse(uploadsContent)
-    
-    // Add new upload
-    uploadsData.uploads.unshift(newUpload)
-    
-    // Save updated uploads
-    await writeFile(uploadsPath, JSON.stringify(uploadsData, null, 2))
-  } catch (error) {
-    if ((error as NodeJS.ErrnoException).code === 'ENOENT') {
-      // If file doesn't exist, create it with initial data
-      const initialData: UploadsData = {
-        uploads: [newUpload]
-      }
-      await writeFile(uploadsPath, JSON.stringify(initialData, null, 2))
-    } else {
-      throw error
-    }
-  }
-}
+import { Upload, addUpload } from '@/lib/uploads'
 
 export async function POST(request: NextRequest) {
   try {
@@ -78,7 +40,7 @@ export async function POST(request: NextRequest) {
     }
 
     // Update uploads.json
-    await updateUploadsJson(upload)
+    await addUpload(upload)
 
     return NextResponse.json({ 
       success: true, 
@@ -1,19 +1,7 @@
 import { readFile } from 'fs/promises'
 import { NextRequest, NextResponse } from 'next/server'
 import path from 'path'
-
-interface Upload {
-  id: string
-  fileName: string
-  queuePath: string
-  uploadedAt: string
-  status: 'queued' | 'processing' | 'completed' | 'error'
-  fileSize: number
-}
-
-interface UploadsData {
-  uploads: Upload[]
-}
+import { UPLOADS_FILE, UploadsData } from '@/lib/uploads'
 
 export async function GET(
   request: NextRequest,
@@ -21,8 +9,7 @@ export async function GET(
 ) {
   try {
     // Read uploads.json to find the file path
-    const uploadsPath = path.join(process.cwd(), 'database', 'uploads.json')
-    const uploadsContent = await readFile(uploadsPath, 'utf-8')
+    const uploadsContent = await readFile(UPLOADS_FILE, 'utf-8')
     const uploadsData: UploadsData = JSON.parse(uploadsContent)
     
     // Find the upload record
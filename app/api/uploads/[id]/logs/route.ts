@@ -1,6 +1,7 @@
 import { NextResponse } from 'next/server'
 import { promises as fs } from 'fs'
 import path from 'path'
+import { UPLOADS_FILE } from '@/lib/uploads'
 
 export async function GET(
   request: Request,
@@ -10,8 +11,7 @@ export async function GET(
     const { id } = params
     
     // Read uploads.json to get the file info
-    const uploadsPath = path.join(process.cwd(), 'database', 'uploads.json')
-    const uploadsContent = await fs.readFile(uploadsPath, 'utf-8')
+    const uploadsContent = await fs.readFile(UPLOADS_FILE, 'utf-8')
     const uploadsData = JSON.parse(uploadsContent)
     
     // Find the upload record
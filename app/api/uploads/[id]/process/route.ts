@@ -2,18 +2,24 @@ import { NextResponse } from 'next/server'
 import { spawn } from 'child_process'
 import path from 'path'
 import { promises as fs } from 'fs'
+import { UPLOADS_FILE, WORKER_HEARTBEAT_FILE, readUploads, updateUpload } from '@/lib/uploads'
 
-interface Upload {
-  id: string
-  fileName: string
-  queuePath: string
-  uploadedAt: string
-  status: 'queued' | 'processing' | 'completed' | 'error'
-  fileSize: number
+interface WorkerHeartbeat {
+  pid: number
+  state: 'idle' | 'processing'
+  updatedAt: string
 }
 
-interface UploadsData {
-  uploads: Upload[]
+// A resident worker (`fileprocessing.py --worker`) refreshes this file every few seconds
+const WORKER_HEARTBEAT_MAX_AGE_MS = 15000
+
+async function isWorkerAlive(): Promise<boolean> {
+  try {
+    const heartbeat: WorkerHeartbeat = JSON.parse(await fs.readFile(WORKER_HEARTBEAT_FILE, 'utf-8'))
+    return Date.now() - new Date(heartbeat.updatedAt).getTime() < WORKER_HEARTBEAT_MAX_AGE_MS
+  } catch {
+    return false
+  }
 }
 
 export async function POST(
@@ -26,11 +32,9 @@ export async function POST(
     console.log('Processing file with ID:', id)
     
     // Read uploads.json to get the file path
-    const uploadsPath = path.join(process.cwd(), 'database', 'uploads.json')
-    console.log('Reading uploads from:', uploadsPath)
+    console.log('Reading uploads from:', UPLOADS_FILE)
     
-    const uploadsContent = await fs.readFile(uploadsPath, 'utf-8')
-    const uploadsData: UploadsData = JSON.parse(uploadsContent)
+    const uploadsData = await readUploads()
     
     // Find the upload record
     const upload = uploadsData.uploads.find(u => u.id === id)
@@ -44,6 +48,16 @@ export async function POST(
     
     console.log('Found upload record:', upload)
     
+    // Leave the upload queued when a resident worker will pick it up
+    if (await isWorkerAlive()) {
+      await updateUpload(id, { status: 'queued' })
+      console.log('Resident worker is running, leaving upload queued')
+      return NextResponse.json({
+        success: true,
+        message: 'Queued for resident worker'
+      })
+    }
+    
     // Get the absolute paths
     const scriptPath = path.join(process.cwd(), 'scripts', 'process_queue.py')
     
@@ -91,8 +105,7 @@ export async function POST(
     console.log('Log file will be written to:', logPath)
 
     // Update status in uploads.json
-    upload.status = 'processing'
-    await fs.writeFile(uploadsPath, JSON.stringify(uploadsData, null, 2))
+    await updateUpload(id, { status: 'processing' })
     console.log('Updated upload status to processing')
 
     console.log('\nStarting Python Process:')
@@ -129,8 +142,7 @@ export async function POST(
       await logStream.close()
       
       // Update status based on exit code
-      upload.status = code === 0 ? 'completed' : 'error'
-      await fs.writeFile(uploadsPath, JSON.stringify(uploadsData, null, 2))
+      await updateUpload(id, { status: code === 0 ? 'completed' : 'error' })
     })
 
     // Handle process error
@@ -140,8 +152,7 @@ export async function POST(
       await logStream.close()
       
       // Update status to error
-      upload.status = 'error'
-      await fs.writeFile(uploadsPath, JSON.stringify(uploadsData, null, 2))
+      await updateUpload(id, { status: 'error' })
     })
 
     return NextResponse.json({
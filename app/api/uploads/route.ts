@@ -1,11 +1,10 @@
 import { readFile } from 'fs/promises'
 import { NextResponse } from 'next/server'
-import path from 'path'
+import { UPLOADS_FILE } from '@/lib/uploads'
 
 export async function GET() {
   try {
-    const uploadsPath = path.join(process.cwd(), 'database', 'uploads.json')
-    const uploadsContent = await readFile(uploadsPath, 'utf-8')
+    const uploadsContent = await readFile(UPLOADS_FILE, 'utf-8')
     const uploadsData = JSON.parse(uploadsContent)
     
     return NextResponse.json(uploadsData)
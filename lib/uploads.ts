@@ -0,0 +1,98 @@
+import { promises as fs } from 'fs'
+import path from 'path'
+
+export interface Upload {
+  id: string
+  fileName: string
+  queuePath: string
+  uploadedAt: string
+  status: 'queued' | 'processing' | 'completed' | 'error'
+  fileSize: number
+}
+
+export interface UploadsData {
+  uploads: Upload[]
+}
+
+// Shared with the resident worker (`fileprocessing.py --worker`), which reads the same
+// UPLOADS_FILE / WORKER_HEARTBEAT_FILE variables and defaults
+export const UPLOADS_FILE = process.env.UPLOADS_FILE
+  ? path.resolve(process.env.UPLOADS_FILE)
+  : path.join(process.cwd(), 'database', 'uploads.json')
+
+export const WORKER_HEARTBEAT_FILE = process.env.WORKER_HEARTBEAT_FILE
+  ? path.resolve(process.env.WORKER_HEARTBEAT_FILE)
+  : path.join(process.cwd(), 'app', 'database', 'worker_heartbeat.json')
+
+export async function readUploads(): Promise<UploadsData> {
+  try {
+    return JSON.parse(await fs.readFile(UPLOADS_FILE, 'utf-8'))
+  } catch (error) {
+    if ((error as NodeJS.ErrnoException).code === 'ENOENT') {
+      return { uploads: [] }
+    }
+    throw error
+  }
+}
+
+// The worker re-reads the file at any moment, so it must never see it half-written
+async function writeUploads(data: UploadsData): Promise<void> {
+  await fs.mkdir(path.dirname(UPLOADS_FILE), { recursive: true })
+  const tmpPath = `${UPLOADS_FILE}.${process.pid}.${Date.now()}.tmp`
+  await fs.writeFile(tmpPath, JSON.stringify(data, null, 2))
+  await fs.rename(tmpPath, UPLOADS_FILE)
+}
+
+// Held around every read-modify-write of UPLOADS_FILE, by these helpers and by the worker
+// (queue_worker.uploads_lock); a lock older than LOCK_STALE_MS was left by a writer that died
+const LOCK_FILE = `${UPLOADS_FILE}.lock`
+const LOCK_STALE_MS = 10000
+
+async function withUploadsLock<T>(update: () => Promise<T>): Promise<T> {
+  await fs.mkdir(path.dirname(UPLOADS_FILE), { recursive: true })
+  for (;;) {
+    try {
+      await (await fs.open(LOCK_FILE, 'wx')).close()
+      break
+    } catch (error) {
+      if ((error as NodeJS.ErrnoException).code !== 'EEXIST') {
+        throw error
+      }
+    }
+    try {
+      if (Date.now() - (await fs.stat(LOCK_FILE)).mtimeMs > LOCK_STALE_MS) {
+        await fs.unlink(LOCK_FILE)
+        continue
+      }
+    } catch {
+      // Released (or removed as stale by someone else) in the meantime
+      continue
+    }
+    await new Promise(resolve => setTimeout(resolve, 20))
+  }
+  try {
+    return await update()
+  } finally {
+    await fs.unlink(LOCK_FILE).catch(() => {})
+  }
+}
+
+// Re-read under the lock, so records the worker changed in the meantime are kept
+export async function addUpload(upload: Upload): Promise<void> {
+  await withUploadsLock(async () => {
+    const data = await readUploads()
+    data.uploads.unshift(upload)
+    await writeUploads(data)
+  })
+}
+
+export async function updateUpload(id: string, fields: Partial<Upload>): Promise<void> {
+  await withUploadsLock(async () => {
+    const data = await readUploads()
+    const upload = data.uploads.find(u => u.id === id)
+    if (upload) {
+      Object.assign(upload, fields)
+      await writeUploads(data)
+    }
+  })
+}
@@ -0,0 +1,181 @@
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# FileProcessor of the current pool process, set up by _init_worker
+_processor = None
+
+
+def _init_worker(options: dict, budget) -> None:
+    global _processor
+    from fileprocessing import FileProcessor, configure_logging
+
+    if not logging.getLogger().handlers:
+        configure_logging()
+
+    # Shard workers never touch the catalogue, so they skip the SQLite connection;
+    # their stage timings go back to the parent with each shard
+    _processor = FileProcessor(**dict(options, storage="json", metrics_format="none",
+                                     catalogue_summary=False))
+    _processor.engine.budget = budget
+
+
+def build_shard(file_path: str, shard_path: str) -> dict:
+    """Run parsing, field extraction, brand extraction and the LLM stage for one upload.
+
+    Writes one JSON line per input product, in input order, with the
+    prepared product and its validated category result (or the error).
+    """
+    processor = _processor
+    processor.engine.reset_counters()
+    processor.batch_stats.reset()
+    processor.metrics.reset()
+    products_iter = processor._open_input(file_path)[0]
+    count = 0
+    avoided = 0
+
+    with open(shard_path, 'w', encoding='utf-8') as f:
+        for (product_id, product), result, error in processor._llm_stage(products_iter):
+            count += 1
+            if error is not None:
+                processor.metrics.increment("products_error")
+                logger.error(f"Error processing product {product_id}: {str(error)}")
+            elif result and result["source"] == "clasificador":
+                avoided += 1
+                processor.metrics.increment("llm_calls_avoided")
+            f.write(json.dumps({
+                "id": product_id,
+                "product": product,
+                "result": result,
+                "error": str(error) if error is not None else None
+            }, ensure_ascii=False) + "\n")
+
+    stage = {
+        "total": count,
+        "llm_requests": processor.engine.requests,
+        "llm_retries": processor.engine.retries,
+        "llm_calls_avoided": avoided,
+        "llm_tokens": processor.engine.token_usage(),
+        "metrics": processor.metrics.state()
+    }
+    if processor.batch_prompts > 1:
+        stage["batching"] = processor.batch_stats.summary()
+    return stage
+
+
+class ShardedIngest:
+    """Ingests many uploads at once: LLM stage in a process pool, store updates in this process.
+
+    Each upload becomes a shard of candidate products built by a pool
+    worker. Shards are merged into the processor's stores strictly in the
+    order the uploads were given, so dedup and category insertion give the
+    same result whichever worker finishes first. A semaphore shared by all
+    workers caps the LLM requests in flight across the whole pool.
+
+    Workers categorize with the classifier model saved when the batch
+    starts; what the merge teaches it is used from the next batch on.
+    """
+
+    def __init__(self, processor, options: dict, workers: int = 4, llm_budget: int = 4):
+        self.processor = processor
+        self.options = dict(options, concurrency=max(1, llm_budget))
+        self.workers = max(1, workers)
+        self.llm_budget = max(1, llm_budget)
+        self.shard_dir = processor.database_dir / 'shards'
+
+    def _merge(self, shard_path: Path, stage: dict) -> dict:
+        processor = self.processor
+        processed = 0
+        skipped = 0
+        errors = 0
+        processor.metrics.merge(stage["metrics"])
+
+        with open(shard_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record["error"] is not None:
+                    errors += 1
+                    continue
+                try:
+                    outcome = processor._apply_result(record["product"], record["result"])
+                except Exception as e:
+                    logger.error(f"Error processing product: {str(e)}")
+                    outcome = "error"
+                processor.metrics.increment(f"products_{outcome}")
+                if outcome == "processed":
+                    processed += 1
+                    if processor.journal.is_full():
+                        processor._commit()
+                elif outcome == "skipped":
+                    skipped += 1
+                else:
+                    errors += 1
+                processor.metrics.maybe_flush()
+
+        processor._commit()
+        summary = {
+            "total": stage["total"],
+            "processed": processed,
+            "skipped": skipped,
+            "errors": errors,
+            "llm_requests": stage["llm_requests"],
+            "llm_retries": stage["llm_retries"],
+            "llm_calls_avoided": stage["llm_calls_avoided"],
+            "llm_tokens": stage["llm_tokens"],
+            "success": True
+        }
+        if "batching" in stage:
+            summary["batching"] = stage["batching"]
+        return summary
+
+    def run(self, jobs: list) -> dict:
+        """Ingest (upload_id, file_path) jobs; return each upload's summary by id."""
+        processor = self.processor
+        processor._ensure_stores()
+        # Workers load the classifier from disk, so give them the current model
+        if processor.classifier is not None:
+            processor.classifier.save(processor.classifier_file)
+        self.shard_dir.mkdir(parents=True, exist_ok=True)
+
+        # Spawned rather than forked: the parent holds threads and an open SQLite transaction
+        context = multiprocessing.get_context("spawn")
+        budget = context.BoundedSemaphore(self.llm_budget)
+        summaries = {}
+        logger.info(f"Ingesting {len(jobs)} uploads with {self.workers} workers and {self.llm_budget} LLM slots")
+
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)) or 1, mp_context=context,
+                                 initializer=_init_worker, initargs=(self.options, budget)) as pool:
+            futures = []
+            for index, (upload_id, file_path) in enumerate(jobs):
+                shard_path = self.shard_dir / f"{index:04d}-{Path(file_path).stem}.jsonl"
+                futures.append((upload_id, file_path, shard_path, pool.submit(build_shard, str(file_path), str(shard_path))))
+
+            # Merge in submission order while later shards are still being built
+            for upload_id, file_path, shard_path, future in futures:
+                try:
+                    summaries[upload_id] = self._merge(shard_path, future.result())
+                    logger.info(f"Merged {file_path}: {json.dumps(summaries[upload_id])}")
+                except Exception as e:
+                    error_msg = f"Error processing file: {str(e)}"
+                    logger.error(error_msg)
+                    summaries[upload_id] = {
+                        "total": 0,
+                        "processed": 0,
+                        "skipped": 0,
+                        "errors": 1,
+                        "success": False,
+                        "error": error_msg
+                    }
+                finally:
+                    if shard_path.exists():
+                        shard_path.unlink()
+
+        if processor.mirror_json and processor.storage == "sqlite":
+            processor.export_json()
+        processor.update_summary()
+        processor.metrics.flush()
+        return summaries
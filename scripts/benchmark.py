@@ -0,0 +1,420 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import logging
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+BRANDS = ["PULEVA", "NESTLÉ", "DANONE", "CENTRAL LECHERA ASTURIANA", "COCA-COLA", "MAHOU",
+          "FONT VELLA", "CAMPOFRÍO", "GALLO", "KAIKU", "PASCUAL", "HERO", "BLEDINA"]
+ITEMS = [("batido de cacao", "Litro"), ("leche semidesnatada", "Litro"), ("yogur natural", "Kilo"),
+         ("refresco de cola", "Litro"), ("cerveza lager", "Litro"), ("agua mineral", "Litro"),
+         ("jamón cocido", "Kilo"), ("espaguetis", "Kilo"), ("zumo de naranja", "Litro"),
+         ("papilla de frutas", "Kilo"), ("galletas maría", "Kilo"), ("tomate frito", "Kilo")]
+PACKS = ["pack 6 briks 200 ml", "botella 1 l", "pack 4 x 125 g", "lata 33 cl", "paquete 500 g", "tarro 200 g"]
+STORES = ["alcampo", "elcorteingles", "carrefour"]
+
+
+def generate_upload(size: int, path: Path, seed: int = 0) -> None:
+    """Write a synthetic upload shaped like the real supermarket exports."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"metadata": {"source": "benchmark", "generated_at": "%s"}, "products": {' % datetime.now().isoformat())
+        for i in range(size):
+            item, unit = rng.choice(ITEMS)
+            brand = rng.choice(BRANDS)
+            roll = rng.random()
+            if roll < 0.05:
+                # Names the first-word heuristic rejects, so brand extraction goes to the LLM
+                name = f"LA {item} {brand} {rng.choice(PACKS)}"
+            elif roll < 0.15:
+                name = f"PRODUCTO ECONÓMICO ALCAMPO {item} {rng.choice(PACKS)}"
+            else:
+                name = f"{brand} {item} {rng.choice(PACKS)}"
+            price = round(rng.uniform(0.4, 15), 2)
+            store = rng.choice(STORES)
+            product_id = f"{store}_{i:07d}"
+            url = f"https://www.{store}.es/supermercado/{product_id}-{item.replace(' ', '-')}/"
+            product = {
+                "name": name,
+                "brand": brand.title(),
+                "description": "N/A",
+                "price": {"current": price},
+                "store": store,
+                "metadata": {
+                    "original_data": {
+                        "original_data": {
+                            "name": name,
+                            "price": f"{price:.2f} €".replace(".", ","),
+                            "price_per_unit": f"({price * 2.5:.2f} € / {unit})".replace(".", ","),
+                            "url": url,
+                            "image_url": f"https://img.{store}.es/{product_id}.jpg"
+                        }
+                    }
+                }
+            }
+            if i:
+                f.write(", ")
+            f.write(f"{json.dumps(product_id)}: {json.dumps(product, ensure_ascii=False)}")
+        f.write("}}")
+
+
+def generate_catalogue(size: int, path: Path, seed: int = 0) -> None:
+    """Write a products.json shaped like the stored catalogue."""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n  "products": [')
+        for i in range(size):
+            item, unit = rng.choice(ITEMS)
+            brand = rng.choice(BRANDS)
+            store = rng.choice(STORES)
+            price = round(rng.uniform(0.4, 15), 2)
+            product_id = f"{store}_{i:07d}"
+            product = {
+                "nombre": f"{brand} {item} {rng.choice(PACKS)}",
+                "marca": brand,
+                "precio": price,
+                "descripcion": "N/A",
+                "unidad": f"({price * 2.5:.2f} € / {unit})".replace(".", ","),
+                "tienda": store,
+                "url": f"https://www.{store}.es/supermercado/{product_id}-{item.replace(' ', '-')}/",
+                "imagen": f"https://img.{store}.es/{product_id}.jpg",
+                "categoria": ["Alimentación", item.split()[0].capitalize()],
+                "categoria_origen": "llm"
+            }
+            f.write(("," if i else "") + "\n    " + json.dumps(product, ensure_ascii=False))
+        f.write("\n  ]\n}")
+
+
+class SimulatedOllama:
+    """Local stand-in for the Ollama client with tunable latency and answer quality.
+
+    Each prompt's latency and outcome are drawn from an RNG seeded by the
+    prompt text, so runs are repeatable whatever the request order.
+    `max_concurrency` caps parallel requests like a real server with a fixed
+    number of slots; extra callers block. `item_latency_ms` is added per
+    product in the prompt, for the answer tokens each one costs.
+    """
+
+    def __init__(self, latency_ms: float = 5.0, distribution: str = "lognormal", jitter: float = 0.5,
+                 fenced_ratio: float = 0.2, invalid_ratio: float = 0.02, max_concurrency: int = 4, seed: int = 0,
+                 item_latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.item_latency_ms = item_latency_ms
+        self.distribution = distribution
+        self.jitter = jitter
+        self.fenced_ratio = fenced_ratio
+        self.invalid_ratio = invalid_ratio
+        self.seed = seed
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def _latency(self, rng: random.Random) -> float:
+        if self.distribution == "constant":
+            return self.latency_ms / 1000
+        if self.distribution == "uniform":
+            return rng.uniform(self.latency_ms * (1 - self.jitter), self.latency_ms * (1 + self.jitter)) / 1000
+        return rng.lognormvariate(0, self.jitter) * self.latency_ms / 1000
+
+    @staticmethod
+    def _field(prompt: str, label: str) -> str:
+        match = re.search(rf"^{label}: (.*)$", prompt, re.M)
+        return match.group(1).strip() if match else ""
+
+    def _category_response(self, prompt: str, rng: random.Random) -> str:
+        words = self._field(prompt, "Producto").split()
+        response = {
+            "category_path": ["Alimentación", words[-3].capitalize() if len(words) > 3 else "Varios", "General"]
+        }
+        if '"marca"' in prompt:
+            response["marca"] = rng.choice(BRANDS)
+        return json.dumps(response, ensure_ascii=False)
+
+    def _batch_response(self, items: list, rng: random.Random) -> str:
+        answers = []
+        for number, name, brand in items:
+            words = name.split()
+            answer = {
+                "id": int(number),
+                "category_path": ["Alimentación", words[-3].capitalize() if len(words) > 3 else "Varios", "General"]
+            }
+            if brand == "?":
+                answer["marca"] = rng.choice(BRANDS)
+            answers.append(answer)
+        return json.dumps(answers, ensure_ascii=False)
+
+    def invoke(self, prompt: str) -> str:
+        rng = self._rng(prompt)
+        items = re.findall(r"^(\d+)\. Producto: (.*?) \| Marca: (\S*)", prompt, re.M)
+        with self.slots:
+            with self._lock:
+                self.calls += 1
+            time.sleep(self._latency(rng) + self.item_latency_ms * max(1, len(items)) / 1000)
+
+        if items:
+            response = self._batch_response(items, rng)
+        else:
+            response = self._category_response(prompt, rng)
+
+        roll = rng.random()
+        if roll < self.invalid_ratio:
+            # Truncated output, like a generation cut by a stop sequence
+            return response[:len(response) // 2]
+        if roll < self.invalid_ratio + self.fenced_ratio:
+            return f"```json\n{response}\n```"
+        return response
+
+
+def _write_bytes() -> int:
+    """Bytes this process has passed to write() so far (Linux only)."""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return -1
+
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_once(size: int, args) -> dict:
+    """Benchmark process_file on one synthetic upload inside a scratch working directory."""
+    from fileprocessing import FileProcessor
+
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_{size}_"))
+    upload = workdir / f"ver_todo_benchmark_{size}.json"
+    generate_upload(size, upload, seed=args.seed)
+
+    os.chdir(workdir)
+    logging.basicConfig(level=logging.WARNING)
+    processor = FileProcessor(
+        concurrency=args.concurrency,
+        use_cache=args.cache,
+        use_classifier=args.classifier,
+        stream_input=not args.no_stream,
+        storage=args.storage,
+        batch_prompts=args.batch_prompts
+    )
+    processor.llm = SimulatedOllama(
+        latency_ms=args.latency_ms,
+        distribution=args.distribution,
+        jitter=args.jitter,
+        fenced_ratio=args.fenced_ratio,
+        invalid_ratio=args.invalid_ratio,
+        max_concurrency=args.server_slots,
+        seed=args.seed,
+        item_latency_ms=args.item_latency_ms
+    )
+
+    # Time the per-product LLM stage, which covers brand extraction and categorization;
+    # a batched product waits for its whole batch
+    latencies = []
+    categorize = processor._categorize_product
+    categorize_chunk = processor._categorize_chunk
+
+    def timed_categorize(item):
+        started = time.perf_counter()
+        try:
+            return categorize(item)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    def timed_categorize_chunk(items):
+        started = time.perf_counter()
+        try:
+            return categorize_chunk(items)
+        finally:
+            latencies.extend([time.perf_counter() - started] * len(items))
+
+    processor._categorize_product = timed_categorize
+    processor._categorize_chunk = timed_categorize_chunk
+
+    bytes_before = _write_bytes()
+    started = time.perf_counter()
+    try:
+        summary = processor.process_file(str(upload))
+    finally:
+        elapsed = time.perf_counter() - started
+        bytes_written = _write_bytes() - bytes_before if bytes_before >= 0 else None
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "products": size,
+        "seconds": round(elapsed, 3),
+        "products_per_sec": round(size / elapsed, 1) if elapsed else None,
+        "latency_p50_ms": round(_percentile(latencies, 0.5) * 1000, 2),
+        "latency_p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "bytes_written": bytes_written,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "llm_calls": processor.llm.calls,
+        "stages": processor.metrics.summary()["stages"],
+        "summary": summary
+    }
+
+
+def _rss_mb() -> float:
+    """Current resident set size; the peak where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure_memory(size: int, representation: str, args) -> dict:
+    """Load a generated catalogue of size products as dicts or as a ProductTable and measure it."""
+    import gc
+    from stores import JSONStore
+
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench_memory_{size}_"))
+    catalogue = workdir / "products.json"
+    generate_catalogue(size, catalogue, seed=args.seed)
+    store = JSONStore(workdir / "arvore_categorias.json", catalogue, workdir / "marcas.json",
+                      compact_products=representation == "compact")
+    try:
+        gc.collect()
+        before = _rss_mb()
+        started = time.perf_counter()
+        products = store.load_products()
+        load_seconds = time.perf_counter() - started
+        gc.collect()
+        resident = _rss_mb() - before
+
+        # One pass reading the fields the dedup index and classifier read
+        started = time.perf_counter()
+        for product in products["products"]:
+            product["nombre"], product["marca"], product["tienda"], product.get("url")
+        scan_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        store.save({"categorias": []}, products)
+        save_seconds = time.perf_counter() - started
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "products": size,
+        "representation": representation,
+        "rss_mb": round(resident, 1),
+        "bytes_per_product": round(resident * 2**20 / size),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "load_seconds": round(load_seconds, 2),
+        "scan_seconds": round(scan_seconds, 2),
+        "save_seconds": round(save_seconds, 2)
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FileProcessor against a simulated Ollama backend.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Synthetic upload sizes to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM requests in flight")
+    parser.add_argument("--server-slots", type=int, default=4, help="Parallel requests the simulated server accepts")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Median simulated LLM latency")
+    parser.add_argument("--item-latency-ms", type=float, default=0.0,
+                        help="Extra simulated latency per product in a prompt")
+    parser.add_argument("--distribution", choices=["constant", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Spread of the latency distribution")
+    parser.add_argument("--fenced-ratio", type=float, default=0.2, help="Share of responses wrapped in ``` fences")
+    parser.add_argument("--invalid-ratio", type=float, default=0.02, help="Share of truncated, unparseable responses")
+    parser.add_argument("--cache", action="store_true", help="Enable the LLM response cache")
+    parser.add_argument("--classifier", action="store_true", help="Enable the local category classifier")
+    parser.add_argument("--no-stream", action="store_true", help="Load uploads whole instead of streaming")
+    parser.add_argument("--batch-prompts", type=int, default=1, help="Products per categorization prompt")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json", help="Catalogue backend")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results-<timestamp>.json)")
+    parser.add_argument("--memory", action="store_true",
+                        help="Compare catalogue memory as dicts and as a ProductTable instead of timing ingestion")
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--memory-one", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--representation", choices=["dicts", "compact"], help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_once(args.run_one, args)))
+        return
+    if args.memory_one:
+        print(json.dumps(measure_memory(args.memory_one, args.representation, args)))
+        return
+
+    # Each size runs in its own interpreter so peak RSS and write counters are not shared
+    child_args = list(argv if argv is not None else sys.argv[1:])
+    runs = [(["--run-one", str(size)], size) for size in args.sizes]
+    if args.memory:
+        runs = [
+            (["--memory-one", str(size), "--representation", representation], size)
+            for size in args.sizes for representation in ("dicts", "compact")
+        ]
+    results = []
+    for run_args, size in runs:
+        command = [sys.executable, str(Path(__file__).resolve())] + run_args + child_args
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            sys.exit(completed.returncode)
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        if args.memory:
+            print(f"{size:>8} products  {result['representation']:>8}  {result['rss_mb']:>8} MB  "
+                  f"{result['bytes_per_product']:>5} bytes/product  load {result['load_seconds']} s  "
+                  f"scan {result['scan_seconds']} s  save {result['save_seconds']} s")
+        else:
+            print(f"{size:>8} products  {result['products_per_sec']:>9} products/s  "
+                  f"p50 {result['latency_p50_ms']} ms  p99 {result['latency_p99_ms']} ms  "
+                  f"{result['bytes_written']} bytes written  {result['peak_rss_mb']} MB peak RSS")
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": datetime.now().isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("run_one", "memory_one", "representation", "output")},
+        "results": results
+    }
+    output = Path(args.output) if args.output else SCRIPTS_DIR.parent / "benchmarks" / f"results-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import json
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Common brand name corrections, applied to the whole name or its leading words
+DEFAULT_CORRECTIONS = {
+    "NESTLE": "NESTLÉ",
+    "NESLTÉ": "NESTLÉ",
+    "ALCAMPO BABY": "ALCAMPO",
+    "ALCAMPO BABY ECOLÓGICO": "ALCAMPO",
+    "PRODUCTO ECONÓMICO ALCAMPO": "ALCAMPO",
+    "YOGOLINO DE NESTLÉ": "NESTLÉ",
+    "NATIVA DE NESTLÉ": "NESTLÉ",
+    "AUCHAN": "ALCAMPO"  # Auchan is Alcampo's parent company
+}
+
+
+class BrandNormalizer:
+    """Brand normalization compiled into a word-level prefix trie, with memoized results.
+
+    A correction applies when it equals the brand or is followed by a space
+    in it. When several corrections match, the earliest one in the table
+    wins, exactly like the original loop over the corrections dict.
+    """
+
+    _END = object()
+
+    def __init__(self, corrections: dict = None, max_memo: int = 100_000):
+        self.corrections = dict(DEFAULT_CORRECTIONS if corrections is None else corrections)
+        self.max_memo = max_memo
+        self._memo = {}
+        self._trie = {}
+        for rank, (wrong, correct) in enumerate(self.corrections.items()):
+            node = self._trie
+            for word in wrong.upper().split(" "):
+                node = node.setdefault(word, {})
+            # Keep the first entry if the table repeats a key after upper-casing
+            node.setdefault(self._END, (rank, correct))
+
+    @classmethod
+    def from_alias_file(cls, path: Path, **options) -> "BrandNormalizer":
+        """Default corrections extended (or overridden) by a user-editable alias file."""
+        corrections = dict(DEFAULT_CORRECTIONS)
+        path = Path(path)
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                aliases = json.load(f)
+            corrections.update({alias.upper(): brand.upper() for alias, brand in aliases.items()})
+            logger.info(f"Loaded {len(aliases)} brand aliases from {path.name}")
+        return cls(corrections, **options)
+
+    def version(self) -> str:
+        """Digest of the correction table; it changes whenever normalize() could."""
+        table = json.dumps(list(self.corrections.items()), ensure_ascii=False)
+        return hashlib.sha1(table.encode('utf-8')).hexdigest()
+
+    def _correct(self, brand: str):
+        node = self._trie
+        best = None
+        for word in brand.split(" "):
+            node = node.get(word)
+            if node is None:
+                break
+            match = node.get(self._END)
+            if match is not None and (best is None or match[0] < best[0]):
+                best = match
+        return best[1] if best else None
+
+    def normalize(self, brand: str) -> str:
+        cached = self._memo.get(brand)
+        if cached is not None:
+            return cached
+
+        normalized = brand.upper()
+        corrected = self._correct(normalized)
+        if corrected is not None:
+            normalized = corrected
+        elif "ALCAMPO" in normalized:
+            # Special case for Alcampo products
+            normalized = "ALCAMPO"
+
+        if len(self._memo) >= self.max_memo:
+            self._memo.clear()
+        self._memo[brand] = normalized
+        return normalized
+
+
+class BrandRegistry:
+    """Hashed view of marcas.json; new brands are appended in memory and saved at commit."""
+
+    def __init__(self, brands: dict):
+        self.brands = brands
+        self.names = {b["nombre"] for b in brands["marcas"]}
+        self.dirty = False
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def register(self, name: str) -> bool:
+        """Add a brand if it is new; return whether it was added."""
+        if not name or name in self.names:
+            return False
+        self.brands["marcas"].append({
+            "nombre": name,
+            "descripcion": f"Marca: {name}"
+        })
+        self.names.add(name)
+        self.dirty = True
+        return True
@@ -0,0 +1,326 @@
+import re
+import json
+import math
+import time
+import logging
+import statistics
+from array import array
+from datetime import datetime
+from pathlib import Path
+from journal import atomic_write_json
+from product_records import ProductTable
+
+logger = logging.getLogger(__name__)
+
+# "(2,08 € / Litro)", "(0,92 € / 100 ml.)", "(1.234,50 €/kg)"
+_UNIT_PRICE = re.compile(r"^\(?\s*([\d.,]+)\s*€\s*/\s*(\d+(?:[.,]\d+)?)?\s*([^\d)]+?)\.?\s*\)?$")
+
+# Canonical unit and the factor from the written unit to it
+UNIT_ALIASES = {
+    "litro": ("litro", 1.0), "litros": ("litro", 1.0), "l": ("litro", 1.0), "lt": ("litro", 1.0),
+    "ml": ("litro", 1000.0), "cl": ("litro", 100.0),
+    "kilo": ("kilo", 1.0), "kilos": ("kilo", 1.0), "kg": ("kilo", 1.0), "kilogramo": ("kilo", 1.0),
+    "g": ("kilo", 1000.0), "gr": ("kilo", 1000.0), "gramos": ("kilo", 1000.0),
+    "unidad": ("unidad", 1.0), "unidades": ("unidad", 1.0), "ud": ("unidad", 1.0), "uds": ("unidad", 1.0),
+    "u": ("unidad", 1.0), "docena": ("unidad", 1 / 12),
+}
+UNITS = ("litro", "kilo", "unidad")
+
+NO_CATEGORY = "(sin categoría)"
+NO_BRAND = "(sin marca)"
+
+# Product fields the summary groups by or parses, read as (codes, distinct values) columns
+_COLUMNS = ("unidad", "categoria", "marca", "tienda")
+
+
+def _numpy():
+    """NumPy if it is installed; imported on first use, so importing this module stays cheap."""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _number(text: str) -> float:
+    """Spanish-formatted number: '1.234,56' -> 1234.56, '2,08' -> 2.08, '3' -> 3.0."""
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    return float(text)
+
+
+def parse_unit_price(text: str):
+    """(price per canonical unit, unit) from a unit price string, or None if it cannot be read."""
+    match = _UNIT_PRICE.match((text or "").strip())
+    if not match:
+        return None
+    unit = UNIT_ALIASES.get(match.group(3).strip().lower().rstrip("."))
+    if unit is None:
+        return None
+    try:
+        price = _number(match.group(1))
+        quantity = _number(match.group(2)) if match.group(2) else 1.0
+    except ValueError:
+        return None
+    if quantity <= 0:
+        return None
+    canonical, factor = unit
+    return round(price / quantity * factor, 4), canonical
+
+
+def _stats(values) -> dict:
+    """min/median/max/count of a sorted sequence."""
+    return {
+        "count": len(values),
+        "min": round(float(values[0]), 4),
+        "median": round(float(statistics.median(values)), 4),
+        "max": round(float(values[-1]), 4)
+    }
+
+
+def _group_stats(codes, values, names: list, np=None) -> dict:
+    """Stats of values per group code; NaN values are left out. Vectorized when np is NumPy."""
+    if np is not None:
+        codes = np.asarray(codes, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        keep = ~np.isnan(values)
+        codes, values = codes[keep], values[keep]
+        if not len(codes):
+            return {}
+        # Sort by group, then value: each group is a contiguous sorted run
+        order = np.lexsort((values, codes))
+        codes, values = codes[order], values[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        ends = np.r_[starts[1:], len(codes)]
+        counts = ends - starts
+        lower = values[starts + (counts - 1) // 2]
+        upper = values[starts + counts // 2]
+        return {
+            names[code]: {
+                "count": int(count),
+                "min": round(float(low), 4),
+                "median": round(float(median), 4),
+                "max": round(float(high), 4)
+            }
+            for code, count, low, median, high in zip(
+                codes[starts], counts, values[starts], (lower + upper) / 2, values[ends - 1]
+            )
+        }
+
+    groups = {}
+    for code, value in zip(codes, values):
+        if not math.isnan(value):
+            groups.setdefault(code, []).append(value)
+    return {names[code]: _stats(sorted(group)) for code, group in groups.items()}
+
+
+def _row_columns(products) -> tuple:
+    """(prices, {field: (codes, distinct values)}) of a list of product dicts."""
+    plain_prices = array('d')
+    pools = {field: {} for field in _COLUMNS}
+    codes = {field: array('l') for field in _COLUMNS}
+    for product in products:
+        price = product.get("precio")
+        plain_prices.append(float(price) if isinstance(price, (int, float)) else math.nan)
+        for field in _COLUMNS:
+            value = product.get(field)
+            if isinstance(value, list):
+                value = tuple(value)
+            pool = pools[field]
+            code = pool.get(value)
+            if code is None:
+                code = pool[value] = len(pool)
+            codes[field].append(code)
+    return plain_prices, {field: (codes[field], list(pools[field])) for field in _COLUMNS}
+
+
+def _table_columns(table: ProductTable) -> tuple:
+    """_row_columns of a ProductTable, read from its column arrays instead of row by row."""
+    plain_prices = array('d', table.prices)
+    for row in table.rows_without("precio"):
+        plain_prices[row] = math.nan
+    columns = {field: (table.pooled[field], table.pools[field].values) for field in _COLUMNS}
+
+    # Values that did not fit a column get codes of their own, past the table's pool
+    for row, overrides in table.overrides.items():
+        if "precio" in overrides:
+            price = overrides["precio"]
+            plain_prices[row] = float(price) if isinstance(price, (int, float)) else math.nan
+        for field in _COLUMNS:
+            if field in overrides:
+                codes, values = columns[field]
+                if codes is table.pooled[field]:
+                    codes, values = array('l', codes), list(values)
+                    columns[field] = codes, values
+                value = overrides[field]
+                codes[row] = len(values)
+                values.append(tuple(value) if isinstance(value, list) else value)
+    return plain_prices, columns
+
+
+def _category_keys(path) -> list:
+    """Every level of a category path, or the no-category group."""
+    if isinstance(path, tuple) and path:
+        return [" > ".join(path[:depth]) for depth in range(1, len(path) + 1)]
+    return [NO_CATEGORY]
+
+
+def _group_rows(codes, values: list, keys_of, np=None) -> tuple:
+    """(rows, group codes, group names) putting each row in the groups keys_of(its value) names.
+
+    Groups are numbered in order of first appearance; keys_of runs once
+    per distinct value, not per row.
+    """
+    names = {}
+    value_groups = {}
+    for code in dict.fromkeys(codes):
+        groups = value_groups[code] = []
+        for key in keys_of(values[code]):
+            group = names.get(key)
+            if group is None:
+                group = names[key] = len(names)
+            groups.append(group)
+
+    if np is None:
+        rows = array('l')
+        group_codes = array('l')
+        for row, code in enumerate(codes):
+            for group in value_groups[code]:
+                rows.append(row)
+                group_codes.append(group)
+        return rows, group_codes, list(names)
+
+    # Per value code, its groups as a slice of one flat array; then expand every row by its value's slice
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for code, groups in value_groups.items():
+        lengths[code] = len(groups)
+    offsets = np.cumsum(lengths) - lengths
+    flat = np.zeros(int(lengths.sum()), dtype=np.int64)
+    for code, groups in value_groups.items():
+        flat[offsets[code]:offsets[code] + len(groups)] = groups
+    codes = np.asarray(codes, dtype=np.int64)
+    row_lengths = lengths[codes]
+    rows = np.repeat(np.arange(len(codes)), row_lengths)
+    row_starts = np.cumsum(row_lengths) - row_lengths
+    within = np.arange(len(rows)) - np.repeat(row_starts, row_lengths)
+    return rows, flat[np.repeat(offsets[codes], row_lengths) + within], list(names)
+
+
+class CatalogueSummary:
+    """Unit prices and per-category, per-brand and per-store price statistics for the overview page.
+
+    Unit price strings are parsed once per distinct string, and once per
+    product: the parsed price per unit and unit of every product already
+    summarized are kept in `state_path` (two binary arrays in product
+    order), so a run only parses the products added since the last one. If
+    the product list shrank or its last summarized product changed (e.g.
+    after --dedupe-products) everything is parsed again.
+
+    Statistics (count, min, median, max) are computed for the product
+    price and for the price per unit, separately for litro, kilo and
+    unidad, with NumPy when it is installed. Categories count for every
+    level of their path. Products are read as columns: straight from the
+    arrays of a ProductTable, or collected in one pass over plain dicts.
+    """
+
+    def __init__(self, path: Path, state_path: Path):
+        self.path = Path(path)
+        self.state_path = Path(state_path)
+
+    @staticmethod
+    def _row_key(product) -> str:
+        return f"{product.get('tienda', '')}\x1f{product.get('url', '')}\x1f{product.get('nombre', '')}"
+
+    def _load_state(self, products):
+        """(unit prices, unit codes) of the products summarized before, if still valid."""
+        prices = array('d')
+        units = array('b')
+        if not self.path.exists() or not self.state_path.exists():
+            return prices, units
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f).get("state", {})
+            rows = state.get("rows", 0)
+            if not 0 < rows <= len(products) or self._row_key(products[rows - 1]) != state.get("last_key"):
+                return prices, units
+            with open(self.state_path, 'rb') as f:
+                prices.fromfile(f, rows)
+                units.fromfile(f, rows)
+        except (OSError, ValueError, EOFError) as e:
+            logger.info(f"Rebuilding unit prices: {str(e)}")
+            return array('d'), array('b')
+        return prices, units
+
+    def update(self, products, rebuild: bool = False) -> dict:
+        """Parse the new products' unit prices, recompute the statistics and write the summary file."""
+        started = time.perf_counter()
+        prices, units = (array('d'), array('b')) if rebuild else self._load_state(products)
+        known = len(prices)
+
+        np = _numpy()
+        if isinstance(products, ProductTable):
+            plain_prices, columns = _table_columns(products)
+        else:
+            plain_prices, columns = _row_columns(products)
+        total = len(plain_prices)
+
+        # Unit prices of the new products, parsed once per distinct string
+        unit_codes, unit_texts = columns["unidad"]
+        parsed = {}
+        for code in unit_codes[known:]:
+            if code not in parsed:
+                parsed[code] = parse_unit_price(unit_texts[code] or "")
+            result = parsed[code]
+            prices.append(result[0] if result else math.nan)
+            units.append(UNITS.index(result[1]) if result else -1)
+
+        summary = {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "products": total,
+            "unit_prices": {unit: units.count(code) for code, unit in enumerate(UNITS)},
+            "unparsed_unit_prices": units.count(-1)
+        }
+        groupings = {
+            "by_category": ("categoria", _category_keys),
+            "by_brand": ("marca", lambda brand: [brand or NO_BRAND]),
+            "by_store": ("tienda", lambda store: [store or ""])
+        }
+        if np is not None:
+            plain_prices = np.asarray(plain_prices, dtype=np.float64)
+            unit_prices = np.asarray(prices, dtype=np.float64)
+            unit_codes = np.asarray(units, dtype=np.int8)
+        for name, (field, keys_of) in groupings.items():
+            group_rows, group_codes, labels = _group_rows(*columns[field], keys_of, np)
+            section = {label: {"products": 0} for label in labels}
+            if np is not None:
+                for label, count in zip(labels, np.bincount(group_codes, minlength=len(labels))):
+                    section[label]["products"] = int(count)
+                group_prices = plain_prices[group_rows]
+                group_unit_prices = unit_prices[group_rows]
+                group_units = unit_codes[group_rows]
+            else:
+                for code in group_codes:
+                    section[labels[code]]["products"] += 1
+                group_prices = [plain_prices[row] for row in group_rows]
+            for label, stats in _group_stats(group_codes, group_prices, labels, np).items():
+                section[label]["precio"] = stats
+            for unit_code, unit in enumerate(UNITS):
+                if np is not None:
+                    unit_values = np.where(group_units == unit_code, group_unit_prices, np.nan)
+                else:
+                    unit_values = [prices[row] if units[row] == unit_code else math.nan for row in group_rows]
+                for label, stats in _group_stats(group_codes, unit_values, labels, np).items():
+                    section[label].setdefault("precio_por_unidad", {})[unit] = stats
+            summary[name] = section
+
+        summary["state"] = {
+            "rows": total,
+            "last_key": self._row_key(products[total - 1]) if total else None
+        }
+        with open(self.state_path, 'wb') as f:
+            prices.tofile(f)
+            units.tofile(f)
+        atomic_write_json(self.path, summary)
+        logger.info(f"Catalogue summary updated: {total - known} new unit prices parsed, "
+                    f"{total} products in {time.perf_counter() - started:.2f}s")
+        return summary
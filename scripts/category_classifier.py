@@ -0,0 +1,193 @@
+import re
+import json
+import math
+import zlib
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from journal import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "con", "sin", "en", "y", "para", "al",
+    "pack", "ud", "uds", "unidad", "unidades", "ml", "cl", "gr", "kg", "lt", "brik", "briks",
+    "botella", "lata", "latas", "envase", "bolsa", "caja", "tarro", "paquete"
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip accents so 'Ecológico' and 'ecologico' match."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def product_features(name: str, brand: str) -> list:
+    """Name tokens, name bigrams and the brand as classifier features."""
+    tokens = [
+        t for t in _TOKEN.findall(normalize_text(name))
+        if len(t) > 1 and not t.isdigit() and t not in STOPWORDS
+    ]
+    features = list(tokens)
+    features.extend(f"{a}_{b}" for a, b in zip(tokens, tokens[1:]))
+    if brand:
+        features.append(f"marca={normalize_text(brand).strip()}")
+    return features
+
+
+class CategoryClassifier:
+    """Multinomial naive Bayes over product names predicting the category path.
+
+    Trained on products categorized by the LLM and updated as new ones are
+    accepted, so products shaped like known ones can skip the LLM call.
+    """
+
+    def __init__(self, threshold: float = 0.9, min_support: int = 5):
+        self.threshold = threshold
+        self.min_support = min_support
+        self.doc_counts = {}
+        self.feature_counts = {}
+        self.feature_totals = {}
+        self.vocabulary = set()
+        self.documents = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def label(category_path: list) -> str:
+        return " > ".join(category_path)
+
+    def learn(self, name: str, brand: str, category_path: list) -> None:
+        label = self.label(category_path)
+        features = product_features(name, brand)
+        with self._lock:
+            self.documents += 1
+            self.doc_counts[label] = self.doc_counts.get(label, 0) + 1
+            counts = self.feature_counts.setdefault(label, {})
+            for feature in features:
+                counts[feature] = counts.get(feature, 0) + 1
+                self.vocabulary.add(feature)
+            self.feature_totals[label] = self.feature_totals.get(label, 0) + len(features)
+
+    def predict(self, name: str, brand: str):
+        """Return (category_path, confidence), or (None, 0.0) without a usable model."""
+        features = product_features(name, brand)
+        with self._lock:
+            if not self.documents or not features:
+                return None, 0.0
+            vocabulary_size = len(self.vocabulary) + 1
+            scores = {}
+            for label, doc_count in self.doc_counts.items():
+                counts = self.feature_counts[label]
+                denominator = self.feature_totals[label] + vocabulary_size
+                score = math.log(doc_count / self.documents)
+                for feature in features:
+                    score += math.log((counts.get(feature, 0) + 1) / denominator)
+                scores[label] = score
+
+        best_label = max(scores, key=scores.get)
+        best_score = scores[best_label]
+        total = sum(math.exp(score - best_score) for score in scores.values())
+        return best_label.split(" > "), 1.0 / total
+
+    def confident(self, name: str, brand: str):
+        """Return the predicted category path when it clears the threshold, else None."""
+        category_path, confidence = self.predict(name, brand)
+        if category_path is None or confidence < self.threshold:
+            return None
+        if self.doc_counts.get(self.label(category_path), 0) < self.min_support:
+            return None
+        return category_path
+
+    def snapshot(self) -> "CategoryClassifier":
+        """Independent copy of the current model; later learn() calls do not reach it."""
+        with self._lock:
+            copy = CategoryClassifier(threshold=self.threshold, min_support=self.min_support)
+            copy.documents = self.documents
+            copy.doc_counts = dict(self.doc_counts)
+            copy.feature_counts = {label: dict(counts) for label, counts in self.feature_counts.items()}
+            copy.feature_totals = dict(self.feature_totals)
+            copy.vocabulary = set(self.vocabulary)
+        return copy
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "version": 1,
+                "documents": self.documents,
+                "doc_counts": self.doc_counts,
+                "feature_counts": self.feature_counts,
+                "feature_totals": self.feature_totals
+            }
+
+    @classmethod
+    def from_dict(cls, data: dict, **options) -> "CategoryClassifier":
+        classifier = cls(**options)
+        classifier.documents = data["documents"]
+        classifier.doc_counts = data["doc_counts"]
+        classifier.feature_counts = data["feature_counts"]
+        classifier.feature_totals = data["feature_totals"]
+        for counts in classifier.feature_counts.values():
+            classifier.vocabulary.update(counts)
+        return classifier
+
+    @classmethod
+    def load(cls, path: Path, products: list, **options) -> "CategoryClassifier":
+        """Load the stored model, or train one from LLM-labelled products."""
+        path = Path(path)
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f), **options)
+
+        classifier = cls(**options)
+        for product in labelled_products(products):
+            classifier.learn(product["nombre"], product["marca"], product["categoria"])
+        logger.info(f"Trained category classifier on {classifier.documents} products")
+        return classifier
+
+    def save(self, path: Path) -> None:
+        atomic_write_json(path, self.to_dict())
+
+
+def labelled_products(products: list):
+    """Products whose category came from the LLM."""
+    for product in products:
+        if product.get("categoria") and product.get("categoria_origen", "llm") == "llm":
+            yield product
+
+
+def evaluate(products: list, threshold: float = 0.9, min_support: int = 5, holdout: int = 5) -> dict:
+    """Measure agreement between the classifier and stored LLM labels.
+
+    One product in `holdout` (chosen by a hash of its name, so runs are
+    repeatable) is held out; the classifier is trained on the rest.
+    """
+    classifier = CategoryClassifier(threshold=threshold, min_support=min_support)
+    test_set = []
+    for product in labelled_products(products):
+        if zlib.crc32(product["nombre"].encode('utf-8')) % holdout == 0:
+            test_set.append(product)
+        else:
+            classifier.learn(product["nombre"], product["marca"], product["categoria"])
+
+    top1 = 0
+    confident = 0
+    confident_correct = 0
+    for product in test_set:
+        predicted, _ = classifier.predict(product["nombre"], product["marca"])
+        top1 += predicted == product["categoria"]
+        fast_path = classifier.confident(product["nombre"], product["marca"])
+        if fast_path is not None:
+            confident += 1
+            confident_correct += fast_path == product["categoria"]
+
+    return {
+        "trained_on": classifier.documents,
+        "evaluated": len(test_set),
+        "threshold": threshold,
+        "top1_agreement": round(top1 / len(test_set), 4) if test_set else None,
+        "llm_calls_avoided": round(confident / len(test_set), 4) if test_set else None,
+        "fast_path_agreement": round(confident_correct / confident, 4) if confident else None
+    }
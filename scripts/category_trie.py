@@ -0,0 +1,145 @@
+import re
+import uuid
+import logging
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace so a category path always maps to the same id
+CATEGORY_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "super-admin/arvore_categorias")
+
+
+def category_key(name: str) -> str:
+    """Case-folded, accent-free, whitespace-collapsed form of a category name."""
+    text = unicodedata.normalize('NFKD', name.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def category_id(keys: list) -> str:
+    """Stable id for a category, derived from its normalized path."""
+    return str(uuid.uuid5(CATEGORY_NAMESPACE, "/".join(keys)))
+
+
+class _Node:
+    __slots__ = ("record", "children")
+
+    def __init__(self, record: dict):
+        self.record = record
+        self.children = {}
+
+
+class CategoryTrie:
+    """Index over the arvore_categorias.json tree with O(depth) lookup and insert.
+
+    Wraps the tree's own dicts, so inserts show up in the serialized tree
+    directly. Also keeps a flat parent-pointer view shaped like
+    app/database/categories.json (`id`, `name`, `parentId`), appended to as
+    categories are created; `dirty` tells whether it changed (or the tree
+    was repaired on load) since it was last saved.
+    """
+
+    def __init__(self, tree: list):
+        self.tree = tree
+        self.root = _Node({"subcategorias": tree})
+        self.flat = []
+        self.dirty = False
+        self._build()
+
+    def _build(self) -> None:
+        seen_ids = set()
+        stack = [(self.root, [], None)]
+        while stack:
+            node, keys, parent_id = stack.pop()
+            for record in list(node.record["subcategorias"]):
+                child_keys = keys + [category_key(record["nombre"])]
+                existing = node.children.get(child_keys[-1])
+                if existing is not None:
+                    # Siblings differing only in case or accents are folded into the first one
+                    existing.record["subcategorias"].extend(record.get("subcategorias", []))
+                    node.record["subcategorias"].remove(record)
+                    self.dirty = True
+                    logger.info(f"Merged duplicate category {record['nombre']} into {existing.record['nombre']}")
+                    continue
+
+                # Ids from the old len()+1 scheme collide; give duplicates a stable id instead
+                if not record.get("id") or record["id"] in seen_ids:
+                    record["id"] = category_id(child_keys)
+                    self.dirty = True
+                seen_ids.add(record["id"])
+                record.setdefault("subcategorias", [])
+
+                child = _Node(record)
+                node.children[child_keys[-1]] = child
+                self.flat.append(self._flat_entry(record, parent_id))
+                stack.append((child, child_keys, record["id"]))
+
+    @staticmethod
+    def _flat_entry(record: dict, parent_id) -> dict:
+        return {
+            "id": record["id"],
+            "name": record["nombre"],
+            "parentId": parent_id,
+            "metadata": {}
+        }
+
+    def find(self, category_path: list):
+        """Return the tree record for category_path, or None."""
+        node = self.root
+        for level in category_path:
+            node = node.children.get(category_key(level))
+            if node is None:
+                return None
+        return node.record
+
+    def find_or_create(self, category_path: list) -> list:
+        """Make sure every level of category_path exists; return the records created."""
+        node = self.root
+        keys = []
+        parent_id = None
+        created = []
+        for level in category_path:
+            keys.append(category_key(level))
+            child = node.children.get(keys[-1])
+            if child is None:
+                record = {
+                    "id": category_id(keys),
+                    "nombre": level,
+                    "descripcion": f"Categoría de {level}",
+                    "subcategorias": []
+                }
+                node.record["subcategorias"].append(record)
+                child = _Node(record)
+                node.children[keys[-1]] = child
+                self.flat.append(self._flat_entry(record, parent_id))
+                self.dirty = True
+                created.append(record)
+            node = child
+            parent_id = node.record["id"]
+        return created
+
+    def __len__(self):
+        return len(self.flat)
+
+
+def merge_flat(categories: list, flat: list) -> int:
+    """Add the categories of a CategoryTrie's flat view missing from a categories.json list.
+
+    Entries are matched by parent and category_key(name), so categories
+    already in the list (with their own ids, names and metadata) are kept
+    as they are and only new levels are appended, under the matching
+    parent's id. Returns the number of entries added.
+    """
+    known = {(entry.get("parentId"), category_key(entry["name"])): entry["id"] for entry in categories}
+    ids = {}
+    added = 0
+    # The flat view lists every parent before its children
+    for entry in flat:
+        parent_id = ids.get(entry["parentId"])
+        key = (parent_id, category_key(entry["name"]))
+        if key not in known:
+            categories.append(dict(entry, parentId=parent_id))
+            known[key] = entry["id"]
+            added += 1
+        ids[entry["id"]] = known[key]
+    return added
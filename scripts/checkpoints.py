@@ -0,0 +1,79 @@
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from journal import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CheckpointStore:
+    """Progress checkpoints for process_file runs, keyed by upload id and input hash.
+
+    A checkpoint records the last product whose results are durable (in the
+    journal or the canonical files) plus the running counters, so an
+    interrupted run can skip straight past the finished products.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def path(self, upload_id: str, file_hash: str) -> Path:
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', upload_id)
+        return self.directory / f"{safe_id}-{file_hash[:16]}.json"
+
+    def load(self, upload_id: str, file_hash: str):
+        path = self.path(upload_id, file_hash)
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("file_hash") != file_hash:
+            return None
+        return checkpoint
+
+    def save(self, upload_id: str, file_hash: str, file_path: str, position: int,
+             last_product_id: str, counters: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(self.path(upload_id, file_hash), {
+            "upload_id": upload_id,
+            "file_hash": file_hash,
+            "file_path": str(file_path),
+            "position": position,
+            "last_product_id": last_product_id,
+            "counters": counters,
+            "updated_at": datetime.now().isoformat()
+        })
+
+    def clear(self, upload_id: str, file_hash: str) -> None:
+        path = self.path(upload_id, file_hash)
+        if path.exists():
+            path.unlink()
+
+    def exists_for(self, upload_id: str) -> bool:
+        """Whether any checkpoint exists for upload_id, whatever the input hash."""
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', upload_id)
+        return self.directory.exists() and any(self.directory.glob(f"{safe_id}-*.json"))
+
+
+def skip_committed(products_iter, checkpoint: dict):
+    """Drop the products a checkpoint already covers from the input stream."""
+    position = checkpoint["position"]
+    for index, (product_id, product) in enumerate(products_iter):
+        if index < position:
+            if index == position - 1 and product_id != checkpoint["last_product_id"]:
+                raise ValueError(
+                    f"Checkpoint expects product {checkpoint['last_product_id']} at position {position}, found {product_id}"
+                )
+            continue
+        yield product_id, product
@@ -0,0 +1,71 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Prefixes stripped before comparing Alcampo product names (see FileProcessor._similar_names)
+SIMILAR_NAME_PREFIXES = ["producto economico", "ecologico", "baby", "alcampo"]
+
+
+def core_name(name: str) -> str:
+    """Strip the Alcampo branding prefixes from an already normalized name."""
+    for prefix in SIMILAR_NAME_PREFIXES:
+        if name.startswith(prefix):
+            name = name[len(prefix):].strip()
+    return name
+
+
+def normalized_fields(product: dict, normalize_brand) -> tuple:
+    """(nombre, marca, tienda, url) in the form the duplicate rules compare."""
+    name = product["nombre"].lower().strip()
+    brand = normalize_brand(product["marca"]).lower()
+    store = product["tienda"].lower().strip()
+    url = (product.get("url") or "").lower().strip()
+    return name, brand, store, url
+
+
+class DedupIndex:
+    """Hash index over the product store giving O(1) duplicate checks.
+
+    Holds the same three rules as the original linear scan: identical
+    (nombre, marca, tienda), identical non-empty URL, and for Alcampo
+    products an identical core name in the same store.
+    """
+
+    def __init__(self, normalize_brand):
+        self.normalize_brand = normalize_brand
+        self.keys = set()
+        self.urls = set()
+        self.alcampo_names = set()
+
+    def _normalized(self, product: dict) -> tuple:
+        return normalized_fields(product, self.normalize_brand)
+
+    def build(self, products: list) -> None:
+        self.keys.clear()
+        self.urls.clear()
+        self.alcampo_names.clear()
+        for product in products:
+            self.add(product)
+
+    def add(self, product: dict) -> None:
+        """Register a product that has just been accepted into the store."""
+        name, brand, store, url = self._normalized(product)
+        self.keys.add((name, brand, store))
+        if url:
+            self.urls.add(url)
+        if brand == "alcampo":
+            self.alcampo_names.add((store, core_name(name)))
+
+    def match(self, product: dict):
+        """Return the rule that marks product as a duplicate, or None."""
+        name, brand, store, url = self._normalized(product)
+        if (name, brand, store) in self.keys:
+            return "key"
+        if url and url in self.urls:
+            return "url"
+        if brand == "alcampo" and (store, core_name(name)) in self.alcampo_names:
+            return "alcampo"
+        return None
+
+    def __len__(self):
+        return len(self.keys)
@@ -1,191 +1,569 @@
+import time
+_MODULE_START = time.perf_counter()
 import json
 import os
 from datetime import datetime
 import logging
 from pathlib import Path
-from langchain_community.llms import Ollama
-import time
 import sys
+import queue
+import atexit
+import argparse
+import subprocess
+from logging.handlers import QueueHandler, QueueListener
+from journal import ProductJournal, atomic_write_json
+from dedup_index import DedupIndex
+from llm_engine import LLMRequestEngine
+from llm_cache import LLMResponseCache
+from stream_reader import ProductStream
+from category_classifier import CategoryClassifier, evaluate as evaluate_classifier
+from queue_worker import QueueWorker
+from llm_clients import DEFAULT_OLLAMA_URL, create_client
+from checkpoints import CheckpointStore, file_sha256, skip_committed
+from category_trie import CategoryTrie, merge_flat
+from brands import BrandNormalizer, BrandRegistry
+from stores import JSONStore, SQLiteStore
+from batch_ingest import ShardedIngest
+from prompts import PromptBuilder, BatchStats, BATCH_ITEM_COMPLETION_TOKENS
+from metrics import PipelineMetrics
+from catalogue_summary import CatalogueSummary
+from source_manifest import SourceManifest, source_name, product_key, content_hash
+from near_duplicates import NearDuplicateIndex, ProductLinks, product_ref, dedupe_products, benchmark as benchmark_near_duplicates
+_MODULE_LOADED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler('processing.log'),
+# Writes queued log records to the real handlers; started by configure_logging
+_log_listener = None
+
+def configure_logging(level: int = logging.INFO):
+    """Log to processing.log and stdout; only done when run as a script.
+    
+    The pipeline only puts records on a queue; a background thread does the
+    file and stdout writes, so logging never waits on I/O.
+    """
+    global _log_listener
+    formatter = logging.Formatter('%(asctime)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    handlers = [
+        logging.FileHandler('processing.log', delay=True),
         logging.StreamHandler(sys.stdout)
     ]
-)
-logger = logging.getLogger(__name__)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, *handlers)
+    _log_listener.start()
+    atexit.register(flush_logging)
+    logging.basicConfig(level=level, handlers=[QueueHandler(log_queue)])
+
+def flush_logging():
+    """Write out every queued log record and stop the logging thread."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+def print_result(result: dict):
+    """Print a JSON result to stdout after the pending log lines, never interleaved with them."""
+    flush_logging()
+    print(json.dumps(result, indent=2))
 
 class FileProcessor:
-    def __init__(self):
+    def __init__(self, fsync_every: int = 50, fsync_interval: float = 1.0,
+                 journal_max_bytes: int = 8 * 1024 * 1024, concurrency: int = 1,
+                 request_timeout: int = 120, max_retries: int = 2, use_cache: bool = True,
+                 cache_max_bytes: int = 256 * 1024 * 1024, cache_validated_only: bool = True,
+                 stream_input: bool = True, use_classifier: bool = True,
+                 classifier_threshold: float = 0.9, llm_backend: str = "langchain",
+                 ollama_url: str = DEFAULT_OLLAMA_URL, checkpoint_every: int = 50,
+                 storage: str = "json", mirror_json: bool = False, prompt_token_budget: int = 384,
+                 batch_prompts: int = 1, batch_compare_every: int = 20,
+                 near_duplicates: bool = False, near_threshold: float = 0.8,
+                 metrics_format: str = "jsonl", metrics_interval: float = 10.0,
+                 metrics_max_bytes: int = 5 * 1024 * 1024,
+                 compact_products: bool = False, catalogue_summary: bool = True,
+                 delta: bool = False, stream_responses: bool = False, json_format: bool = False):
         self.base_dir = Path(os.getcwd())
         self.database_dir = self.base_dir / 'app' / 'database'
-        self.llm = None
+        self.request_timeout = request_timeout
+        self.llm_backend = llm_backend
+        self.ollama_url = ollama_url
+        self.llm_cache = None
+        self.cache_validated_only = cache_validated_only
+        self.stream_input = stream_input
+        self.use_classifier = use_classifier
+        self.classifier_threshold = classifier_threshold
+        self.checkpoint_every = checkpoint_every
+        self.batch_prompts = max(1, batch_prompts)
+        self.batch_stats = BatchStats(compare_every=batch_compare_every)
+        self.storage = storage
+        self.mirror_json = mirror_json
+        self.near_duplicates = near_duplicates
+        self.near_threshold = near_threshold
+        self.delta = delta
+        # Ollama's JSON mode only produces objects, so batched prompts (answered with a list) go without it
+        self.json_format = json_format and self.batch_prompts == 1
         
         # Initialize data files
         self.categories_file = self.database_dir / 'arvore_categorias.json'
+        self.ui_categories_file = self.database_dir / 'categories.json'
         self.products_file = self.database_dir / 'products.json'
         self.brands_file = self.database_dir / 'marcas.json'
+        self.brand_aliases_file = self.database_dir / 'marcas_alias.json'
+        self.journal_file = self.database_dir / 'ingest_journal.jsonl'
+        self.classifier_file = self.database_dir / 'category_model.json'
+        self.llm_cache_file = self.database_dir / 'llm_cache.sqlite'
+        self.checkpoints = CheckpointStore(self.database_dir / 'checkpoints')
+        self.catalogue_file = self.database_dir / 'catalogue.sqlite'
+        self.product_links_file = self.database_dir / 'product_links.json'
+        self.summary_file = self.database_dir / 'catalogue_summary.json'
+        self.manifests_dir = self.database_dir / 'manifests'
+        
+        # Price statistics for the overview page, refreshed after each ingest
+        self.catalogue_summary = None
+        if catalogue_summary:
+            self.catalogue_summary = CatalogueSummary(
+                self.summary_file, self.database_dir / 'catalogue_summary.state'
+            )
         
         # Create database directory if it doesn't exist
         os.makedirs(self.database_dir, exist_ok=True)
         
-        # Load or create data structures
-        self.categories = self._load_or_create_categories()
-        self.products = self._load_or_create_products()
-        self.brands = self._load_or_create_brands()
+        # Stage timings and counters, written to metrics.jsonl or metrics.prom every metrics_interval seconds
+        if metrics_format == "none":
+            self.metrics = PipelineMetrics()
+        else:
+            suffix = "prom" if metrics_format == "prometheus" else metrics_format
+            self.metrics = PipelineMetrics(
+                self.database_dir / f"metrics.{suffix}", fmt=metrics_format, interval=metrics_interval,
+                max_bytes=metrics_max_bytes
+            )
+        
+        # Products, categories and brands live in the JSON files or in SQLite
+        if storage == "sqlite":
+            self.store = SQLiteStore(self.catalogue_file, self._normalize_brand)
+        elif storage == "json":
+            self.store = JSONStore(
+                self.categories_file, self.products_file, self.brands_file, compact_products=compact_products
+            )
+        else:
+            raise ValueError(f"Unknown storage backend: {storage}")
         
-        # Initialize LLM
-        self._initialize_llm()
+        # Stores, indexes and the classifier are loaded on first access
+        self._stores_loaded = False
+        self._brand_normalizer = None
+        self._classifier = None
+        self._classifier_loaded = False
+        # Model the LLM stage predicts with during a run; see process_file
+        self._stage_classifier = None
+        self._near_index = None
+        self._product_links = None
+        
+        # Accepted products and new categories are journaled and compacted in batches
+        self.journal = ProductJournal(
+            self.journal_file,
+            fsync_every=fsync_every,
+            fsync_interval=fsync_interval,
+            max_bytes=journal_max_bytes
+        )
+        
+        # LLM parameters; the client itself is created on the first request.
+        # Prompts are kept under the token budget and answers are a short JSON
+        # object, so the context window only has to hold both. Batched prompts
+        # get room for batch_prompts short items and their answers.
+        self.llm_model = "llama3"
+        num_predict = 96
+        prompt_tokens = prompt_token_budget
+        if self.batch_prompts > 1:
+            num_predict = 32 + BATCH_ITEM_COMPLETION_TOKENS * self.batch_prompts
+            prompt_tokens += 40 * (self.batch_prompts - 1)
+        num_ctx = max(512, -(-(prompt_tokens + num_predict) // 256) * 256)
+        self.prompts = PromptBuilder(max_prompt_tokens=prompt_token_budget, context_tokens=num_ctx)
+        self.llm_params = {
+            "temperature": 0.1,
+            "num_ctx": num_ctx,
+            "num_predict": num_predict,
+            "top_k": 10,
+            "top_p": 0.1,
+            "repeat_penalty": 1.2,
+            "stop": ["\n\n", "```"]
+        }
+        self.engine = LLMRequestEngine(
+            self._initialize_llm,
+            max_in_flight=concurrency,
+            max_retries=max_retries,
+            stream=stream_responses
+        )
+        
+        # Identical prompts to the same model, parameters and response format get the same answer;
+        # answers that fail validation are asked again unless cache_validated_only is turned off
+        if use_cache:
+            self.llm_cache = LLMResponseCache(
+                self.llm_cache_file, self.llm_model, self.llm_params,
+                response_format={"json": self.json_format, "stream": stream_responses},
+                max_bytes=cache_max_bytes
+            )
 
     def _initialize_llm(self):
         """Initialize the LLM with consistent parameters."""
         try:
-            self.llm = Ollama(
-                model="llama3",
-                temperature=0.1,
-                num_ctx=4096,
-                top_k=10,
-                top_p=0.1,
-                repeat_penalty=1.2,
-                stop=["\n\n", "```"]
+            llm = create_client(
+                self.llm_backend,
+                self.llm_model,
+                self.llm_params,
+                timeout=self.request_timeout,
+                base_url=self.ollama_url,
+                json_format=self.json_format
             )
-            logger.info("Successfully initialized Ollama with llama3 model")
+            logger.info(f"Successfully initialized Ollama with {self.llm_model} model ({self.llm_backend} backend)")
+            return llm
         except Exception as e:
             error_msg = f"Failed to initialize LLM: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg)
 
-    def _load_or_create_categories(self) -> dict:
-        if self.categories_file.exists():
-            with open(self.categories_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"categorias": []}
-
-    def _load_or_create_products(self) -> dict:
-        if self.products_file.exists():
-            with open(self.products_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"products": []}
-
-    def _load_or_create_brands(self) -> dict:
-        """Load or create the brands file."""
-        if self.brands_file.exists():
-            with open(self.brands_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"marcas": []}
-
-    def _save_categories(self):
-        """Save categories to arvore_categorias.json with proper formatting."""
-        try:
-            with open(self.categories_file, 'w', encoding='utf-8') as f:
-                json.dump(self.categories, f, indent=2, ensure_ascii=False)
-            logger.info("Categories saved to arvore_categorias.json")
-        except Exception as e:
-            logger.error(f"Error saving categories: {str(e)}")
+    @property
+    def llm(self):
+        return self.engine.llm
 
-    def _save_products(self):
-        """Save products to products.json with proper formatting."""
-        try:
-            with open(self.products_file, 'w', encoding='utf-8') as f:
-                json.dump(self.products, f, indent=2, ensure_ascii=False)
-            logger.info("Products saved to products.json")
-        except Exception as e:
-            logger.error(f"Error saving products: {str(e)}")
+    @llm.setter
+    def llm(self, client):
+        self.engine.llm = client
 
-    def _save_brands(self):
-        """Save brands to marcas.json with proper formatting."""
+    def _ensure_stores(self):
+        """Load the stores and build everything derived from them, once."""
+        if self._stores_loaded:
+            return
+        self._stores_loaded = True
         try:
-            with open(self.brands_file, 'w', encoding='utf-8') as f:
-                json.dump(self.brands, f, indent=2, ensure_ascii=False)
-            logger.info("Brands saved to marcas.json")
-        except Exception as e:
-            logger.error(f"Error saving brands: {str(e)}")
-
-    def _find_or_create_category(self, category_path: list) -> None:
-        current = self.categories["categorias"]
-        current_path = []
-        
-        for level in category_path:
-            current_path.append(level)
+            # A new SQLite catalogue starts from the existing JSON files
+            if self.storage == "sqlite" and self.store.is_empty() and self.products_file.exists():
+                self.store.import_json(self.categories_file, self.products_file, self.brands_file)
+            if self.storage == "sqlite":
+                # Dedup keys depend on the brand aliases, which may have been edited since
+                self.store.sync_brand_rules(self.brand_normalizer.version())
             
-            # Find existing category at this level
-            existing = next(
-                (cat for cat in current if cat["nombre"].lower() == level.lower()),
-                None
-            )
+            # Load or create data structures
+            self._categories = self.store.load_categories()
+            self._products = self.store.load_products()
+            self._brands = self.store.load_brands()
+            self._brand_registry = BrandRegistry(self._brands)
+            self._loaded_signature = self.store.signature()
             
-            if not existing:
-                # Create new category
-                new_id = str(len(current) + 1)
-                if len(current_path) > 1:
-                    parent_nums = [str(i+1) for i in range(len(current_path))]
-                    new_id = ".".join(parent_nums)
-                
-                existing = {
-                    "id": new_id,
-                    "nombre": level,
-                    "descripcion": f"Categoría de {level}",
-                    "subcategorias": []
-                }
-                current.append(existing)
-                logger.info(f"Created new category: {' > '.join(current_path)}")
+            # Trie over the category tree; its flat view is published to the web UI's categories.json
+            self._category_trie = CategoryTrie(self._categories["categorias"])
+            
+            # Duplicate index, kept in step with self.products
+            self._dedup_index = self.store.dedup_index(self._normalize_brand, self._products["products"])
+            
+            # Fuzzy name index within each brand: near duplicates in a store are skipped, across stores they are linked
+            if self.near_duplicates:
+                self._product_links = ProductLinks(self.product_links_file)
+                self._build_near_index()
             
-            current = existing["subcategorias"]
+            # Local classifier that lets known product shapes skip the LLM
+            if self.use_classifier and not self._classifier_loaded:
+                self._classifier = CategoryClassifier.load(
+                    self.classifier_file, self._products["products"], threshold=self.classifier_threshold
+                )
+            self._classifier_loaded = True
+            
+            self._recover_journal()
+        except Exception:
+            self._stores_loaded = False
+            raise
 
-    def _extract_brand_prompt(self, product: dict) -> str:
-        """Create a prompt for extracting the brand from a product."""
-        return f"""Analiza este producto y extrae la marca real según estas reglas:
+    @property
+    def categories(self) -> dict:
+        self._ensure_stores()
+        return self._categories
 
-REGLAS:
-1. Ignora prefijos como "PRODUCTO ECONÓMICO" o descriptores similares
-2. Si el producto es de marca blanca de Alcampo, la marca es "Alcampo"
-3. Devuelve SOLO un JSON con el formato exacto mostrado abajo
-4. La marca debe ser el nombre oficial de la empresa/marca
+    @property
+    def products(self) -> dict:
+        self._ensure_stores()
+        return self._products
 
-FORMATO DE RESPUESTA (EXACTO):
-{{
-    "marca": "nombre_de_la_marca"
-}}
+    @property
+    def brands(self) -> dict:
+        self._ensure_stores()
+        return self._brands
 
-PRODUCTO:
-{json.dumps(product, ensure_ascii=False)}
+    @property
+    def brand_registry(self) -> BrandRegistry:
+        self._ensure_stores()
+        return self._brand_registry
 
-IMPORTANTE: DEVUELVE SOLO EL JSON CON LA MARCA REAL"""
+    @property
+    def brand_normalizer(self) -> BrandNormalizer:
+        if self._brand_normalizer is None:
+            self._brand_normalizer = BrandNormalizer.from_alias_file(self.brand_aliases_file)
+        return self._brand_normalizer
 
-    def _normalize_brand(self, brand: str) -> str:
-        """Normalize brand names to ensure consistency."""
-        # Convert to uppercase for comparison
-        brand = brand.upper()
-        
-        # Common brand name corrections
-        corrections = {
-            "NESTLE": "NESTLÉ",
-            "NESLTÉ": "NESTLÉ",
-            "ALCAMPO BABY": "ALCAMPO",
-            "ALCAMPO BABY ECOLÓGICO": "ALCAMPO",
-            "PRODUCTO ECONÓMICO ALCAMPO": "ALCAMPO",
-            "YOGOLINO DE NESTLÉ": "NESTLÉ",
-            "NATIVA DE NESTLÉ": "NESTLÉ",
-            "AUCHAN": "ALCAMPO"  # Auchan is Alcampo's parent company
+    @property
+    def category_trie(self) -> CategoryTrie:
+        self._ensure_stores()
+        return self._category_trie
+
+    @property
+    def dedup_index(self) -> DedupIndex:
+        self._ensure_stores()
+        return self._dedup_index
+
+    def _near_key(self, product: dict) -> tuple:
+        """(brand, store) a product is matched under in the near-duplicate index."""
+        return self._normalize_brand(product["marca"]).lower(), product["tienda"].lower().strip()
+
+    def _build_near_index(self):
+        self._near_index = NearDuplicateIndex(threshold=self.near_threshold)
+        for product in self._products["products"]:
+            brand, store = self._near_key(product)
+            self._near_index.add(product["nombre"], brand, store, product_ref(product))
+
+    @property
+    def classifier(self):
+        if not self.use_classifier:
+            return None
+        if not self._classifier_loaded:
+            if self._stores_loaded or not self.classifier_file.exists():
+                self._ensure_stores()
+            else:
+                # Shard workers only need the saved model, not the stores it was trained from
+                self._classifier = CategoryClassifier.load(
+                    self.classifier_file, [], threshold=self.classifier_threshold
+                )
+                self._classifier_loaded = True
+        return self._classifier
+
+    def _save_stores(self):
+        """Save categories, products and any new brands to the store."""
+        try:
+            brands = self.brands if self.brand_registry.dirty else None
+            self.store.save(self.categories, self.products, brands)
+            self.brand_registry.dirty = False
+            if self._product_links is not None and self._product_links.dirty:
+                self._product_links.save()
+            if self.category_trie.dirty:
+                self._publish_categories()
+                self.category_trie.dirty = False
+            logger.info(f"Stores saved ({self.storage})")
+        except Exception as e:
+            logger.error(f"Error saving stores: {str(e)}")
+            raise
+
+    def _publish_categories(self):
+        """Add new categories to categories.json, the flat list the web UI's /api/categories serves."""
+        categories = {"categories": []}
+        if self.ui_categories_file.exists():
+            with open(self.ui_categories_file, 'r', encoding='utf-8') as f:
+                categories = json.load(f)
+        added = merge_flat(categories["categories"], self.category_trie.flat)
+        if added:
+            atomic_write_json(self.ui_categories_file, categories)
+            logger.info(f"Published {added} new categories to {self.ui_categories_file.name}")
+
+    def dedupe_catalogue(self, dry_run: bool = False) -> dict:
+        """Remove duplicates already in the stored products and link the same product across stores.
+        
+        Exact duplicates and same-store near duplicates of an earlier product
+        are removed; near duplicates from other stores go to product_links.json.
+        """
+        self._ensure_stores()
+        started = time.perf_counter()
+        products = list(self.products["products"])
+        result = dedupe_products(products, self._normalize_brand, threshold=self.near_threshold)
+        summary = {
+            "products": len(products),
+            "removed": len(result["removed"]),
+            "links": len(result["links"]),
+            "removed_examples": [product_ref(product) for product in result["removed"][:20]],
+            "seconds": round(time.perf_counter() - started, 2),
+            "dry_run": dry_run
         }
+        if dry_run:
+            return summary
         
-        # Apply corrections
-        for wrong, correct in corrections.items():
-            if brand == wrong or brand.startswith(wrong + " "):
-                return correct
+        self.store.replace_products(self.products, result["kept"])
+        self._dedup_index = self.store.dedup_index(self._normalize_brand, self._products["products"])
+        if self._product_links is None:
+            self._product_links = ProductLinks(self.product_links_file)
+        for link in result["links"]:
+            self._product_links.add(link)
+        if self._near_index is not None:
+            self._build_near_index()
+        self._commit()
+        if self.mirror_json and self.storage == "sqlite":
+            self.export_json()
+        self.update_summary()
+        logger.info(f"Removed {summary['removed']} duplicates and recorded {summary['links']} cross-store links")
+        return summary
+
+    def label_products(self) -> dict:
+        """Categorize stored products that have no category with one LLM pass, training the classifier.
+        
+        The classifier only learns from categorized products, and products
+        stored before categories were kept have none, so until this runs the
+        classifier has nothing to predict from.
+        """
+        self._ensure_stores()
+        started = time.perf_counter()
+        unlabelled = [product for product in self.products["products"] if not product.get("categoria")]
+        
+        def categorize(product):
+            product_data = {"name": product.get("nombre", ""), "brand": product.get("marca", ""),
+                            "description": product.get("descripcion", ""), "unit": product.get("unidad", "")}
+            return self._invoke_llm(self._create_category_prompt(product_data), self._parse_category_response)
         
-        # Special case for Alcampo products
-        if "ALCAMPO" in brand:
-            return "ALCAMPO"
+        labelled = 0
+        errors = 0
+        for product, category_info, error in self.engine.map_ordered(categorize, unlabelled):
+            if error is not None or not category_info:
+                errors += 1
+                logger.error(f"✗ Failed to categorize {product.get('nombre')}: {str(error or 'Invalid category info')}")
+                continue
+            category_path = category_info["category_path"]
+            position = self.store.find_product(self.products, product, self._normalize_brand)
+            if position is None:
+                continue
+            self._find_or_create_category(category_path)
+            self.store.update_product(self.products, position, {"categoria": category_path, "categoria_origen": "llm"})
+            if self.classifier is not None:
+                self.classifier.learn(product["nombre"], product["marca"], category_path)
+            labelled += 1
         
-        return brand
+        self._commit()
+        if self.mirror_json and self.storage == "sqlite":
+            self.export_json()
+        self.update_summary()
+        logger.info(f"Categorized {labelled} stored products ({errors} errors)")
+        return {
+            "unlabelled": len(unlabelled),
+            "labelled": labelled,
+            "errors": errors,
+            "llm_requests": self.engine.requests,
+            "seconds": round(time.perf_counter() - started, 2),
+            "success": True
+        }
 
-    def _extract_brand(self, product: dict) -> str:
-        """Extract the real brand from a product."""
+    def update_summary(self, rebuild: bool = False):
+        """Refresh catalogue_summary.json from the stored products; a failure never fails the ingest."""
+        if self.catalogue_summary is None:
+            return None
+        self._ensure_stores()
+        try:
+            with self.metrics.timer("summary"):
+                return self.catalogue_summary.update(self.products["products"], rebuild=rebuild)
+        except Exception as e:
+            logger.error(f"Error updating catalogue summary: {str(e)}")
+            return None
+
+    def export_json(self):
+        """Write a SQLite catalogue out as products.json, arvore_categorias.json and marcas.json."""
+        self._ensure_stores()
+        return self.store.export_json(self.categories_file, self.products_file, self.brands_file)
+
+    def _recover_journal(self):
+        """Apply records left by an interrupted run and compact them.
+        
+        A run that checkpoints starts its journal with a progress record and
+        writes one with every checkpoint. Records after the last of them
+        belong to products the checkpoint does not cover, which the resumed
+        run processes again, so they are dropped rather than applied twice.
+        """
+        records = list(self.journal.replay())
+        progress_at = [index for index, (kind, _) in enumerate(records) if kind == "progress"]
+        if progress_at:
+            dropped = len(records) - progress_at[-1] - 1
+            if dropped:
+                logger.info(f"Dropping {dropped} journal records written after the last checkpoint")
+            records = records[:progress_at[-1] + 1]
+        
+        recovered = 0
+        progress = None
+        for kind, data in records:
+            if kind == "progress":
+                progress = data
+            elif kind == "category":
+                self._find_or_create_category(data, journal=False)
+            elif kind == "brand":
+                self.brand_registry.register(data)
+            elif kind == "link":
+                if self._product_links is not None:
+                    self._product_links.add(data)
+            elif kind == "price":
+                self._apply_price_change(data, journal=False)
+            elif kind == "update":
+                position = self.store.find_product(self.products, data["match"], self._normalize_brand)
+                if position is not None:
+                    self._update_product(position, data["product"], data["fecha"])
+            elif kind == "product":
+                # Products already compacted before the crash are found as duplicates
+                if not self._is_duplicate_product(data):
+                    self._add_product(data)
+            recovered += 1
+        
+        if recovered:
+            logger.info(f"Recovered {recovered} journal records from an interrupted run")
+            # The checkpoint written with the last sync may not have made it to disk
+            if progress is not None:
+                self.checkpoints.save(**progress)
+            self._commit()
+
+    def _add_product(self, product: dict):
+        """Add an accepted product to the store and the dedup index."""
+        self.products["products"].append(product)
+        self.dedup_index.add(product)
+        if self._near_index is not None:
+            brand, store = self._near_key(product)
+            self._near_index.add(product["nombre"], brand, store, product_ref(product))
+        
+        # Only LLM decisions train the classifier, never its own predictions
+        if self.classifier is not None and product.get("categoria") and product.get("categoria_origen") == "llm":
+            self.classifier.learn(product["nombre"], product["marca"], product["categoria"])
+
+    def _commit(self):
+        """Compact the journal into the store."""
+        if not self._stores_loaded:
+            return
+        with self.metrics.timer("save"):
+            self.journal.sync()
+            self._save_stores()
+            if self.classifier is not None:
+                self.classifier.save(self.classifier_file)
+            self.journal.truncate()
+            self._loaded_signature = self.store.signature()
+
+    def reload_if_changed(self) -> bool:
+        """Reload the stores and rebuild the dedup index if another process changed them."""
+        if not self._stores_loaded or self.store.signature() == self._loaded_signature:
+            return False
+        
+        self._categories = self.store.load_categories()
+        self._products = self.store.load_products()
+        self._brands = self.store.load_brands()
+        self._brand_registry = BrandRegistry(self._brands)
+        self._category_trie = CategoryTrie(self._categories["categorias"])
+        self._dedup_index.build(self._products["products"])
+        if self._near_index is not None:
+            self._build_near_index()
+        self._loaded_signature = self.store.signature()
+        logger.info("Reloaded stores changed on disk")
+        return True
+
+    def _find_or_create_category(self, category_path: list, journal: bool = True) -> None:
+        created = self.category_trie.find_or_create(category_path)
+        
+        if created:
+            logger.info(f"Created new category: {' > '.join(category_path)}")
+            if journal:
+                self.journal.append("category", list(category_path))
+
+    def _normalize_brand(self, brand: str) -> str:
+        """Normalize brand names to ensure consistency."""
+        return self.brand_normalizer.normalize(brand)
+
+    def _extract_brand(self, product: dict):
+        """Extract the real brand from the product name; None when the LLM has to decide."""
         try:
             # First try to extract from the product name
             name = product.get("name", "").upper()
@@ -203,160 +581,78 @@ IMPORTANTE: DEVUELVE SOLO EL JSON CON LA MARCA REAL"""
                     name = name[len(prefix):].strip()
             
             # Extract the first word (usually the brand)
-            brand = name.split()[0]
+            words = name.split()
+            if not words:
+                return None
+            brand = words[0]
             
-            # Try LLM if the extracted brand seems wrong
+            # Leave it to the LLM if the extracted brand seems wrong
             if len(brand) < 2 or brand in ["EL", "LA", "LOS", "LAS"]:
-                prompt = self._extract_brand_prompt(product)
-                response = self.llm.invoke(prompt)
-                brand_info = self._parse_brand_response(response)
-                
-                if brand_info and "marca" in brand_info:
-                    brand = brand_info["marca"].strip()
+                return None
             
             # Normalize the brand name
-            brand = self._normalize_brand(brand)
-            
-            # Add to brands list if not exists
-            if brand not in [b["nombre"] for b in self.brands["marcas"]]:
-                self.brands["marcas"].append({
-                    "nombre": brand,
-                    "descripcion": f"Marca: {brand}"
-                })
-                self._save_brands()
-                logger.info(f"Added new brand: {brand}")
-            
-            return brand
+            return self._normalize_brand(brand)
             
         except Exception as e:
             logger.error(f"Error extracting brand: {str(e)}")
-            return product.get("brand", "")
+            return None
 
-    def _parse_brand_response(self, response: str) -> dict:
-        """Parse the LLM response for brand extraction."""
-        try:
-            response = response.strip()
-            
-            # Clean up the response
-            if response.startswith('```') and response.endswith('```'):
-                response = response[3:-3].strip()
-            elif response.startswith('```'):
-                response = response[3:].strip()
-            elif response.endswith('```'):
-                response = response[:-3].strip()
-            
-            if response.startswith('json'):
-                response = response[4:].strip()
-            
-            # Parse JSON
-            result = json.loads(response)
-            if not isinstance(result.get("marca"), str):
-                raise ValueError("Invalid brand in response")
+    def _register_brand(self, brand: str):
+        """Add a brand to marcas.json (at the next commit) if it is not known yet."""
+        if self.brand_registry.register(brand):
+            self.journal.append("brand", brand)
+            logger.info(f"Added new brand: {brand}")
+
+    def _create_category_prompt(self, product: dict, ask_brand: bool = False) -> str:
+        """Create a prompt for the LLM to categorize a product (and name its brand if asked)."""
+        return self.prompts.category_prompt(product, ask_brand=ask_brand)
+
+    @staticmethod
+    def _response_json(response: str):
+        """Decode the JSON in an LLM response, in case there's additional text or fences."""
+        json_str = response
+        if "```json" in response:
+            json_str = response.split("```json")[1].split("```")[0].strip()
+        elif "```" in response:
+            json_str = response.split("```")[1].strip()
+        return json.loads(json_str)
+
+    def _validate_category(self, data) -> dict:
+        """Check one category answer; return its category_path (and marca), or None."""
+        # Validate structure
+        if not isinstance(data, dict):
+            logger.error("Response is not a dictionary")
+            return None
             
-            return result
+        if "category_path" not in data:
+            logger.error("Missing required keys in response")
+            return None
             
-        except Exception as e:
-            logger.error(f"Error parsing brand response: {str(e)}")
+        if not isinstance(data["category_path"], list):
+            logger.error("category_path is not a list")
             return None
-
-    def _create_category_prompt(self, product: dict) -> str:
-        """Create a prompt for the LLM to categorize a product."""
-        # Extract original data for more details
-        original_data = product.get("metadata", {}).get("original_data", {}).get("original_data", {})
-        
-        # Get the most detailed information available
-        name = product.get("name", "")
-        brand = product.get("brand", "")
-        description = product.get("description", "")
-        price = product.get("price", {}).get("current", 0) if isinstance(product.get("price"), dict) else product.get("price", 0)
-        store = product.get("store", "")
-        unit = original_data.get("price_per_unit", "")
-        url = original_data.get("url", "")
-        image = original_data.get("image_url", "")
-        
-        return f"""Por favor, analiza el siguiente producto y devuelve una categorización jerárquica en formato JSON.
-        
-Producto: {name}
-Marca: {brand}
-Descripción: {description}
-Precio: {price}
-Unidad: {unit}
-Tienda: {store}
-URL: {url}
-Imagen: {image}
-
-Reglas:
-1. Crea una jerarquía de categorías relevante y específica para este producto
-2. Usa máximo 3 niveles de profundidad
-3. Todas las categorías deben estar en español
-4. La respuesta debe ser un objeto JSON con esta estructura:
-
-{{
-    "category_path": ["Categoría 1", "Subcategoría", "Sub-subcategoría"],
-    "processed_product": {{
-        "nombre": "{name}",
-        "marca": "{brand}",
-        "precio": {price},
-        "descripcion": "{description}",
-        "unidad": "{unit}",
-        "tienda": "{store}",
-        "url": "{url}",
-        "imagen": "{image}"
-    }}
-}}
-
-Responde SOLO con el JSON, sin texto adicional."""
+        
+        # Every level must be a non-empty name
+        if not data["category_path"] or not all(
+            isinstance(level, str) and level.strip() for level in data["category_path"]
+        ):
+            logger.error("category_path has empty or non-text levels")
+            return None
+        
+        # The brand is only asked for when the name heuristic failed
+        if "marca" in data and not isinstance(data["marca"], str):
+            logger.error("Invalid brand in response")
+            return None
+        
+        result = {"category_path": [level.strip() for level in data["category_path"]]}
+        if "marca" in data:
+            result["marca"] = data["marca"]
+        return result
 
     def _parse_category_response(self, response: str) -> dict:
         """Parse and validate the LLM's response."""
         try:
-            # Extract JSON from response (in case there's additional text)
-            json_str = response
-            if "```json" in response:
-                json_str = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                json_str = response.split("```")[1].strip()
-            
-            data = json.loads(json_str)
-            
-            # Validate structure
-            if not isinstance(data, dict):
-                logger.error("Response is not a dictionary")
-                return None
-                
-            if "category_path" not in data or "processed_product" not in data:
-                logger.error("Missing required keys in response")
-                return None
-                
-            if not isinstance(data["category_path"], list):
-                logger.error("category_path is not a list")
-                return None
-                
-            if not isinstance(data["processed_product"], dict):
-                logger.error("processed_product is not a dictionary")
-                return None
-            
-            # Validate required fields in processed_product
-            required_fields = ["nombre", "marca", "precio", "descripcion", "tienda"]
-            for field in required_fields:
-                if field not in data["processed_product"]:
-                    logger.error(f"Missing required field: {field}")
-                    return None
-            
-            # Ensure precio is numeric
-            try:
-                data["processed_product"]["precio"] = float(data["processed_product"]["precio"])
-            except (ValueError, TypeError):
-                logger.error("Price is not numeric")
-                return None
-            
-            # Set default values for optional fields
-            data["processed_product"].setdefault("unidad", "")
-            data["processed_product"].setdefault("url", "")
-            data["processed_product"].setdefault("imagen", "")
-            
-            return data
-            
+            return self._validate_category(self._response_json(response))
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response: {str(e)}")
             return None
@@ -364,39 +660,63 @@ Responde SOLO con el JSON, sin texto adicional."""
             logger.error(f"Error parsing category response: {str(e)}")
             return None
 
+    def _parse_batch_response(self, response: str) -> dict:
+        """Parse a batched answer into {item number: validated answer}, leaving out invalid items."""
+        try:
+            data = self._response_json(response)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse JSON batch response: {str(e)}")
+            return None
+        
+        if not isinstance(data, list):
+            logger.error("Batch response is not a list")
+            return None
+        
+        answers = {}
+        for element in data:
+            number = element.get("id") if isinstance(element, dict) else None
+            if not isinstance(number, int):
+                logger.error("Batch response item without a numeric id")
+                continue
+            answer = self._validate_category(element)
+            if answer is not None:
+                answers[number] = answer
+        return answers
+
     def _is_duplicate_product(self, product: dict) -> bool:
         """Check if a product already exists based on name, brand, and store."""
-        normalized_name = product["nombre"].lower().strip()
-        normalized_brand = self._normalize_brand(product["marca"]).lower()
-        normalized_store = product["tienda"].lower().strip()
-        normalized_url = product.get("url", "").lower().strip()  # Consider URL in duplicate check
-        
-        for existing in self.products["products"]:
-            existing_name = existing["nombre"].lower().strip()
-            existing_brand = self._normalize_brand(existing["marca"]).lower()
-            existing_store = existing["tienda"].lower().strip()
-            existing_url = existing.get("url", "").lower().strip()
-            
-            # Check for duplicates based on name, brand, and store
-            if (normalized_name == existing_name and 
-                normalized_brand == existing_brand and 
-                normalized_store == existing_store):
-                logger.info(f"Duplicate found: {product['nombre']} ({normalized_brand}) from {normalized_store}")
-                return True
-            
-            # If URLs are present and match, consider it a duplicate
-            if normalized_url and existing_url and normalized_url == existing_url:
-                logger.info(f"Duplicate found by URL: {product['nombre']}")
-                return True
-            
-            # Special case for Alcampo products - check if it's the same product with different branding
-            if (normalized_brand == "alcampo" and existing_brand == "alcampo" and
-                normalized_store == existing_store and
-                self._similar_names(normalized_name, existing_name)):
-                logger.info(f"Duplicate Alcampo product found: {product['nombre']}")
-                return True
-        
-        return False
+        rule = self.dedup_index.match(product)
+        
+        if rule is None and self._near_index is not None:
+            brand, store = self._near_key(product)
+            if any(match_store == store for match_store, _, _ in self._near_index.query(product["nombre"], brand)):
+                rule = "near"
+        
+        if rule == "key":
+            normalized_brand = self._normalize_brand(product["marca"]).lower()
+            normalized_store = product["tienda"].lower().strip()
+            logger.debug(f"Duplicate found: {product['nombre']} ({normalized_brand}) from {normalized_store}")
+        elif rule == "url":
+            logger.debug(f"Duplicate found by URL: {product['nombre']}")
+        elif rule == "alcampo":
+            logger.debug(f"Duplicate Alcampo product found: {product['nombre']}")
+        elif rule == "near":
+            logger.debug(f"Near-duplicate name found: {product['nombre']}")
+        
+        return rule is not None
+
+    def _link_same_products(self, product: dict):
+        """Record near duplicates of a new product from other stores as the same product."""
+        if self._near_index is None:
+            return
+        brand, store = self._near_key(product)
+        with self.metrics.timer("links"):
+            matches = self._near_index.query(product["nombre"], brand)
+        for match_store, similarity, ref in matches:
+            link = {"productos": [ref, product_ref(product)], "similitud": similarity}
+            if self._product_links.add(link):
+                self.journal.append("link", link)
+                logger.debug(f"Same product at {match_store}: {product['nombre']} ({similarity})")
 
     def _similar_names(self, name1: str, name2: str) -> bool:
         """Check if two product names are similar (for Alcampo products)."""
@@ -412,114 +732,609 @@ Responde SOLO con el JSON, sin texto adicional."""
         # Compare the core product names
         return name1 == name2
 
-    def process_file(self, file_path: str) -> dict:
-        """Process a single file and categorize its products."""
+    def _invoke_llm(self, prompt: str, parse, items: int = 1):
+        """Get a parsed LLM response for prompt (covering items products), going through the response cache."""
+        hit, result = self._cached_response(prompt, parse)
+        if hit:
+            return result
+        return self._ask_llm(prompt, parse, items=items)
+
+    def _cached_response(self, prompt: str, parse) -> tuple:
+        """(True, parsed response) when the response cache answers prompt, else (False, None)."""
+        if self.llm_cache is not None:
+            cached = self.llm_cache.get(prompt)
+            if cached is not None:
+                with self.metrics.timer("response_parse"):
+                    result = parse(cached)
+                if result is not None or not self.cache_validated_only:
+                    return True, result
+        return False, None
+
+    def _ask_llm(self, prompt: str, parse, items: int = 1):
+        """Send prompt to the LLM and parse the response, caching it for the next time."""
+        with self.metrics.timer("llm"):
+            response = self.engine.invoke(prompt, items=items)
+        with self.metrics.timer("response_parse"):
+            result = parse(response)
+        
+        if self.llm_cache is not None and (result is not None or not self.cache_validated_only):
+            self.llm_cache.put(prompt, response)
+        return result
+
+    def _build_processed_product(self, product: dict) -> dict:
+        """Build the stored product record from the input fields; the LLM only supplies the category."""
+        return {
+            "nombre": product.get("name", ""),
+            "marca": product.get("brand", ""),
+            "precio": float(product.get("price") or 0),
+            "descripcion": product.get("description", ""),
+            "unidad": product.get("unit", ""),
+            "tienda": product.get("store", ""),
+            "url": product.get("url", ""),
+            "imagen": product.get("image", "")
+        }
+
+    @staticmethod
+    def _input_fields(product_data: dict) -> dict:
+        """Price, unit price, URL and image of an input product, from its scraped original data."""
+        original_data = product_data.get("metadata", {}).get("original_data", {}).get("original_data", {})
+        return {
+            "price": product_data.get("price", {}).get("current", 0) if isinstance(product_data.get("price"), dict) else product_data.get("price", 0),
+            "unit": original_data.get("price_per_unit", ""),
+            "url": original_data.get("url", ""),
+            "image": original_data.get("image_url", "")
+        }
+
+    def _prepare_product(self, item: tuple) -> tuple:
+        """Extract the input fields and the brand; return (product_data, brand, classifier result).
+        
+        brand is None when the LLM has to name it; the classifier result is
+        None when the product has to go to the LLM.
+        """
+        product_id, product_data = item
+        
+        # Add all necessary data to the product
+        product_data["id"] = product_id
+        product_data.update(self._input_fields(product_data))
+        
+        # First, extract the brand from the name; the LLM names it when that fails
+        with self.metrics.timer("brand"):
+            brand = self._extract_brand(product_data)
+        
+        # Products shaped like ones the LLM already categorized skip the LLM
+        classifier = self._stage_classifier or self.classifier
+        if brand is not None and classifier is not None:
+            with self.metrics.timer("classifier"):
+                category_path = classifier.confident(product_data.get("name", ""), brand)
+            if category_path is not None:
+                product_data["brand"] = brand
+                return product_data, brand, {
+                    "category_path": category_path,
+                    "processed_product": self._build_processed_product(product_data),
+                    "source": "clasificador"
+                }
+        return product_data, brand, None
+
+    def _llm_result(self, product_data: dict, brand, category_info: dict) -> dict:
+        """Turn a validated LLM answer into the stage result, settling the brand."""
+        if brand is None:
+            llm_brand = (category_info or {}).get("marca", "").strip()
+            brand = self._normalize_brand(llm_brand or product_data.get("brand", ""))
+        product_data["brand"] = brand
+        
+        if not category_info:
+            return None
+        
+        # Price, unit, URL and image never go through the model; they come from the input
+        return {
+            "category_path": category_info["category_path"],
+            "processed_product": self._build_processed_product(product_data),
+            "source": "llm"
+        }
+
+    def _ask_single(self, product_data: dict, brand, fallback: bool = False, compare: bool = False) -> dict:
+        """Categorize one product with its own prompt, timing it for the batch comparison.
+        
+        Only calls that reach the LLM are timed. A comparison (compare) always
+        does, since a cached answer would say nothing about either mode.
+        """
+        prompt = self._create_category_prompt(product_data, ask_brand=brand is None)
+        if not compare:
+            hit, category_info = self._cached_response(prompt, self._parse_category_response)
+            if hit:
+                return category_info
+        started = time.perf_counter()
+        category_info = self._ask_llm(prompt, self._parse_category_response)
+        if self.batch_prompts > 1:
+            self.batch_stats.record_single(time.perf_counter() - started, fallback)
+        return category_info
+
+    def _categorize_product(self, item: tuple) -> dict:
+        """Run the LLM stage for one input product.
+        
+        Called from the request engine's worker threads, so it must not touch
+        the stores; everything that does happens in process_file, in order.
+        """
+        product_data, brand, result = self._prepare_product(item)
+        if result is not None:
+            return result
+        return self._llm_result(product_data, brand, self._ask_single(product_data, brand))
+
+    def _categorize_chunk(self, items: list) -> list:
+        """Run the LLM stage for several products with one prompt; return (result, error) per item.
+        
+        Items the batched answer leaves out or gets wrong are asked for again
+        one by one. Like _categorize_product, this runs in worker threads.
+        """
+        prepared = []
+        outcomes = []
+        for item in items:
+            try:
+                prepared.append(self._prepare_product(item))
+                outcomes.append((prepared[-1][2], None))
+            except Exception as e:
+                prepared.append(None)
+                outcomes.append((None, e))
+        pending = [index for index, (result, error) in enumerate(outcomes) if result is None and error is None]
+        
+        answers = {}
+        if len(pending) > 1:
+            prompt = self.prompts.batch_prompt([
+                (number, prepared[index][0], prepared[index][1] is None) for number, index in enumerate(pending, 1)
+            ])
+            # As with single prompts, only batches that reach the LLM are timed
+            hit, answers = self._cached_response(prompt, self._parse_batch_response)
+            if not hit:
+                started = time.perf_counter()
+                try:
+                    answers = self._ask_llm(prompt, self._parse_batch_response, items=len(pending))
+                except Exception as e:
+                    logger.error(f"Batched LLM request failed, asking for each product: {str(e)}")
+                self.batch_stats.record_batch(len(pending), time.perf_counter() - started)
+            answers = answers or {}
+        
+        for number, index in enumerate(pending, 1):
+            product_data, brand, _ = prepared[index]
+            try:
+                category_info = answers.get(number)
+                if category_info is None:
+                    category_info = self._ask_single(product_data, brand, fallback=len(pending) > 1)
+                elif self.batch_stats.should_compare(product_data["id"]):
+                    single = self._ask_single(product_data, brand, compare=True)
+                    self.batch_stats.record_comparison(
+                        single is not None and single["category_path"] == category_info["category_path"]
+                    )
+                outcomes[index] = (self._llm_result(product_data, brand, category_info), None)
+            except Exception as e:
+                outcomes[index] = (None, e)
+        return outcomes
+
+    def _llm_stage(self, products_iter):
+        """Yield ((product_id, product), result, error) in input order, batching prompts if enabled."""
+        if self.batch_prompts == 1:
+            yield from self.engine.map_ordered(self._categorize_product, products_iter)
+            return
+        
+        chunks = self.prompts.chunks(products_iter, self.batch_prompts)
+        for chunk, outcomes, error in self.engine.map_ordered(self._categorize_chunk, chunks):
+            for index, item in enumerate(chunk):
+                if error is not None:
+                    yield item, None, error
+                else:
+                    yield (item,) + outcomes[index]
+
+    def _open_input(self, file_path: str) -> tuple:
+        """Return (products iterator, product count or None, stream or None) for an upload file."""
+        if self.stream_input:
+            # Parse products one at a time as the pipeline asks for them
+            stream = ProductStream(file_path)
+            logger.info(f"Streaming products from {stream.file_size} byte file")
+            return self.metrics.timed("input_parse", stream), None, stream
+        
+        # Read input file
+        with self.metrics.timer("input_load"), open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        # Verify file structure
+        if not isinstance(data, dict) or "products" not in data:
+            raise ValueError("Input file must contain a 'products' dictionary")
+        
+        logger.info(f"Found {len(data['products'])} products in file")
+        return iter(data["products"].items()), len(data["products"]), None
+
+    def _apply_price_change(self, change: dict, journal: bool = True) -> bool:
+        """Set the new price of a stored product and add it to its price history; False if not stored."""
+        position = self.store.find_product(self.products, change, self._normalize_brand)
+        if position is None:
+            return False
+        current = self.store.get_product(self.products, position)
+        history = self._price_history(current, change["precio"], change["unidad"], change["fecha"])
+        # Replayed or resumed changes are already in place
+        if history is None:
+            return True
+        
+        self.store.update_product(self.products, position, {
+            "precio": change["precio"],
+            "unidad": change["unidad"],
+            "historial_precios": history
+        })
+        if journal:
+            self.journal.append("price", change)
+        return True
+
+    @staticmethod
+    def _price_history(current, price, unit: str, fecha: str):
+        """current's price history with an entry for the new price, or None if the price did not change."""
+        if current.get("precio") == price and current.get("unidad") == unit:
+            return None
+        history = list(current.get("historial_precios") or [])
+        history.append({
+            "fecha": fecha,
+            "precio": price,
+            "unidad": unit,
+            "precio_anterior": current.get("precio")
+        })
+        return history
+
+    def _update_product(self, position, product: dict, fecha: str) -> None:
+        """Overwrite a stored product with its re-categorized version, keeping its price history."""
+        current = self.store.get_product(self.products, position)
+        changes = dict(product)
+        history = self._price_history(current, product.get("precio"), product.get("unidad"), fecha)
+        if history is not None:
+            changes["historial_precios"] = history
+        self.store.update_product(self.products, position, changes)
+        
+        # The old name's keys stay indexed; they still belong to this product
+        self.dedup_index.add(product)
+        if self._near_index is not None:
+            brand, store = self._near_key(product)
+            self._near_index.add(product["nombre"], brand, store, product_ref(product))
+        if self.classifier is not None and product.get("categoria") and product.get("categoria_origen") == "llm":
+            self.classifier.learn(product["nombre"], product["marca"], product["categoria"])
+
+    def _apply_update(self, product_data: dict, category_info: dict, match: dict) -> str:
+        """Apply a changed product's LLM-stage result to its stored record; return updated or error.
+        
+        A changed product keeps its URL, so the duplicate rules would drop it;
+        instead the stored record found through match is replaced in place.
+        Products no longer in the store go through _apply_result as new ones.
+        """
+        position = self.store.find_product(self.products, match, self._normalize_brand)
+        if position is None:
+            return self._apply_result(product_data, category_info)
+        
+        self._register_brand(product_data["brand"])
+        if not category_info:
+            logger.error(f"✗ Failed to update product: Invalid category info")
+            return "error"
+        
+        product = category_info["processed_product"]
+        product["categoria"] = category_info["category_path"]
+        product["categoria_origen"] = category_info["source"]
+        fecha = datetime.now().date().isoformat()
+        with self.metrics.timer("category_insert"):
+            self._find_or_create_category(category_info["category_path"])
+        with self.metrics.timer("store_add"):
+            self._update_product(position, product, fecha)
+            self.journal.append("update", {"match": match, "product": product, "fecha": fecha})
+        logger.debug(f"✓ Updated: {product['nombre']}")
+        return "updated"
+
+    def _delta_scan(self, file_path: str, manifest: SourceManifest) -> dict:
+        """Compare an upload with its source's manifest before anything goes to the pipeline.
+        
+        Returns the ids of the new and changed products, which still have to
+        be categorized, with their manifest keys, and for the changed ones how
+        to find their stored record. Price-only changes are applied here;
+        unchanged products are done with.
+        """
+        wanted = {}
+        updates = {}
+        counts = {"new": 0, "changed": 0, "updated": 0, "unchanged": 0, "price_updated": 0, "price_not_found": 0}
+        today = datetime.now().date().isoformat()
+        products_iter, _, _ = self._open_input(file_path)
+        
+        for product_id, product_data in products_iter:
+            fields = dict(product_data, **self._input_fields(product_data))
+            price = float(fields["price"] or 0)
+            key = product_key(product_id, fields)
+            digest = content_hash(fields)
+            # Stored under the brand the pipeline would have given it
+            brand = self._extract_brand(fields) or fields.get("brand", "")
+            outcome = manifest.classify(key, digest, price, fields["unit"])
+            manifest.record(key, digest, price, fields["unit"], fields.get("name", ""), brand)
+            
+            if outcome in ("new", "changed"):
+                wanted[product_id] = key
+                counts[outcome] += 1
+                if outcome == "changed":
+                    # Found by URL, or by the name and brand it was stored under last time
+                    previous = manifest.previous_entry(key)
+                    updates[product_id] = {
+                        "nombre": previous.get("nombre") or fields.get("name", ""),
+                        "marca": previous.get("marca") or brand,
+                        "tienda": fields.get("store", ""),
+                        "url": fields["url"]
+                    }
+            elif outcome == "price":
+                change = {
+                    "nombre": fields.get("name", ""),
+                    "marca": brand,
+                    "tienda": fields.get("store", ""),
+                    "url": fields["url"],
+                    "precio": price,
+                    "unidad": fields["unit"],
+                    "fecha": today
+                }
+                if self._apply_price_change(change):
+                    counts["price_updated"] += 1
+                    self.metrics.increment("products_price_updated")
+                    if self.journal.is_full():
+                        self._commit()
+                else:
+                    # Not in the store (e.g. it failed last time): the next run takes it as new
+                    manifest.forget(key)
+                    counts["price_not_found"] += 1
+            else:
+                counts["unchanged"] += 1
+                self.metrics.increment("products_unchanged")
+        
+        logger.info(f"Delta against the last {manifest.source} upload: {json.dumps(counts)}")
+        return {"wanted": wanted, "updates": updates, "counts": counts, "total": len(wanted) + counts["unchanged"] +
+                counts["price_updated"] + counts["price_not_found"]}
+
+    def _apply_result(self, product_data: dict, category_info: dict) -> str:
+        """Apply one product's LLM-stage result to the stores; return processed, skipped or error."""
+        real_brand = product_data["brand"]
+        self._register_brand(real_brand)
+        
+        if not category_info:
+            logger.error(f"✗ Failed to process product: Invalid category info")
+            return "error"
+        
+        category_info["processed_product"]["categoria"] = category_info["category_path"]
+        category_info["processed_product"]["categoria_origen"] = category_info["source"]
+        
+        # Check if product is already in database
+        with self.metrics.timer("dedup"):
+            duplicate = self._is_duplicate_product(category_info["processed_product"])
+        if duplicate:
+            logger.debug(f"→ Skipped (duplicate): {category_info['processed_product']['nombre']}")
+            return "skipped"
+        
+        # Update categories in arvore_categorias.json
+        with self.metrics.timer("category_insert"):
+            self._find_or_create_category(category_info["category_path"])
+        
+        # The same product from another store is kept, and linked to its match
+        self._link_same_products(category_info["processed_product"])
+        
+        # Add product to products.json
+        with self.metrics.timer("store_add"):
+            self._add_product(category_info["processed_product"])
+            self.journal.append("product", category_info["processed_product"])
+        logger.debug(f"✓ Added: {category_info['processed_product']['nombre']} (Brand: {real_brand})")
+        logger.debug(f"  URL: {category_info['processed_product']['url']}")
+        logger.debug(f"  Image: {category_info['processed_product']['imagen']}")
+        return "processed"
+
+    def process_file(self, file_path: str, upload_id: str = None, resume: bool = False, source: str = None) -> dict:
+        """Process a single file and categorize its products.
+        
+        Progress is checkpointed under upload_id (the file name by default) and
+        the input hash; with resume=True a matching checkpoint is picked up and
+        the products it covers are skipped.
+        
+        In delta mode only products that are new or changed since the last
+        upload of the same source (the file name without its date by
+        default) are categorized. Changed products replace their stored
+        record and price-only changes are applied to it in place.
+        """
+        save_checkpoint = None
         try:
             logger.info(f"Processing file: {file_path}")
+            upload_id = upload_id or Path(file_path).stem
+            file_hash = file_sha256(file_path)
             
-            # Read input file
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Load the stores here, before any worker thread can touch them
+            self._ensure_stores()
             
-            # Verify file structure
-            if not isinstance(data, dict) or "products" not in data:
-                raise ValueError("Input file must contain a 'products' dictionary")
+            # Counters are per run, also when a resident worker reuses this processor
+            self.engine.reset_counters()
+            self.batch_stats.reset()
+            if self.llm_cache is not None:
+                self.llm_cache.reset_stats()
             
-            products_data = data["products"]
-            total_products = len(products_data)
-            logger.info(f"Found {total_products} products in file")
+            products_iter, total_products, stream = self._open_input(file_path)
+            
+            delta = None
+            if self.delta:
+                manifest = SourceManifest(self.manifests_dir, source or source_name(file_path))
+                with self.metrics.timer("delta"):
+                    delta = self._delta_scan(file_path, manifest)
+                products_iter = (item for item in products_iter if item[0] in delta["wanted"])
+                total_products = delta["total"]
+            
+            def progress(count):
+                if total_products is None:
+                    return f"{count} ({stream.progress():.0%} of file)"
+                return f"{count}/{total_products}"
+            
+            if self.engine.max_in_flight > 1:
+                logger.info(f"Keeping up to {self.engine.max_in_flight} LLM requests in flight")
+            # The LLM stage predicts with the model as it was when the run started, while the live one
+            # is trained; what a run teaches it is used from the next run on, whatever the concurrency
+            if self.classifier is not None:
+                self._stage_classifier = self.classifier.snapshot()
             
             processed = 0
             skipped = 0
             errors = 0
+            llm_calls_avoided = 0
             
-            # Process products in batches to avoid memory issues
+            # Log progress every batch_size products
             batch_size = 100
             products_processed = 0
+            resumed_from = 0
+            last_product_id = None
+            
+            checkpoint = self.checkpoints.load(upload_id, file_hash) if resume else None
+            if checkpoint:
+                # Everything up to the checkpoint is already in the journal or the stores
+                counters = checkpoint["counters"]
+                processed = counters["processed"]
+                skipped = counters["skipped"]
+                errors = counters["errors"]
+                llm_calls_avoided = counters["llm_calls_avoided"]
+                products_processed = resumed_from = checkpoint["position"]
+                last_product_id = checkpoint["last_product_id"]
+                products_iter = skip_committed(products_iter, checkpoint)
+                logger.info(f"Resuming {upload_id} after product {last_product_id} ({resumed_from} done)")
+            
+            def save_checkpoint():
+                # The journal only reaches disk here, together with the position it covers,
+                # so a resumed run never redoes (or miscounts) products recovered from it
+                progress = {
+                    "upload_id": upload_id,
+                    "file_hash": file_hash,
+                    "file_path": str(file_path),
+                    "position": products_processed,
+                    "last_product_id": last_product_id,
+                    "counters": {
+                        "processed": processed,
+                        "skipped": skipped,
+                        "errors": errors,
+                        "llm_calls_avoided": llm_calls_avoided
+                    }
+                }
+                self.journal.append("progress", progress)
+                self.journal.sync()
+                self.checkpoints.save(**progress)
             
-            for product_id, product_data in products_data.items():
+            # LLM calls run concurrently; results arrive here in input order
+            results = self._llm_stage(products_iter)
+            self.journal.auto_sync = False
+            # Open the journal with the position the run starts from (see _recover_journal)
+            save_checkpoint()
+            
+            for (product_id, product_data), category_info, error in results:
                 try:
-                    logger.info(f"\nProcessing product {products_processed + 1}/{total_products}")
-                    logger.info(f"Product: {product_data.get('name', 'Unknown')}")
-                    
-                    # Extract original data
-                    original_data = product_data.get("metadata", {}).get("original_data", {}).get("original_data", {})
-                    
-                    # Add all necessary data to the product
-                    product_data["id"] = product_id
-                    product_data["price"] = product_data.get("price", {}).get("current", 0) if isinstance(product_data.get("price"), dict) else product_data.get("price", 0)
-                    product_data["unit"] = original_data.get("price_per_unit", "")
-                    product_data["url"] = original_data.get("url", "")
-                    product_data["image"] = original_data.get("image_url", "")
+                    logger.debug(f"\nProcessing product {progress(products_processed + 1)}")
+                    logger.debug(f"Product: {product_data.get('name', 'Unknown')}")
                     
-                    # First, extract and verify the brand
-                    real_brand = self._extract_brand(product_data)
-                    product_data["brand"] = real_brand
+                    if error is not None:
+                        raise error
                     
-                    # Create category prompt
-                    prompt = self._create_category_prompt(product_data)
+                    if category_info and category_info["source"] == "clasificador":
+                        llm_calls_avoided += 1
+                        self.metrics.increment("llm_calls_avoided")
                     
-                    # Get category prediction
-                    response = self.llm.invoke(prompt)
-                    category_info = self._parse_category_response(response)
-                    
-                    if category_info:
-                        # Check if product is already in database
-                        if self._is_duplicate_product(category_info["processed_product"]):
-                            skipped += 1
-                            logger.info(f"→ Skipped (duplicate): {category_info['processed_product']['nombre']}")
-                        else:
-                            # Update categories in arvore_categorias.json
-                            self._find_or_create_category(category_info["category_path"])
-                            self._save_categories()
-                            
-                            # Add product to products.json
-                            self.products["products"].append(category_info["processed_product"])
-                            self._save_products()
-                            processed += 1
-                            logger.info(f"✓ Added: {category_info['processed_product']['nombre']} (Brand: {real_brand})")
-                            logger.info(f"  URL: {category_info['processed_product']['url']}")
-                            logger.info(f"  Image: {category_info['processed_product']['imagen']}")
+                    match = delta["updates"].get(product_id) if delta is not None else None
+                    if match is not None:
+                        outcome = self._apply_update(product_data, category_info, match)
+                    else:
+                        outcome = self._apply_result(product_data, category_info)
+                    self.metrics.increment(f"products_{outcome}")
+                    if outcome in ("processed", "updated"):
+                        processed += 1
+                        if outcome == "updated":
+                            delta["counts"]["updated"] += 1
+                    elif outcome == "skipped":
+                        skipped += 1
                     else:
                         errors += 1
-                        logger.error(f"✗ Failed to process product: Invalid category info")
+                        if delta is not None:
+                            manifest.revert(delta["wanted"][product_id])
                     
                     products_processed += 1
+                    last_product_id = product_id
                     
-                    # Save progress periodically
+                    # Save progress periodically, and whenever the journal is due for a sync or compaction
+                    journal_full = self.journal.is_full()
+                    if (journal_full or self.journal.sync_due() or
+                            (self.checkpoint_every and products_processed % self.checkpoint_every == 0)):
+                        save_checkpoint()
+                    if journal_full:
+                        self._commit()
+                        save_checkpoint()
+                    self.metrics.maybe_flush()
                     if products_processed % batch_size == 0:
                         logger.info(f"\nProgress Update:")
                         logger.info(f"Processed: {processed}")
                         logger.info(f"Skipped: {skipped}")
                         logger.info(f"Errors: {errors}")
-                        logger.info(f"Total Progress: {products_processed}/{total_products}")
+                        logger.info(f"Total Progress: {progress(products_processed)}")
                         logger.info("="*50)
                         
                 except Exception as e:
                     errors += 1
+                    self.metrics.increment("products_error")
                     logger.error(f"Error processing product: {str(e)}")
+                    if delta is not None:
+                        manifest.revert(delta["wanted"][product_id])
                     products_processed += 1
+                    last_product_id = product_id
                     continue
             
+            # Compact everything accepted during this run
+            self._stage_classifier = None
+            self.journal.auto_sync = True
+            self._commit()
+            self.checkpoints.clear(upload_id, file_hash)
+            if delta is not None:
+                manifest.save()
+            if self.mirror_json and self.storage == "sqlite":
+                self.export_json()
+            # Products changed in place invalidate the cached unit prices
+            self.update_summary(rebuild=bool(delta and (delta["counts"]["price_updated"] or delta["counts"]["updated"])))
+            
+            if total_products is None:
+                total_products = stream.count
+            
             # Final summary
             summary = {
                 "total": total_products,
                 "processed": processed,
                 "skipped": skipped,
                 "errors": errors,
+                "llm_requests": self.engine.requests,
+                "llm_retries": self.engine.retries,
+                "llm_calls_avoided": llm_calls_avoided,
+                "llm_tokens": self.engine.token_usage(),
+                "resumed_from": resumed_from,
                 "success": True
             }
+            if self.llm_cache is not None:
+                summary["cache"] = self.llm_cache.stats()
+            if self.batch_prompts > 1:
+                summary["batching"] = self.batch_stats.summary()
+            if delta is not None:
+                summary["delta"] = delta["counts"]
             
             logger.info("\nProcessing Complete:")
             logger.info(f"✓ Processed: {processed}")
             logger.info(f"→ Skipped: {skipped}")
             logger.info(f"✗ Errors: {errors}")
+            logger.info(f"LLM calls avoided by the classifier: {llm_calls_avoided}")
+            if self.llm_cache is not None:
+                logger.info(f"LLM cache: {self.llm_cache.hits} hits, {self.llm_cache.misses} misses")
+            self.metrics.flush()
             
             return summary
             
         except Exception as e:
             error_msg = f"Error processing file: {str(e)}"
             logger.error(error_msg)
+            self._stage_classifier = None
+            self.journal.auto_sync = True
+            try:
+                # Keep the checkpoint in step with what the commit makes durable
+                if save_checkpoint is not None:
+                    save_checkpoint()
+                self._commit()
+            except Exception as commit_error:
+                logger.error(f"Error compacting journal: {str(commit_error)}")
             return {
                 "total": 0,
                 "processed": 0,
@@ -529,11 +1344,12 @@ Responde SOLO con el JSON, sin texto adicional."""
                 "error": error_msg
             }
 
-def process_selected_file(file_path: str) -> dict:
+def process_selected_file(file_path: str, upload_id: str = None, resume: bool = False, source: str = None,
+                          **options) -> dict:
     """Process a selected file and return the results."""
     try:
-        processor = FileProcessor()
-        return processor.process_file(file_path)
+        processor = FileProcessor(**options)
+        return processor.process_file(file_path, upload_id=upload_id, resume=resume, source=source)
     except Exception as e:
         error_msg = f"Failed to initialize processor: {str(e)}"
         logger.error(error_msg)
@@ -546,15 +1362,272 @@ def process_selected_file(file_path: str) -> dict:
             "error": error_msg
         }
 
+def profile_startup(**options) -> dict:
+    """Time each startup phase and list the slowest top-level imports."""
+    timings = {"module_imports": _MODULE_LOADED - _MODULE_START}
+    
+    started = time.perf_counter()
+    processor = FileProcessor(**options)
+    timings["processor_init"] = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    processor._ensure_stores()
+    timings["load_stores"] = time.perf_counter() - started
+    
+    started = time.perf_counter()
+    try:
+        processor.llm
+    except Exception as e:
+        timings["llm_client_error"] = str(e)
+    timings["llm_client"] = time.perf_counter() - started
+    
+    # Ask a fresh interpreter for its import breakdown of this module and the LLM client
+    code = (
+        f"import sys; sys.path.insert(0, {str(Path(__file__).parent)!r}); import fileprocessing"
+        + ("; from langchain_community.llms import Ollama" if processor.llm_backend == "langchain" else "")
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|", 2)
+        # Top-level imports are the ones indented by a single space
+        if name.startswith(" ") and not name.startswith("  "):
+            imports.append((name.strip(), int(cumulative_us.strip()) / 1e6))
+    imports.sort(key=lambda entry: entry[1], reverse=True)
+    
+    return {
+        "phases": {phase: round(value, 4) if isinstance(value, float) else value for phase, value in timings.items()},
+        "slowest_imports": [{"module": name, "seconds": round(seconds, 4)} for name, seconds in imports[:15]]
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Categorize supermarket export files with the local LLM.")
+    parser.add_argument("file_paths", nargs="*", metavar="file_path",
+                        help="Upload files to process; several files are ingested as one batch")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Maximum number of LLM requests in flight")
+    parser.add_argument("--request-timeout", type=int, default=120,
+                        help="Per-request LLM timeout in seconds")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes that prepare and categorize uploads in parallel in batch mode")
+    parser.add_argument("--llm-budget", type=int,
+                        help="LLM requests in flight across all batch workers (defaults to --concurrency)")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="With --worker and --workers, most queued uploads taken as one batch")
+    parser.add_argument("--prompt-tokens", type=int, default=384,
+                        help="Token budget of a categorization prompt; sets the model's context window")
+    parser.add_argument("--batch-prompts", type=int, default=1, metavar="K",
+                        help="Categorize up to K products per prompt (fewer when they do not fit the context)")
+    parser.add_argument("--batch-compare-every", type=int, default=20, metavar="N",
+                        help="With --batch-prompts, also ask one in N batched products alone to measure agreement")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="Retries for a failed LLM request")
+    parser.add_argument("--stream-responses", action="store_true",
+                        help="Stream LLM answers and stop each one at the end of its JSON; "
+                             "answers that are clearly not JSON are retried at once")
+    parser.add_argument("--json-format", action="store_true",
+                        help="Ask Ollama for JSON-constrained output (single-product prompts only)")
+    parser.add_argument("--llm-backend", choices=["langchain", "http"], default="langchain",
+                        help="Ollama client: LangChain, or a direct HTTP client without the langchain import")
+    parser.add_argument("--ollama-url", default=os.environ.get("OLLAMA_HOST", DEFAULT_OLLAMA_URL),
+                        help="Base URL of the Ollama server")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print a startup and import-time breakdown and exit")
+    parser.add_argument("--upload-id",
+                        help="Upload id used to key checkpoints (defaults to the file name)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the checkpoint of an interrupted run of the same file")
+    parser.add_argument("--checkpoint-every", type=int, default=50,
+                        help="Products between checkpoints")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Load the whole upload file into memory instead of streaming it")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always ask the LLM instead of reusing cached responses")
+    parser.add_argument("--cache-max-mb", type=int, default=256,
+                        help="Size limit of the LLM response cache")
+    parser.add_argument("--cache-invalid", action="store_true",
+                        help="Also cache responses that fail validation instead of asking again next time")
+    parser.add_argument("--no-classifier", action="store_true",
+                        help="Send every product to the LLM for categorization")
+    parser.add_argument("--classifier-threshold", type=float, default=0.9,
+                        help="Minimum classifier confidence to skip the LLM")
+    parser.add_argument("--evaluate-classifier", action="store_true",
+                        help="Measure classifier agreement with stored LLM labels and exit")
+    parser.add_argument("--label-existing", action="store_true",
+                        help="Categorize stored products that have no category with the LLM, train the classifier and exit")
+    parser.add_argument("--worker", action="store_true",
+                        help="Stay resident and process queued uploads from uploads.json")
+    parser.add_argument("--uploads-file", default=os.environ.get("UPLOADS_FILE", "database/uploads.json"),
+                        help="Upload list shared with the web app (UPLOADS_FILE, relative to the working directory)")
+    parser.add_argument("--heartbeat-file", default=os.environ.get("WORKER_HEARTBEAT_FILE", "app/database/worker_heartbeat.json"),
+                        help="Worker heartbeat read by the web app (WORKER_HEARTBEAT_FILE)")
+    parser.add_argument("--once", action="store_true",
+                        help="With --worker, exit once the queue is empty")
+    parser.add_argument("--poll-interval", type=float, default=2.0,
+                        help="Seconds between queue checks while idle")
+    parser.add_argument("--near-duplicates", action="store_true",
+                        help="Also skip near-duplicate names of the same brand and store, and link them across stores")
+    parser.add_argument("--near-threshold", type=float, default=0.8,
+                        help="Minimum name similarity (Jaccard of character shingles) of near duplicates")
+    parser.add_argument("--dedupe-products", action="store_true",
+                        help="Remove duplicates and near duplicates from the stored products, link cross-store matches and exit")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="With --dedupe-products, only report what would be removed and linked")
+    parser.add_argument("--benchmark-near-duplicates", type=int, metavar="N",
+                        help="Time the near-duplicate index on N generated names and check its recall")
+    parser.add_argument("--delta", action="store_true",
+                        help="Only categorize products new or changed since the last upload of the same source; "
+                             "apply price-only changes in place")
+    parser.add_argument("--source",
+                        help="Source name for --delta (default: the file name without its trailing date)")
+    parser.add_argument("--no-summary", action="store_true",
+                        help="Do not update app/database/catalogue_summary.json after an ingest")
+    parser.add_argument("--rebuild-summary", action="store_true",
+                        help="Parse every unit price again and rewrite catalogue_summary.json, then exit")
+    parser.add_argument("--metrics-format", choices=["jsonl", "prometheus", "none"], default="jsonl",
+                        help="Write stage timings and counters to app/database/metrics.jsonl or metrics.prom")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="Seconds between metrics writes")
+    parser.add_argument("--metrics-max-mb", type=int, default=5,
+                        help="Size at which metrics.jsonl is rotated to metrics.jsonl.1 (three rotations are kept)")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING"], default="INFO",
+                        help="DEBUG also logs every product's outcome")
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json",
+                        help="Keep the catalogue in the JSON files or in app/database/catalogue.sqlite")
+    parser.add_argument("--compact-products", action="store_true",
+                        help="With --storage json, hold products in a column store instead of one dict each")
+    parser.add_argument("--mirror-json", action="store_true",
+                        help="With --storage sqlite, also write the JSON files after each run")
+    parser.add_argument("--import-json", action="store_true",
+                        help="Replace the SQLite catalogue with the contents of the JSON files and exit")
+    parser.add_argument("--export-json", action="store_true",
+                        help="Write the SQLite catalogue out to the JSON files and exit")
+    args = parser.parse_args(argv)
+    if not args.file_paths and not (args.worker or args.profile_startup or
+                                   args.evaluate_classifier or args.label_existing or args.import_json or args.export_json or
+                                   args.dedupe_products or args.benchmark_near_duplicates or
+                                   args.rebuild_summary):
+        parser.error("file_path is required")
+    if len(args.file_paths) > 1 and (args.upload_id or args.resume or args.source):
+        parser.error("--upload-id, --resume and --source apply to a single file")
+    if args.delta and (len(args.file_paths) > 1 or args.workers > 1):
+        parser.error("--delta applies to single-file runs")
+    return args
+
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python fileprocessing.py <file_path>")
-        sys.exit(1)
+    args = parse_args()
+    configure_logging(getattr(logging, args.log_level))
+    
+    if args.benchmark_near_duplicates:
+        result = benchmark_near_duplicates(size=args.benchmark_near_duplicates, threshold=args.near_threshold)
+        print_result(result)
+        sys.exit(0)
+    
+    if args.dedupe_products:
+        processor = FileProcessor(storage=args.storage, mirror_json=args.mirror_json, use_cache=False,
+                                  use_classifier=False, near_threshold=args.near_threshold,
+                                  compact_products=args.compact_products)
+        result = processor.dedupe_catalogue(dry_run=args.dry_run)
+        print_result(result)
+        sys.exit(0)
+    
+    if args.rebuild_summary:
+        processor = FileProcessor(storage=args.storage, use_cache=False, use_classifier=False,
+                                  compact_products=args.compact_products)
+        summary = processor.update_summary(rebuild=True)
+        print_result({"products": summary["products"], "unit_prices": summary["unit_prices"],
+                      "unparsed_unit_prices": summary["unparsed_unit_prices"], "success": True}
+                     if summary else {"success": False})
+        sys.exit(0 if summary else 1)
+    
+    if args.import_json or args.export_json:
+        processor = FileProcessor(storage="sqlite", use_cache=False, use_classifier=False)
+        if args.import_json:
+            result = processor.store.import_json(processor.categories_file, processor.products_file, processor.brands_file)
+        else:
+            result = processor.export_json()
+        print_result(result)
+        sys.exit(0)
+    
+    if args.evaluate_classifier:
+        processor = FileProcessor(use_classifier=False, storage=args.storage)
+        result = evaluate_classifier(processor.products["products"], threshold=args.classifier_threshold)
+        print_result(result)
+        sys.exit(0)
         
-    file_path = sys.argv[1]
-    if not os.path.exists(file_path):
-        print(f"Error: File not found: {file_path}")
-        sys.exit(1)
+    options = dict(
+        concurrency=args.concurrency,
+        request_timeout=args.request_timeout,
+        max_retries=args.retries,
+        use_cache=not args.no_cache,
+        cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+        cache_validated_only=not args.cache_invalid,
+        stream_input=not args.no_stream,
+        use_classifier=not args.no_classifier,
+        classifier_threshold=args.classifier_threshold,
+        llm_backend=args.llm_backend,
+        ollama_url=args.ollama_url,
+        checkpoint_every=args.checkpoint_every,
+        storage=args.storage,
+        mirror_json=args.mirror_json,
+        prompt_token_budget=args.prompt_tokens,
+        batch_prompts=args.batch_prompts,
+        batch_compare_every=args.batch_compare_every,
+        near_duplicates=args.near_duplicates,
+        near_threshold=args.near_threshold,
+        metrics_format=args.metrics_format,
+        metrics_interval=args.metrics_interval,
+        metrics_max_bytes=args.metrics_max_mb * 1024 * 1024,
+        compact_products=args.compact_products,
+        catalogue_summary=not args.no_summary,
+        delta=args.delta,
+        stream_responses=args.stream_responses,
+        json_format=args.json_format
+    )
+    
+    if args.profile_startup:
+        print_result(profile_startup(**options))
+        sys.exit(0)
+    
+    if args.label_existing:
+        processor = FileProcessor(**options)
+        result = processor.label_products()
+        print_result(result)
+        sys.exit(0)
+    
+    llm_budget = args.llm_budget or args.concurrency
+    
+    if args.worker:
+        processor = FileProcessor(**options)
+        worker = QueueWorker(
+            processor,
+            uploads_file=processor.base_dir / args.uploads_file,
+            heartbeat_file=processor.base_dir / args.heartbeat_file,
+            poll_interval=args.poll_interval,
+            ingest=ShardedIngest(processor, options, workers=args.workers, llm_budget=llm_budget) if args.workers > 1 else None,
+            batch_size=args.batch_size
+        )
+        jobs = worker.run(once=args.once)
+        print_result({"jobs": jobs, "success": True})
+        sys.exit(0)
+    
+    for file_path in args.file_paths:
+        if not os.path.exists(file_path):
+            print(f"Error: File not found: {file_path}")
+            sys.exit(1)
+    
+    if len(args.file_paths) > 1:
+        processor = FileProcessor(**options)
+        ingest = ShardedIngest(processor, options, workers=args.workers, llm_budget=llm_budget)
+        results = ingest.run([(path, path) for path in args.file_paths])
+        print_result(results)
+        sys.exit(0 if all(result["success"] for result in results.values()) else 1)
         
-    result = process_selected_file(file_path)
-    print(json.dumps(result, indent=2)) 
\ No newline at end of file
+    result = process_selected_file(args.file_paths[0], upload_id=args.upload_id, resume=args.resume,
+                                   source=args.source, **options)
+    print_result(result)
@@ -0,0 +1,172 @@
+import json
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_row(row: dict, compact: json.JSONEncoder, indented: json.JSONEncoder) -> str:
+    """indented.encode(row) for a flat row, built from the C-accelerated compact encoder."""
+    if not row:
+        return "{}"
+    lines = []
+    for key, value in row.items():
+        if isinstance(value, list) and value and not any(isinstance(item, (list, dict)) for item in value):
+            text = "[\n" + ",\n".join("    " + compact.encode(item) for item in value) + "\n  ]"
+        elif isinstance(value, (list, dict)) and value:
+            text = indented.encode(value).replace("\n", "\n  ")
+        else:
+            text = compact.encode(value)
+        lines.append(f"  {compact.encode(key)}: {text}")
+    return "{\n" + ",\n".join(lines) + "\n}"
+
+
+def _dump_rows(data: dict, rows_key: str, f) -> None:
+    """json.dump(data, f, indent=2) that encodes data[rows_key] one row at a time.
+
+    The rows may be any iterable of mappings (e.g. a ProductTable); the
+    output is the same as dumping them as a list of dicts.
+    """
+    compact = json.JSONEncoder(ensure_ascii=False)
+    indented = json.JSONEncoder(indent=2, ensure_ascii=False)
+    f.write("{")
+    for index, (key, value) in enumerate(data.items()):
+        f.write(("," if index else "") + "\n  " + compact.encode(key) + ": ")
+        if key != rows_key:
+            f.write(indented.encode(value).replace("\n", "\n  "))
+            continue
+        empty = True
+        for row in value:
+            row = row if isinstance(row, dict) else row.copy()
+            encoded = _encode_row(row, compact, indented).replace("\n", "\n    ")
+            f.write(("," if not empty else "[") + "\n    " + encoded)
+            empty = False
+        f.write("[]" if empty else "\n  ]")
+    f.write("\n}" if data else "}")
+
+
+def atomic_write_json(path: Path, data, rows_key: str = None) -> None:
+    """Write JSON to path via a temp file and rename so readers never see a partial file.
+
+    With rows_key, data[rows_key] is written row by row (see _dump_rows).
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if rows_key is None:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+            else:
+                _dump_rows(data, rows_key, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    # Persist the rename itself where the platform allows it
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+
+
+class ProductJournal:
+    """Append-only JSON Lines journal of accepted products, new category paths and new brands.
+
+    Records are buffered and fsync'd once `fsync_every` records are pending or
+    `fsync_interval` seconds have passed since the last sync, whichever comes first.
+    With `auto_sync` off the caller applies that policy itself through
+    sync_due(), so that syncs only happen where it can record its progress.
+    """
+
+    def __init__(self, path: Path, fsync_every: int = 50, fsync_interval: float = 1.0,
+                 max_bytes: int = 8 * 1024 * 1024):
+        self.path = Path(path)
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self._file = None
+        self._size = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self.auto_sync = True
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._size = self.path.stat().st_size
+        return self._file
+
+    def append(self, kind: str, data) -> None:
+        """Append one record and sync it according to the fsync policy."""
+        f = self._open()
+        line = json.dumps({"type": kind, "data": data}, ensure_ascii=False) + "\n"
+        f.write(line)
+        self._size += len(line.encode('utf-8'))
+        self._pending += 1
+
+        if self.auto_sync and self.sync_due():
+            self.sync()
+
+    def sync_due(self) -> bool:
+        return (self._pending >= self.fsync_every or
+                (self._pending > 0 and time.monotonic() - self._last_sync >= self.fsync_interval))
+
+    def sync(self) -> None:
+        """Flush buffered records to disk."""
+        if self._file is None or self._pending == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def size(self) -> int:
+        """Bytes in the journal, counting records still buffered; does not flush them."""
+        if self._file is not None:
+            return self._size
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def is_full(self) -> bool:
+        return self.size() >= self.max_bytes
+
+    def replay(self):
+        """Yield (type, data) for every complete record left by a previous run."""
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a torn final line; everything before it is intact
+                    logger.warning(f"Ignoring truncated journal record at line {line_number}")
+                    break
+                yield record["type"], record["data"]
+
+    def truncate(self) -> None:
+        """Discard all records once they have been compacted into the canonical files."""
+        self.close()
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,107 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class InvalidJSONStream(ValueError):
+    """A streamed LLM answer that cannot become the expected JSON; the request is retried at once."""
+
+    retry_immediately = True
+
+
+class JSONStreamScanner:
+    """Incremental scanner for the first JSON object or array in a token stream.
+
+    feed() takes the text chunks as they arrive and returns True once a
+    complete value has been seen, so generation can be stopped there
+    instead of waiting for the model to finish. It raises
+    InvalidJSONStream as soon as the text clearly is not JSON: more than
+    `max_preamble` characters of prose before the value (a Markdown fence
+    is allowed), or a closing bracket that does not match.
+    """
+
+    def __init__(self, max_preamble: int = 80):
+        self.max_preamble = max_preamble
+        self.text = []
+        self.length = 0
+        self.start = None
+        self.end = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> bool:
+        offset = self.length
+        self.text.append(chunk)
+        self.length += len(chunk)
+        for index, char in enumerate(chunk, offset):
+            if self.start is None:
+                if char in _CLOSERS:
+                    self.start = index
+                    self._stack.append(_CLOSERS[char])
+                elif index >= self.max_preamble:
+                    raise InvalidJSONStream(f"No JSON after {index} characters")
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(_CLOSERS[char])
+            elif char in "}]":
+                if char != self._stack.pop():
+                    raise InvalidJSONStream(f"Unbalanced '{char}' at character {index}")
+                if not self._stack:
+                    self.end = index + 1
+                    return True
+        return False
+
+    def value_text(self) -> str:
+        """The complete JSON text, checked to decode; raises InvalidJSONStream otherwise."""
+        if self.end is None:
+            raise InvalidJSONStream("Stream ended before the JSON was complete")
+        text = "".join(self.text)[self.start:self.end]
+        try:
+            json.loads(text)
+        except json.JSONDecodeError as e:
+            raise InvalidJSONStream(f"Streamed JSON does not decode: {str(e)}")
+        return text
+
+
+def read_json_stream(chunks, max_preamble: int = 80, lookahead: int = 2) -> tuple:
+    """Consume a completion stream up to its first complete JSON value.
+
+    Returns (JSON text, chunks read, whether generation was stopped early).
+    The stream is closed as soon as the value is complete or found invalid,
+    which ends the request and the generation behind it. A stream that ends
+    within `lookahead` chunks of the value (Ollama's final chunk is empty)
+    finished on its own and does not count as stopped early.
+    """
+    scanner = JSONStreamScanner(max_preamble=max_preamble)
+    iterator = iter(chunks)
+    count = 0
+    stopped = False
+    try:
+        for chunk in iterator:
+            count += 1
+            if scanner.feed(chunk):
+                for _ in range(lookahead):
+                    if next(iterator, None) is None:
+                        break
+                    count += 1
+                else:
+                    stopped = True
+                break
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+    return scanner.value_text(), count, stopped
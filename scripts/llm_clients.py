@@ -0,0 +1,86 @@
+import json
+import logging
+import threading
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+
+class OllamaHTTPClient:
+    """Minimal Ollama client over the /api/generate endpoint.
+
+    Exposes the same `invoke(prompt) -> str` call as the LangChain client
+    but only needs the standard library, so it starts without importing
+    langchain, pydantic or aiohttp. The prompt and completion token counts
+    Ollama reports for the calling thread's last request are in `last_usage`.
+    With json_format Ollama constrains the output to a JSON object.
+    """
+
+    def __init__(self, model: str, base_url: str = DEFAULT_OLLAMA_URL, timeout: int = 120,
+                 json_format: bool = False, **options):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.json_format = json_format
+        self.options = options
+        self._usage = threading.local()
+
+    @property
+    def last_usage(self):
+        """(prompt tokens, completion tokens) of this thread's last request, if Ollama reported them."""
+        return getattr(self._usage, "value", None)
+
+    def _request(self, prompt: str, stream: bool) -> urllib.request.Request:
+        body = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": self.options
+        }
+        if self.json_format:
+            body["format"] = "json"
+        return urllib.request.Request(
+            f"{self.base_url}/api/generate",
+            data=json.dumps(body).encode('utf-8'),
+            headers={"Content-Type": "application/json"}
+        )
+
+    def _set_usage(self, body: dict) -> None:
+        # prompt_eval_count is left out when Ollama reuses a cached prompt
+        if "eval_count" in body and "prompt_eval_count" in body:
+            self._usage.value = (body["prompt_eval_count"], body["eval_count"])
+        else:
+            self._usage.value = None
+
+    def invoke(self, prompt: str) -> str:
+        with urllib.request.urlopen(self._request(prompt, stream=False), timeout=self.timeout) as response:
+            body = json.loads(response.read().decode('utf-8'))
+        self._set_usage(body)
+        return body["response"]
+
+    def stream(self, prompt: str):
+        """Yield the completion token by token; closing the generator drops the connection,
+        which makes Ollama stop generating."""
+        self._usage.value = None
+        with urllib.request.urlopen(self._request(prompt, stream=True), timeout=self.timeout) as response:
+            # One JSON object per line; the last one has done set and the token counts
+            for line in response:
+                chunk = json.loads(line)
+                if chunk.get("done"):
+                    self._set_usage(chunk)
+                yield chunk.get("response", "")
+
+
+def create_client(backend: str, model: str, params: dict, timeout: int, base_url: str = DEFAULT_OLLAMA_URL,
+                  json_format: bool = False):
+    """Build the Ollama client for backend, importing LangChain only when it is asked for."""
+    if backend == "http":
+        return OllamaHTTPClient(model, base_url=base_url, timeout=timeout, json_format=json_format, **params)
+    if backend == "langchain":
+        from langchain_community.llms import Ollama
+        if json_format:
+            params = dict(params, format="json")
+        return Ollama(model=model, base_url=base_url, timeout=timeout, **params)
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,182 @@
+import time
+import random
+import logging
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from json_stream import read_json_stream
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about three characters per token for Spanish product text."""
+    return (len(text) + 2) // 3
+
+
+class LLMRequestEngine:
+    """Runs LLM-bound work with a bounded number of requests in flight.
+
+    Work items are submitted to a thread pool but results are handed back in
+    input order, so the caller can keep a single writer for everything that
+    touches the stores. At most `max_in_flight` items are pending at once;
+    the input iterator is not advanced further until the oldest one is done.
+    The LLM client is only built, through `client_factory`, on the first request.
+    An optional `budget` semaphore, shared between processes, caps the
+    requests in flight across all engines that hold it.
+
+    With `stream` the answer is read token by token from clients that have
+    a stream() method and cut off at the end of its first JSON value;
+    streams that are clearly not JSON are abandoned and retried at once.
+    """
+
+    def __init__(self, client_factory, max_in_flight: int = 1, max_retries: int = 2,
+                 backoff: float = 1.0, max_backoff: float = 30.0, budget=None, stream: bool = False):
+        self.client_factory = client_factory
+        self._llm = None
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max(0, max_retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.stream = stream
+        self.requests = 0
+        self.retries = 0
+        self._reset_tokens()
+        self._lock = threading.Lock()
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = self.client_factory()
+        return self._llm
+
+    @llm.setter
+    def llm(self, client):
+        self._llm = client
+
+    def _reset_tokens(self) -> None:
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.max_prompt_tokens = 0
+        self.measured_calls = 0
+        # Generation per categorized product, and how streamed answers ended
+        self.products = 0
+        self.generation_seconds = 0.0
+        self.stopped_early = 0
+        self.aborted_streams = 0
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.retries = 0
+            self._reset_tokens()
+
+    def _record_tokens(self, prompt: str, response: str, streamed_tokens: int = None,
+                       seconds: float = 0.0, items: int = 1) -> None:
+        # Clients that report Ollama's own counts expose them per thread as last_usage
+        usage = getattr(self.llm, "last_usage", None)
+        if usage:
+            prompt_tokens, completion_tokens = usage
+        elif streamed_tokens is not None:
+            # A stream cut short never gets Ollama's counts; each chunk is one token
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), streamed_tokens
+        else:
+            prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(response)
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+            if usage:
+                self.measured_calls += 1
+            self.products += items
+            self.generation_seconds += seconds
+        logger.debug(f"LLM answer for {items} product(s): {completion_tokens} tokens in {seconds:.2f}s")
+
+    def token_usage(self) -> dict:
+        """Prompt and completion tokens of the successful calls since the last reset."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "prompt_tokens_per_call": round(self.prompt_tokens / self.calls, 1) if self.calls else 0,
+                "completion_tokens_per_call": round(self.completion_tokens / self.calls, 1) if self.calls else 0,
+                "max_prompt_tokens": self.max_prompt_tokens,
+                "measured_calls": self.measured_calls,
+                "completion_tokens_per_product": round(self.completion_tokens / self.products, 1) if self.products else 0,
+                "seconds_per_product": round(self.generation_seconds / self.products, 3) if self.products else 0,
+                "streamed_stopped_early": self.stopped_early,
+                "streams_aborted": self.aborted_streams
+            }
+
+    def _complete(self, prompt: str) -> tuple:
+        """(answer, streamed tokens or None) for one request."""
+        llm = self.llm
+        if not self.stream or not hasattr(llm, "stream"):
+            return llm.invoke(prompt), None
+        response, tokens, stopped = read_json_stream(llm.stream(prompt))
+        if stopped:
+            with self._lock:
+                self.stopped_early += 1
+        return response, tokens
+
+    def invoke(self, prompt: str, items: int = 1) -> str:
+        """Call the LLM for items products, retrying failed requests with jittered exponential backoff."""
+        attempt = 0
+        while True:
+            with self._lock:
+                self.requests += 1
+            try:
+                with self.budget or nullcontext():
+                    started = time.perf_counter()
+                    response, streamed_tokens = self._complete(prompt)
+                    seconds = time.perf_counter() - started
+                self._record_tokens(prompt, response, streamed_tokens, seconds, items)
+                return response
+            except Exception as e:
+                retry_immediately = getattr(e, "retry_immediately", False)
+                if retry_immediately:
+                    with self._lock:
+                        self.aborted_streams += 1
+                if attempt >= self.max_retries:
+                    raise
+                # The server is fine when only the answer was bad, so there is nothing to back off from
+                delay = 0.0 if retry_immediately else random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                logger.warning(f"LLM request failed ({str(e)}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def map_ordered(self, fn, items):
+        """Yield (item, result, error) for every item, in input order."""
+        if self.max_in_flight == 1:
+            for item in items:
+                try:
+                    yield item, fn(item), None
+                except Exception as e:
+                    yield item, None, e
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending = deque()
+            for item in items:
+                if len(pending) >= self.max_in_flight:
+                    yield self._collect(pending.popleft())
+                pending.append((item, executor.submit(fn, item)))
+            while pending:
+                yield self._collect(pending.popleft())
+
+    @staticmethod
+    def _collect(entry):
+        item, future = entry
+        try:
+            return item, future.result(), None
+        except Exception as e:
+            return item, None, e
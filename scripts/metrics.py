@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds in seconds, from an index lookup to a slow LLM answer
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets; counts[-1] holds values above the last bound."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile by interpolating inside its bucket, as Prometheus does."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def state(self) -> dict:
+        return {"count": self.count, "sum": self.sum, "max": self.max, "counts": list(self.counts)}
+
+    def merge(self, state: dict) -> None:
+        self.count += state["count"]
+        self.sum += state["sum"]
+        self.max = max(self.max, state["max"])
+        self.counts = [a + b for a, b in zip(self.counts, state["counts"])]
+
+
+class PipelineMetrics:
+    """Counters and per-stage latency histograms of the ingest pipeline.
+
+    Stages are timed with timer() or observe(), from any thread. Every
+    `interval` seconds maybe_flush() writes the totals since start to `path`,
+    either appended as one JSON line or as a Prometheus text-format file that
+    replaces the previous one. With path None nothing is written.
+
+    Like logging's RotatingFileHandler, a JSON lines file that would grow past
+    `max_bytes` is renamed to <path>.1 (older ones shifting up to
+    <path>.<backup_count>) and a new one is started.
+    """
+
+    def __init__(self, path: Path = None, fmt: str = "jsonl", interval: float = 10.0,
+                 max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        if fmt not in ("jsonl", "prometheus"):
+            raise ValueError(f"Unknown metrics format: {fmt}")
+        self.path = Path(path) if path is not None else None
+        self.fmt = fmt
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = {}
+            self.stages = {}
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def timed(self, stage: str, iterator):
+        """Yield from iterator, timing how long each item takes to produce."""
+        iterator = iter(iterator)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - started)
+            yield item
+
+    def state(self) -> dict:
+        """Raw counters and histograms, e.g. to send from a pool worker to merge()."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {stage: histogram.state() for stage, histogram in self.stages.items()}
+            }
+
+    def merge(self, state: dict) -> None:
+        with self._lock:
+            for name, value in state["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for stage, histogram_state in state["stages"].items():
+                self.stages.setdefault(stage, Histogram()).merge(histogram_state)
+
+    def summary(self) -> dict:
+        """Counters plus count, total and p50/p95/max milliseconds per stage."""
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "stages": {
+                    stage: {
+                        "count": histogram.count,
+                        "seconds": round(histogram.sum, 4),
+                        "mean_ms": round(histogram.sum / histogram.count * 1000, 3) if histogram.count else 0,
+                        "p50_ms": round(histogram.quantile(0.5) * 1000, 3),
+                        "p95_ms": round(histogram.quantile(0.95) * 1000, 3),
+                        "max_ms": round(histogram.max * 1000, 3)
+                    }
+                    for stage, histogram in self.stages.items()
+                }
+            }
+
+    def _prometheus_text(self) -> str:
+        lines = ["# HELP ingest_events_total Ingest pipeline events.", "# TYPE ingest_events_total counter"]
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'ingest_events_total{{event="{name}"}} {value}')
+            lines.append("# HELP ingest_stage_seconds Time spent in each pipeline stage.")
+            lines.append("# TYPE ingest_stage_seconds histogram")
+            for stage, histogram in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'ingest_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'ingest_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'ingest_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'ingest_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+    def flush(self) -> None:
+        """Write the metrics now."""
+        self._last_flush = time.monotonic()
+        if self.path is None:
+            return
+        try:
+            if self.fmt == "jsonl":
+                record = dict(self.summary(), time=datetime.now().isoformat(timespec="seconds"), pid=os.getpid())
+                line = json.dumps(record) + "\n"
+                if self._size() + len(line.encode('utf-8')) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+            else:
+                # Scrapers must never read a half-written file
+                tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(self._prometheus_text())
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Error writing metrics: {str(e)}")
+
+    def _size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _rotate(self) -> None:
+        """Shift metrics.jsonl to metrics.jsonl.1 and the older snapshots up, dropping the oldest."""
+        if self.backup_count < 1:
+            self.path.unlink(missing_ok=True)
+            return
+        for number in range(self.backup_count - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{number}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{number + 1}"))
+        if self.path.exists():
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+
+    def maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
@@ -0,0 +1,250 @@
+import re
+import json
+import time
+import zlib
+import random
+import logging
+from pathlib import Path
+from journal import atomic_write_json
+from category_classifier import normalize_text
+from dedup_index import DedupIndex
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def name_tokens(name: str) -> list:
+    return _TOKEN.findall(normalize_text(name))
+
+
+def shingles(tokens: list, k: int = 3) -> set:
+    """Hashed character k-grams of each token, so word order does not matter."""
+    result = set()
+    for token in tokens:
+        padded = f" {token} "
+        for i in range(max(1, len(padded) - k + 1)):
+            result.add(zlib.crc32(padded[i:i + k].encode('utf-8')))
+    return result
+
+
+def quantities(tokens: list) -> frozenset:
+    """Numeric tokens of a name; near duplicates must agree on them (500 g is not 1 kg)."""
+    return frozenset(t for t in tokens if t.isdigit())
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """MinHash/LSH index over product names for near-duplicate lookups.
+
+    Names are reduced to order-independent character shingles and a MinHash
+    signature of `num_perm` values, split into `bands`. Only names of the
+    same brand and numeric tokens sharing a band with the query become
+    candidates, so a lookup touches a handful of entries instead of the
+    whole catalogue. Candidates are then confirmed with the exact shingle
+    Jaccard similarity against `threshold`.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 32, bands: int = 8, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        # Each signature value is the minimum of the shingle hashes XORed with its own random mask
+        self._masks = [rng.getrandbits(32) for _ in range(num_perm)]
+        self._tables = [{} for _ in range(bands)]
+        # (name, store, ref) per indexed product
+        self.entries = []
+
+    def signature(self, shingle_set: set) -> list:
+        hashes = list(shingle_set) or [0]
+        return [min([h ^ mask for h in hashes]) for mask in self._masks]
+
+    def _band_keys(self, tokens: list, brand: str):
+        # Bands are keyed by brand and numeric tokens too, so candidates always agree on both
+        signature = self.signature(shingles(tokens))
+        prefix = (brand, quantities(tokens))
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, hash((prefix, *signature[band * rows:(band + 1) * rows]))
+
+    def add(self, name: str, brand: str, store: str, ref=None) -> int:
+        """Index a product name; ref is returned with matches (e.g. the product's identity)."""
+        entry_id = len(self.entries)
+        self.entries.append((name, store, ref))
+        for band, key in self._band_keys(name_tokens(name), brand):
+            self._tables[band].setdefault(key, []).append(entry_id)
+        return entry_id
+
+    def candidates(self, name: str, brand: str) -> set:
+        """Entry ids of brand sharing at least one LSH band with name."""
+        found = set()
+        for band, key in self._band_keys(name_tokens(name), brand):
+            found.update(self._tables[band].get(key, ()))
+        return found
+
+    def query(self, name: str, brand: str) -> list:
+        """Return (store, similarity, ref) of indexed products that are near duplicates of name."""
+        query_shingles = shingles(name_tokens(name))
+        matches = []
+        for entry_id in sorted(self.candidates(name, brand)):
+            entry_name, entry_store, ref = self.entries[entry_id]
+            similarity = jaccard(query_shingles, shingles(name_tokens(entry_name)))
+            if similarity >= self.threshold:
+                matches.append((entry_store, round(similarity, 3), ref))
+        return matches
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def product_ref(product: dict) -> dict:
+    """Identity of a product inside a link record."""
+    return {"nombre": product["nombre"], "tienda": product["tienda"], "url": product.get("url", "")}
+
+
+class ProductLinks:
+    """"Same product" links between stores, kept in product_links.json."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.links = []
+        self.dirty = False
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.links = json.load(f).get("links", [])
+        self._keys = {self._key(link) for link in self.links}
+
+    @staticmethod
+    def _key(link: dict) -> tuple:
+        return tuple(sorted((ref["tienda"], ref["nombre"], ref.get("url", "")) for ref in link["productos"]))
+
+    def add(self, link: dict) -> bool:
+        """Add a link unless the same pair is already linked; return whether it was added."""
+        key = self._key(link)
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self.links.append(link)
+        self.dirty = True
+        return True
+
+    def save(self) -> None:
+        atomic_write_json(self.path, {"links": self.links})
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.links)
+
+
+def dedupe_products(products, normalize_brand, threshold: float = 0.8) -> dict:
+    """Find duplicates and cross-store matches in an existing product list, in list order.
+
+    A product is dropped when an earlier one is an exact duplicate (the
+    DedupIndex rules) or a near duplicate with the same brand in the same
+    store. Near duplicates in other stores are kept and linked instead.
+    """
+    exact = DedupIndex(normalize_brand)
+    near = NearDuplicateIndex(threshold=threshold)
+    kept = []
+    removed = []
+    links = []
+
+    for product in products:
+        brand = normalize_brand(product["marca"]).lower()
+        store = product["tienda"].lower().strip()
+        matches = near.query(product["nombre"], brand)
+        if exact.match(product) is not None or any(match_store == store for match_store, _, _ in matches):
+            removed.append(product)
+            continue
+        for match_store, similarity, ref in matches:
+            links.append({"productos": [ref, product_ref(product)], "similitud": similarity})
+        exact.add(product)
+        near.add(product["nombre"], brand, store, product_ref(product))
+        kept.append(product)
+
+    return {"kept": kept, "removed": removed, "links": links}
+
+
+def generate_names(size: int, seed: int = 0) -> list:
+    """(name, brand, store) triples where many products reappear, reworded, in other stores."""
+    rng = random.Random(seed)
+    brands = ["PULEVA", "NESTLÉ", "DANONE", "KAIKU", "PASCUAL", "HERO", "GALLO", "MAHOU", "FONT VELLA", "ALCAMPO"]
+    items = ["leche semidesnatada", "batido de cacao", "yogur natural", "zumo de naranja", "agua mineral",
+             "galletas maría", "tomate frito", "cerveza lager", "espaguetis", "papilla de frutas"]
+    variants = ["", "sin lactosa", "ecológico", "desnatado", "con calcio", "light", "clásico", "familiar"]
+    packs = ["pack {n} x 200 ml", "botella {n} l", "paquete {n}00 g", "pack {n} latas 33 cl", "tarro {n}50 g"]
+    stores = ["alcampo", "elcorteingles", "carrefour"]
+
+    names = []
+    while len(names) < size:
+        brand = rng.choice(brands)
+        words = [brand, rng.choice(items), rng.choice(variants), rng.choice(packs).format(n=rng.randint(1, 12))]
+        base = " ".join(w for w in words if w)
+        for store in rng.sample(stores, rng.randint(1, 3)):
+            name = base
+            roll = rng.random()
+            if roll < 0.3:
+                # Brand moved to the end, as some stores write it
+                name = f"{base[len(brand) + 1:]} {brand}"
+            elif roll < 0.5:
+                name = base.upper()
+            names.append((name, brand.lower(), store))
+    return names[:size]
+
+
+def benchmark(size: int = 100_000, probes: int = 500, threshold: float = 0.8, seed: int = 0) -> dict:
+    """Time the LSH index on size generated names and check its recall on probes.
+
+    Recall is measured against an exhaustive Jaccard scan over the products
+    the match rules allow (same brand, same numeric tokens); a naive lookup
+    would compare each name with all size entries instead of the candidates.
+    """
+    names = generate_names(size, seed)
+    index = NearDuplicateIndex(threshold=threshold)
+    started = time.perf_counter()
+    for entry_id, (name, brand, store) in enumerate(names):
+        index.add(name, brand, store, entry_id)
+    build_seconds = time.perf_counter() - started
+
+    # Exhaustive reference, restricted to the groups a match could come from
+    groups = {}
+    for entry_id, (name, brand, store) in enumerate(names):
+        tokens = name_tokens(name)
+        groups.setdefault((brand, quantities(tokens)), []).append((entry_id, shingles(tokens)))
+
+    rng = random.Random(seed + 1)
+    found = expected = candidates = 0
+    lsh_seconds = 0.0
+    for name, brand, store in rng.sample(names, min(probes, size)):
+        started = time.perf_counter()
+        candidates += len(index.candidates(name, brand))
+        matches = {ref for _, _, ref in index.query(name, brand)}
+        lsh_seconds += time.perf_counter() - started
+
+        tokens = name_tokens(name)
+        probe_shingles = shingles(tokens)
+        reference = {
+            entry_id for entry_id, entry_shingles in groups[(brand, quantities(tokens))]
+            if jaccard(probe_shingles, entry_shingles) >= threshold
+        }
+
+        expected += len(reference)
+        found += len(reference & matches)
+
+    return {
+        "names": size,
+        "build_seconds": round(build_seconds, 2),
+        "probes": probes,
+        "query_ms": round(lsh_seconds / probes * 1000, 3),
+        "candidates_per_query": round(candidates / probes, 1),
+        "matches_per_query": round(expected / probes, 2),
+        "recall": round(found / expected, 4) if expected else None
+    }
@@ -0,0 +1,299 @@
+import re
+import json
+import logging
+from array import array
+from collections.abc import MutableMapping
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Fields whose values repeat across products; each is stored as a code into a shared value list
+POOLED_FIELDS = ("marca", "descripcion", "unidad", "tienda", "categoria", "categoria_origen")
+# Fields that are mostly unique per product; kept as plain string lists
+STRING_FIELDS = ("nombre", "url", "imagen")
+
+# Where a field of a row is read from
+_POOLED, _STRING, _PRICE, _OVERRIDE = range(4)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class ValuePool:
+    """Dictionary encoding: each distinct value is stored once and referred to by its code."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ProductView(MutableMapping):
+    """Dict-compatible view of one row of a ProductTable; reads and writes go to the table."""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "ProductTable", row: int):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._table.get_field(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._table.set_field(self._row, key, value)
+
+    def __delitem__(self, key):
+        self._table.delete_field(self._row, key)
+
+    def __iter__(self):
+        return iter(self._table.row_keys(self._row))
+
+    def __len__(self):
+        return len(self._table.row_keys(self._row))
+
+    def copy(self) -> dict:
+        return self._table.row_dict(self._row)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+class ProductTable:
+    """Column store for the catalogue's products, used in place of the list of dicts.
+
+    Repeated strings (store, brand, description, unit, category path and
+    source) are dictionary-encoded into 32-bit code arrays, prices live in a
+    float array and names, URLs and images in plain lists. Each row also
+    keeps a code for its key order, so a product reads back with exactly
+    the keys it was stored with, in the same order. Values that do not fit
+    their column (a price that is not a float, an unknown field) are kept
+    per row in `overrides`.
+
+    It behaves like the list it replaces: len(), iteration and indexing
+    give ProductView mappings, append() and extend() take dicts.
+    """
+
+    def __init__(self, products=()):
+        self.shapes = ValuePool()
+        # Per shape code, the column kind of each of its keys
+        self._shape_kinds = []
+        self.pools = {field: ValuePool() for field in POOLED_FIELDS}
+        self._reset_columns()
+        self.extend(products)
+
+    def _reset_columns(self):
+        self.shape_codes = array('I')
+        self.pooled = {field: array('I') for field in POOLED_FIELDS}
+        self.strings = {field: [] for field in STRING_FIELDS}
+        self.prices = array('d')
+        self.overrides = {}
+
+    @staticmethod
+    def _pool_key(field: str, value):
+        """Hashable form of a pooled value, or None when it cannot be pooled."""
+        if field == "categoria":
+            if isinstance(value, list) and all(isinstance(part, str) for part in value):
+                return tuple(value)
+            return None
+        return value if isinstance(value, str) else None
+
+    def _encode(self, product: dict) -> tuple:
+        """(shape code, pooled codes, strings, price, overrides) of a product dict."""
+        overrides = {}
+        codes = []
+        for field in POOLED_FIELDS:
+            key = self._pool_key(field, product[field]) if field in product else None
+            if key is None and field in product:
+                overrides[field] = product[field]
+            codes.append(self.pools[field].encode(key))
+        strings = []
+        for field in STRING_FIELDS:
+            value = product.get(field)
+            if field in product and not isinstance(value, str):
+                overrides[field] = value
+                value = None
+            strings.append(value)
+        price = product.get("precio")
+        if "precio" in product and type(price) is not float:
+            overrides["precio"] = price
+            price = None
+        for key, value in product.items():
+            if key not in self.pooled and key not in self.strings and key != "precio":
+                overrides[key] = value
+        return self._shape_code(tuple(product)), codes, strings, price or 0.0, overrides
+
+    def _shape_code(self, keys: tuple) -> int:
+        code = self.shapes.encode(keys)
+        if code == len(self._shape_kinds):
+            self._shape_kinds.append({
+                key: _POOLED if key in self.pooled else _STRING if key in self.strings
+                else _PRICE if key == "precio" else _OVERRIDE
+                for key in keys
+            })
+        return code
+
+    def append(self, product: dict) -> None:
+        row = len(self.shape_codes)
+        shape, codes, strings, price, overrides = self._encode(product)
+        self.shape_codes.append(shape)
+        for field, code in zip(POOLED_FIELDS, codes):
+            self.pooled[field].append(code)
+        for field, value in zip(STRING_FIELDS, strings):
+            self.strings[field].append(value)
+        self.prices.append(price)
+        if overrides:
+            self.overrides[row] = overrides
+
+    def extend(self, products) -> None:
+        for product in products:
+            self.append(product)
+
+    def row_keys(self, row: int) -> tuple:
+        return self.shapes.values[self.shape_codes[row]]
+
+    def _read(self, row: int, key, kind: int, overrides):
+        if overrides is not None and key in overrides:
+            return overrides[key]
+        if kind == _POOLED:
+            value = self.pools[key].values[self.pooled[key][row]]
+            # Hand out a fresh list so callers cannot change the shared path
+            return list(value) if key == "categoria" else value
+        if kind == _STRING:
+            return self.strings[key][row]
+        return self.prices[row]
+
+    def get_field(self, row: int, key):
+        kind = self._shape_kinds[self.shape_codes[row]].get(key)
+        if kind is None:
+            raise KeyError(key)
+        return self._read(row, key, kind, self.overrides.get(row))
+
+    def rows_without(self, key) -> list:
+        """Rows whose product has no `key` field."""
+        shapes = {code for code, kinds in enumerate(self._shape_kinds) if key not in kinds}
+        if not shapes:
+            return []
+        return [row for row, shape in enumerate(self.shape_codes) if shape in shapes]
+
+    def row_dict(self, row: int) -> dict:
+        """The product at row as a plain dict."""
+        overrides = self.overrides.get(row)
+        return {
+            key: self._read(row, key, kind, overrides)
+            for key, kind in self._shape_kinds[self.shape_codes[row]].items()
+        }
+
+    def set_field(self, row: int, key, value) -> None:
+        product = self.row_dict(row)
+        product[key] = value
+        self._replace_row(row, product)
+
+    def delete_field(self, row: int, key) -> None:
+        product = self.row_dict(row)
+        del product[key]
+        self._replace_row(row, product)
+
+    def _replace_row(self, row: int, product: dict) -> None:
+        shape, codes, strings, price, overrides = self._encode(product)
+        self.shape_codes[row] = shape
+        for field, code in zip(POOLED_FIELDS, codes):
+            self.pooled[field][row] = code
+        for field, value in zip(STRING_FIELDS, strings):
+            self.strings[field][row] = value
+        self.prices[row] = price
+        self.overrides.pop(row, None)
+        if overrides:
+            self.overrides[row] = overrides
+
+    def __len__(self):
+        return len(self.shape_codes)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield ProductView(self, row)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [ProductView(self, row) for row in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("product index out of range")
+        return ProductView(self, index)
+
+    def __setitem__(self, index, products) -> None:
+        """Only whole-table replacement (table[:] = products) is supported."""
+        if not isinstance(index, slice) or index != slice(None):
+            raise TypeError("ProductTable only supports replacing all rows with [:]")
+        # Copy first: the new rows may be views of this table
+        products = [product.copy() for product in products]
+        self._reset_columns()
+        self.extend(products)
+
+    @classmethod
+    def load_json(cls, path: Path) -> dict:
+        """Load a products.json file straight into a table, without keeping a dict per product.
+
+        The top-level object is decoded one member at a time; the elements of
+        its "products" list are encoded as soon as each is decoded, and any
+        other member is kept as json.load would return it.
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        decoder = json.JSONDecoder()
+        table = cls()
+        data = {}
+
+        def skip(index: int) -> int:
+            return _WHITESPACE.match(text, index).end()
+
+        def expect(index: int, char: str) -> int:
+            index = skip(index)
+            if text[index:index + 1] != char:
+                raise json.JSONDecodeError(f"Expecting '{char}'", text, index)
+            return skip(index + 1)
+
+        index = expect(0, "{")
+        if text[index:index + 1] != "}":
+            while True:
+                key, index = decoder.raw_decode(text, index)
+                if not isinstance(key, str):
+                    raise json.JSONDecodeError("Expecting property name", text, index)
+                index = expect(index, ":")
+                if key == "products" and text[index:index + 1] == "[":
+                    index = skip(index + 1)
+                    if text[index:index + 1] == "]":
+                        index += 1
+                    else:
+                        while True:
+                            product, index = decoder.raw_decode(text, index)
+                            table.append(product)
+                            index = skip(index)
+                            if text[index:index + 1] != ",":
+                                break
+                            index = skip(index + 1)
+                        index = expect(index, "]")
+                    data[key] = table
+                else:
+                    data[key], index = decoder.raw_decode(text, index)
+                index = skip(index)
+                if text[index:index + 1] != ",":
+                    break
+                index = skip(index + 1)
+            index = expect(index, "}")
+        else:
+            index += 1
+        if skip(index) != len(text):
+            raise json.JSONDecodeError("Extra data", text, skip(index))
+        if not isinstance(data.setdefault("products", table), ProductTable):
+            raise ValueError(f"{path} must hold a 'products' list")
+        return data
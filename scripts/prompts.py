@@ -0,0 +1,208 @@
+import re
+import zlib
+import logging
+import threading
+from llm_engine import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Descriptions that carry no information for the model
+EMPTY_DESCRIPTIONS = {"", "n/a", "na", "-", "none", "null"}
+
+CATEGORY_TEMPLATE = """Clasifica este producto de supermercado en una jerarquía de categorías.
+
+{fields}
+
+Reglas:
+1. Máximo 3 niveles, de lo general a lo específico
+2. Todas las categorías en español
+{brand_rules}
+Responde SOLO con este JSON:
+{response_format}"""
+
+BRAND_RULES = """3. "marca" es la marca real: ignora prefijos como "PRODUCTO ECONÓMICO"; la marca blanca de Alcampo es "Alcampo"
+"""
+
+BATCH_TEMPLATE = """Clasifica estos productos de supermercado en una jerarquía de categorías.
+
+{items}
+
+Reglas:
+1. Máximo 3 niveles, de lo general a lo específico
+2. Todas las categorías en español
+3. Si la marca es "?", añade "marca" con la marca real: ignora prefijos como "PRODUCTO ECONÓMICO"; la marca blanca de Alcampo es "Alcampo"
+4. Un elemento por producto, con su número en "id"
+
+Responde SOLO con un array JSON:
+[{{"id": 1, "category_path": ["Categoría", "Subcategoría", "Sub-subcategoría"]}}]"""
+
+# Completion tokens reserved for each product of a batched answer
+BATCH_ITEM_COMPLETION_TOKENS = 24
+
+CATEGORY_FORMAT = '{"category_path": ["Categoría", "Subcategoría", "Sub-subcategoría"]}'
+CATEGORY_BRAND_FORMAT = '{"category_path": ["Categoría", "Subcategoría", "Sub-subcategoría"], "marca": "Marca"}'
+
+
+def unit_label(price_per_unit: str) -> str:
+    """'Litro' from a unit price such as '(2,08 € / Litro)'."""
+    match = re.search(r"/\s*([^)]+?)\s*\)?\s*$", price_per_unit or "")
+    return match.group(1) if match else ""
+
+
+class PromptBuilder:
+    """Builds the categorization prompt from the few fields the model needs.
+
+    Only the name, brand, a useful description and the unit word are sent,
+    and the model is asked for the category path alone (plus the brand when
+    the name heuristic could not find it). Fields are shortened, description
+    first, until the prompt fits `max_prompt_tokens`.
+    """
+
+    def __init__(self, max_prompt_tokens: int = 384, max_description_chars: int = 200,
+                 context_tokens: int = 512, batch_description_chars: int = 80):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_description_chars = max_description_chars
+        self.context_tokens = context_tokens
+        self.batch_description_chars = batch_description_chars
+        self._batch_overhead = estimate_tokens(BATCH_TEMPLATE.format(items=""))
+
+    @staticmethod
+    def _fields(name: str, brand: str, description: str, unit: str) -> str:
+        lines = [f"Producto: {name}"]
+        if brand:
+            lines.append(f"Marca: {brand}")
+        if description:
+            lines.append(f"Descripción: {description}")
+        if unit:
+            lines.append(f"Unidad: {unit}")
+        return "\n".join(lines)
+
+    def _render(self, name: str, brand: str, description: str, unit: str, ask_brand: bool) -> str:
+        return CATEGORY_TEMPLATE.format(
+            fields=self._fields(name, brand, description, unit),
+            brand_rules=BRAND_RULES if ask_brand else "",
+            response_format=CATEGORY_BRAND_FORMAT if ask_brand else CATEGORY_FORMAT
+        )
+
+    def category_prompt(self, product: dict, ask_brand: bool = False) -> str:
+        """Prompt for product's category path, and its brand when ask_brand is set."""
+        name = " ".join(product.get("name", "").split())
+        brand = product.get("brand", "")
+        description = " ".join(str(product.get("description") or "").split())
+        if description.lower() in EMPTY_DESCRIPTIONS or description.lower() == name.lower():
+            description = ""
+        description = description[:self.max_description_chars]
+        unit = unit_label(product.get("unit", ""))
+
+        prompt = self._render(name, brand, description, unit, ask_brand)
+        overflow = estimate_tokens(prompt) - self.max_prompt_tokens
+        if overflow > 0 and description:
+            # Roughly three characters per token; drop the description if trimming is not enough
+            description = description[:max(0, len(description) - overflow * 3)].rstrip()
+            prompt = self._render(name, brand, description, unit, ask_brand)
+            overflow = estimate_tokens(prompt) - self.max_prompt_tokens
+        if overflow > 0:
+            name = name[:max(20, len(name) - overflow * 3)].rstrip()
+            prompt = self._render(name, brand, "", unit, ask_brand)
+            logger.debug(f"Prompt for {product.get('id')} trimmed to {estimate_tokens(prompt)} tokens")
+        return prompt
+
+    def _item_line(self, number: int, product: dict, ask_brand: bool) -> str:
+        name = " ".join(product.get("name", "").split())
+        line = f"{number}. Producto: {name} | Marca: {'?' if ask_brand else product.get('brand', '')}"
+        description = " ".join(str(product.get("description") or "").split())
+        if description.lower() not in EMPTY_DESCRIPTIONS and description.lower() != name.lower():
+            line += f" | Descripción: {description[:self.batch_description_chars]}"
+        unit = unit_label(product.get("unit", ""))
+        if unit:
+            line += f" | Unidad: {unit}"
+        return line
+
+    def batch_prompt(self, entries: list) -> str:
+        """One prompt for several products; entries are (number, product, ask_brand)."""
+        return BATCH_TEMPLATE.format(
+            items="\n".join(self._item_line(number, product, ask_brand) for number, product, ask_brand in entries)
+        )
+
+    def chunks(self, items, max_items: int):
+        """Group (product_id, product) items into batches that fit the context window.
+
+        Each product costs its prompt line plus the completion tokens its
+        answer needs, so batches of long products hold fewer of them.
+        """
+        chunk = []
+        used = self._batch_overhead
+        for item in items:
+            # Input products still carry their raw fields here; the line is only an estimate
+            cost = estimate_tokens(self._item_line(len(chunk) + 1, item[1], False)) + BATCH_ITEM_COMPLETION_TOKENS
+            if chunk and (len(chunk) >= max_items or used + cost > self.context_tokens):
+                yield chunk
+                chunk = []
+                used = self._batch_overhead
+            chunk.append(item)
+            used += cost
+        if chunk:
+            yield chunk
+
+
+class BatchStats:
+    """Throughput and agreement of batched prompts, compared with single-product prompts.
+
+    A sample of the products answered in a batch (one in `compare_every`,
+    picked by product id) is also asked for alone, to measure how often both
+    modes agree and how long each takes per product. Only prompts that reach
+    the LLM are recorded; answers from the response cache would make either
+    mode look free.
+    """
+
+    def __init__(self, compare_every: int = 20):
+        self.compare_every = compare_every
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.prompts = 0
+        self.items = 0
+        self.batched_seconds = 0.0
+        self.fallbacks = 0
+        self.single_calls = 0
+        self.single_seconds = 0.0
+        self.compared = 0
+        self.agreed = 0
+
+    def should_compare(self, product_id: str) -> bool:
+        return bool(self.compare_every) and zlib.crc32(str(product_id).encode('utf-8')) % self.compare_every == 0
+
+    def record_batch(self, items: int, seconds: float) -> None:
+        with self._lock:
+            self.prompts += 1
+            self.items += items
+            self.batched_seconds += seconds
+
+    def record_single(self, seconds: float, fallback: bool) -> None:
+        with self._lock:
+            self.single_calls += 1
+            self.single_seconds += seconds
+            if fallback:
+                self.fallbacks += 1
+
+    def record_comparison(self, agreed: bool) -> None:
+        with self._lock:
+            self.compared += 1
+            self.agreed += int(agreed)
+
+    def summary(self) -> dict:
+        with self._lock:
+            batched = self.batched_seconds / self.items if self.items else None
+            single = self.single_seconds / self.single_calls if self.single_calls else None
+            return {
+                "prompts": self.prompts,
+                "items": self.items,
+                "items_per_prompt": round(self.items / self.prompts, 1) if self.prompts else 0,
+                "fallbacks": self.fallbacks,
+                "seconds_per_item_batched": round(batched, 4) if batched is not None else None,
+                "seconds_per_item_single": round(single, 4) if single is not None else None,
+                "speedup": round(single / batched, 2) if batched and single else None,
+                "compared": self.compared,
+                "agreement": round(self.agreed / self.compared, 3) if self.compared else None
+            }
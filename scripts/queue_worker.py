@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import signal
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from journal import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# A lock file older than this belongs to a writer that died holding it
+LOCK_STALE_SECONDS = 10.0
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+@contextmanager
+def uploads_lock(uploads_file: Path, poll: float = 0.02):
+    """Hold <uploads_file>.lock, the lock lib/uploads.ts also takes around its read-modify-write."""
+    lock_file = Path(f"{uploads_file}.lock")
+    lock_file.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        try:
+            os.close(os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - lock_file.stat().st_mtime > LOCK_STALE_SECONDS:
+                    logger.info(f"Removing stale lock {lock_file}")
+                    lock_file.unlink()
+                    continue
+            except FileNotFoundError:
+                continue
+            time.sleep(poll)
+    try:
+        yield
+    finally:
+        try:
+            lock_file.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class QueueWorker:
+    """Resident worker that drains queued uploads with one warm FileProcessor.
+
+    Jobs are the `queued` entries of uploads.json, oldest first. While it
+    runs, the worker keeps a heartbeat file fresh so the web route can leave
+    uploads queued for it instead of spawning a new process. With an `ingest`
+    (ShardedIngest), several queued uploads are claimed and run as one batch.
+    """
+
+    def __init__(self, processor, uploads_file: Path, heartbeat_file: Path, poll_interval: float = 2.0,
+                 ingest=None, batch_size: int = 32):
+        self.processor = processor
+        self.ingest = ingest
+        self.batch_size = max(1, batch_size)
+        self.uploads_file = Path(uploads_file)
+        self.heartbeat_file = Path(heartbeat_file)
+        self.poll_interval = poll_interval
+        self.stopping = False
+        self.jobs = 0
+        self.state = "idle"
+        self.current_upload = None
+        self._done = threading.Event()
+
+    def _load_uploads(self) -> dict:
+        if not self.uploads_file.exists():
+            return {"uploads": []}
+        with open(self.uploads_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _queued(self) -> list:
+        queued = [u for u in self._load_uploads().get("uploads", []) if u.get("status") == "queued"]
+        return sorted(queued, key=lambda u: u.get("uploadedAt", ""))
+
+    def _requeue_interrupted(self) -> None:
+        """Queue again uploads left in `processing` by a run that died and left a checkpoint."""
+        for upload in self._load_uploads().get("uploads", []):
+            if upload.get("status") == "processing" and self.processor.checkpoints.exists_for(upload["id"]):
+                logger.info(f"Requeueing interrupted upload {upload['id']}")
+                self._update_upload(upload["id"], status="queued")
+
+    def _update_upload(self, upload_id: str, **fields) -> None:
+        """Re-read uploads.json and update a single record under the lock the web app writes it with."""
+        with uploads_lock(self.uploads_file):
+            data = self._load_uploads()
+            for upload in data.get("uploads", []):
+                if upload["id"] == upload_id:
+                    upload.update(fields)
+                    break
+            atomic_write_json(self.uploads_file, data)
+
+    def _heartbeat(self) -> None:
+        atomic_write_json(self.heartbeat_file, {
+            "pid": os.getpid(),
+            "state": self.state,
+            "upload": self.current_upload,
+            "jobs": self.jobs,
+            "updatedAt": _now()
+        })
+
+    def _heartbeat_loop(self) -> None:
+        # Runs beside long jobs so the heartbeat never goes stale mid-file
+        while not self._done.wait(self.poll_interval):
+            try:
+                self._heartbeat()
+            except Exception as e:
+                logger.error(f"Error writing worker heartbeat: {str(e)}")
+
+    def _stop(self, signum, frame):
+        logger.info("Stop requested, finishing the current job")
+        self.stopping = True
+
+    def _resolve(self, queue_path: str) -> Path:
+        path = Path(queue_path)
+        return path if path.is_absolute() else self.processor.base_dir / path
+
+    def process_job(self, upload: dict) -> dict:
+        upload_id = upload["id"]
+        file_path = self._resolve(upload["queuePath"])
+        logger.info(f"Starting job {upload_id}: {upload.get('fileName', file_path.name)}")
+
+        self._update_upload(upload_id, status="processing")
+        self.state = "processing"
+        self.current_upload = upload_id
+
+        if not file_path.exists():
+            result = {"success": False, "error": f"File not found: {file_path}"}
+        else:
+            # Pick up edits made to the stores by anything other than this worker
+            self.processor.reload_if_changed()
+            result = self.processor.process_file(str(file_path), upload_id=upload_id, resume=True)
+
+        self.jobs += 1
+        self._update_upload(
+            upload_id,
+            status="completed" if result.get("success") else "error",
+            processedAt=_now(),
+            result=result
+        )
+        self.state = "idle"
+        self.current_upload = None
+        logger.info(f"Finished job {upload_id}: {json.dumps(result, ensure_ascii=False)}")
+        return result
+
+    def process_batch(self, uploads: list) -> dict:
+        """Run several uploads through the sharded ingest; they are merged in queue order."""
+        jobs = []
+        results = {}
+        for upload in uploads:
+            file_path = self._resolve(upload["queuePath"])
+            self._update_upload(upload["id"], status="processing")
+            if file_path.exists():
+                jobs.append((upload["id"], file_path))
+            else:
+                results[upload["id"]] = {"success": False, "error": f"File not found: {file_path}"}
+        logger.info(f"Starting batch of {len(uploads)} uploads")
+        self.state = "processing"
+        self.current_upload = uploads[0]["id"]
+
+        if jobs:
+            try:
+                self.processor.reload_if_changed()
+                results.update(self.ingest.run(jobs))
+            except Exception as e:
+                logger.error(f"Error processing batch: {str(e)}")
+                for upload_id, _ in jobs:
+                    results.setdefault(upload_id, {"success": False, "error": f"Batch failed: {str(e)}"})
+
+        for upload in uploads:
+            result = results.get(upload["id"], {"success": False, "error": "No result from the batch"})
+            self.jobs += 1
+            self._update_upload(
+                upload["id"],
+                status="completed" if result.get("success") else "error",
+                processedAt=_now(),
+                result=result
+            )
+        self.state = "idle"
+        self.current_upload = None
+        logger.info(f"Finished batch of {len(uploads)} uploads")
+        return results
+
+    def run(self, once: bool = False) -> int:
+        """Process queued uploads back to back; with once=True, exit when the queue is empty."""
+        signal.signal(signal.SIGTERM, self._stop)
+        logger.info(f"Worker {os.getpid()} watching {self.uploads_file}")
+        self._requeue_interrupted()
+        self._heartbeat()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat.start()
+
+        try:
+            while not self.stopping:
+                queued = self._queued()
+                if not queued:
+                    if once:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                if self.ingest is not None and len(queued) > 1:
+                    self.process_batch(queued[:self.batch_size])
+                else:
+                    self.process_job(queued[0])
+        finally:
+            self._done.set()
+            heartbeat.join()
+            if self.heartbeat_file.exists():
+                self.heartbeat_file.unlink()
+
+        logger.info(f"Worker stopped after {self.jobs} jobs")
+        return self.jobs
@@ -0,0 +1,94 @@
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from journal import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Input fields whose change sends a product back through categorization; price and unit price are not among them
+CONTENT_FIELDS = ("name", "brand", "description", "store", "url", "image")
+
+# Trailing date, time or run number of an export name: ver_todo_bebidas_2024-05-01 -> ver_todo_bebidas
+_RUN_SUFFIX = re.compile(r"([_-]+\d[\d_.-]*)+$")
+
+
+def source_name(file_path: str) -> str:
+    """Name shared by the daily exports of one scraper section."""
+    stem = Path(file_path).stem
+    return _RUN_SUFFIX.sub("", stem) or stem
+
+
+def product_key(product_id: str, fields: dict) -> str:
+    """Identity of an input product across exports: its URL, or the export's product id."""
+    url = (fields.get("url") or "").lower().strip()
+    return url or f"id:{product_id}"
+
+
+def content_hash(fields: dict) -> str:
+    content = json.dumps([fields.get(field) for field in CONTENT_FIELDS], ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+
+class SourceManifest:
+    """Fingerprints of the products of a source's last ingested export.
+
+    Each product is stored under its key with the hash of its content
+    fields, its price and unit price, and the name and brand it is stored
+    under. classify() compares a product of the new export against it;
+    record() builds the manifest of the new export, which replaces the old
+    one on save(), so products that left the export drop out of it.
+    """
+
+    def __init__(self, directory: Path, source: str):
+        self.path = Path(directory) / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', source)}.json"
+        self.source = source
+        self.previous = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.previous = json.load(f).get("products", {})
+        self.current = {}
+
+    def classify(self, key: str, digest: str, price, unit: str) -> str:
+        """new, changed (content), price (price or unit price only) or unchanged."""
+        entry = self.previous.get(key)
+        if entry is None:
+            return "new"
+        if entry["hash"] != digest:
+            return "changed"
+        if entry["precio"] != price or entry["unidad"] != unit:
+            return "price"
+        return "unchanged"
+
+    def record(self, key: str, digest: str, price, unit: str, name: str = "", brand: str = "") -> None:
+        self.current[key] = {"hash": digest, "precio": price, "unidad": unit, "nombre": name, "marca": brand}
+
+    def previous_entry(self, key: str):
+        return self.previous.get(key)
+
+    def forget(self, key: str) -> None:
+        """Leave a product out of the new manifest, so the next run takes it as new."""
+        self.current.pop(key, None)
+
+    def revert(self, key: str) -> None:
+        """Keep a product's previous entry, so the next run finds the same change again."""
+        entry = self.previous.get(key)
+        if entry is None:
+            self.current.pop(key, None)
+        else:
+            self.current[key] = entry
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(self.path, {
+            "source": self.source,
+            "updated_at": datetime.now().isoformat(),
+            "products": self.current
+        })
+        self.previous = self.current
+        self.current = {}
+
+    def __len__(self):
+        return len(self.previous)
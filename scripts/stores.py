@@ -0,0 +1,522 @@
+import json
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+from pathlib import Path
+from journal import atomic_write_json
+from dedup_index import DedupIndex, core_name, normalized_fields
+from product_records import ProductTable
+from category_trie import CategoryTrie
+
+logger = logging.getLogger(__name__)
+
+# Product fields with their own column, in the order they are written to products.json
+PRODUCT_FIELDS = ["nombre", "marca", "precio", "descripcion", "unidad", "tienda", "url", "imagen",
+                  "categoria", "categoria_origen"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT,
+    marca TEXT,
+    precio REAL,
+    descripcion TEXT,
+    unidad TEXT,
+    tienda TEXT,
+    url TEXT,
+    imagen TEXT,
+    categoria TEXT,
+    categoria_origen TEXT,
+    extra TEXT,
+    categoria_path TEXT,
+    dedup_key TEXT,
+    url_key TEXT,
+    alcampo_key TEXT
+);
+CREATE INDEX IF NOT EXISTS products_dedup_key ON products (dedup_key);
+CREATE INDEX IF NOT EXISTS products_url_key ON products (url_key) WHERE url_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS products_alcampo_key ON products (alcampo_key) WHERE alcampo_key IS NOT NULL;
+CREATE INDEX IF NOT EXISTS products_categoria_path ON products (categoria_path);
+CREATE TABLE IF NOT EXISTS categories (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    position INTEGER,
+    nombre TEXT,
+    descripcion TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS categories_parent ON categories (parent_id, position);
+CREATE TABLE IF NOT EXISTS brands (
+    nombre TEXT PRIMARY KEY,
+    descripcion TEXT,
+    position INTEGER,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class CatalogueStore(ABC):
+    """Where FileProcessor keeps products, the category tree and brands.
+
+    Stores hand out and take back the same shapes as the JSON files
+    ({"products": [...]}, {"categorias": [...]}, {"marcas": [...]}), so the
+    processor does not care which backend it runs on.
+    """
+
+    @abstractmethod
+    def load_categories(self) -> dict:
+        pass
+
+    @abstractmethod
+    def load_products(self) -> dict:
+        pass
+
+    @abstractmethod
+    def load_brands(self) -> dict:
+        pass
+
+    @abstractmethod
+    def dedup_index(self, normalize_brand, products: list):
+        """Duplicate index over products, ready for match()/add()."""
+
+    @abstractmethod
+    def save(self, categories: dict, products: dict, brands: dict = None) -> None:
+        """Persist the stores; brands is None when no brand was added."""
+
+    @abstractmethod
+    def replace_products(self, products: dict, kept: list) -> None:
+        """Keep only the kept products; written by the next save()."""
+
+    @abstractmethod
+    def find_product(self, products: dict, product: dict, normalize_brand):
+        """Position of the stored product with product's URL, or else its (nombre, marca, tienda); None if absent."""
+
+    @abstractmethod
+    def get_product(self, products: dict, position) -> dict:
+        pass
+
+    @abstractmethod
+    def update_product(self, products: dict, position, changes: dict) -> None:
+        """Change fields of a stored product in place; written by the next save()."""
+
+    @abstractmethod
+    def signature(self):
+        """Value that changes when another process modifies the store."""
+
+    def close(self) -> None:
+        pass
+
+
+class JSONStore(CatalogueStore):
+    """The original JSON files, loaded whole and rewritten atomically on save.
+
+    With compact_products the products are held in a ProductTable instead
+    of one dict each.
+    """
+
+    def __init__(self, categories_file: Path, products_file: Path, brands_file: Path,
+                 compact_products: bool = False):
+        self.categories_file = Path(categories_file)
+        self.products_file = Path(products_file)
+        self.brands_file = Path(brands_file)
+        self.compact_products = compact_products
+        self._positions = None
+        self._indexed_rows = 0
+
+    @staticmethod
+    def _load(path: Path, default: dict) -> dict:
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return default
+
+    def load_categories(self) -> dict:
+        return self._load(self.categories_file, {"categorias": []})
+
+    def load_products(self) -> dict:
+        self._positions = None
+        if self.compact_products:
+            if self.products_file.exists():
+                return ProductTable.load_json(self.products_file)
+            return {"products": ProductTable()}
+        return self._load(self.products_file, {"products": []})
+
+    def load_brands(self) -> dict:
+        return self._load(self.brands_file, {"marcas": []})
+
+    def dedup_index(self, normalize_brand, products: list) -> DedupIndex:
+        index = DedupIndex(normalize_brand)
+        index.build(products)
+        return index
+
+    def save(self, categories: dict, products: dict, brands: dict = None) -> None:
+        atomic_write_json(self.categories_file, categories)
+        # A ProductTable is not a list; it is encoded one product at a time
+        atomic_write_json(self.products_file, products, rows_key="products" if self.compact_products else None)
+        if brands is not None:
+            atomic_write_json(self.brands_file, brands)
+
+    def replace_products(self, products: dict, kept: list) -> None:
+        products["products"][:] = kept
+        self._positions = None
+
+    def find_product(self, products: dict, product: dict, normalize_brand):
+        """Index of the stored product with product's URL, or else its (nombre, marca, tienda); None if absent."""
+        rows = products["products"]
+        # Built on first use, then extended with the rows appended since
+        if self._positions is None or self._indexed_rows > len(rows):
+            self._positions = {}
+            self._indexed_rows = 0
+        for position in range(self._indexed_rows, len(rows)):
+            name, brand, store, url = normalized_fields(rows[position], normalize_brand)
+            if url:
+                self._positions.setdefault(("url", url), position)
+            self._positions.setdefault(("key", name, brand, store), position)
+        self._indexed_rows = len(rows)
+
+        name, brand, store, url = normalized_fields(product, normalize_brand)
+        if url and ("url", url) in self._positions:
+            return self._positions[("url", url)]
+        return self._positions.get(("key", name, brand, store))
+
+    def get_product(self, products: dict, position) -> dict:
+        return products["products"][position]
+
+    def update_product(self, products: dict, position, changes: dict) -> None:
+        products["products"][position].update(changes)
+
+    def signature(self) -> tuple:
+        return tuple(
+            path.stat().st_mtime_ns if path.exists() else None
+            for path in (self.categories_file, self.products_file, self.brands_file)
+        )
+
+
+class SQLiteProductList:
+    """List-like view of the products table, standing in for products.json's list.
+
+    Appending inserts the row into the store's open transaction; iterating
+    reads rows back in insertion order without loading the table at once.
+    """
+
+    def __init__(self, store: "SQLiteStore"):
+        self.store = store
+
+    def __len__(self):
+        return self.store.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def __iter__(self):
+        return self.store.iter_products()
+
+    def __getitem__(self, index: int) -> dict:
+        # Positions map to row ids through the store's cached id list, so each lookup is by primary key
+        return self.store.get_product(None, self.store.product_ids()[index])
+
+    def append(self, product: dict) -> None:
+        self.store.insert_products([product])
+
+    def extend(self, products) -> None:
+        self.store.insert_products(products)
+
+
+class SQLiteDedupIndex:
+    """Duplicate checks answered by the indexed key columns of the products table.
+
+    The keys are written together with each row, so add() has nothing left
+    to do and nothing is held in memory.
+    """
+
+    def __init__(self, store: "SQLiteStore"):
+        self.store = store
+
+    def build(self, products) -> None:
+        pass
+
+    def add(self, product: dict) -> None:
+        pass
+
+    def match(self, product: dict):
+        """Return the rule that marks product as a duplicate, or None."""
+        dedup_key, url_key, alcampo_key = self.store.product_keys(product)
+        conn = self.store.conn
+        if conn.execute("SELECT 1 FROM products WHERE dedup_key = ? LIMIT 1", (dedup_key,)).fetchone():
+            return "key"
+        if url_key and conn.execute("SELECT 1 FROM products WHERE url_key = ? LIMIT 1", (url_key,)).fetchone():
+            return "url"
+        if alcampo_key and conn.execute(
+            "SELECT 1 FROM products WHERE alcampo_key = ? LIMIT 1", (alcampo_key,)
+        ).fetchone():
+            return "alcampo"
+        return None
+
+    def __len__(self):
+        return self.store.conn.execute("SELECT COUNT(DISTINCT dedup_key) FROM products").fetchone()[0]
+
+
+class SQLiteStore(CatalogueStore):
+    """Catalogue in a single SQLite database in WAL mode.
+
+    Products are inserted as they are accepted, inside a transaction that
+    save() commits, so a commit costs the new rows rather than a rewrite of
+    the catalogue. Dedup keys, URLs and category paths are indexed columns.
+    """
+
+    def __init__(self, path: Path, normalize_brand):
+        self.path = Path(path)
+        self.normalize_brand = normalize_brand
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Transactions are opened and committed explicitly
+        self.conn = sqlite3.connect(str(self.path), isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._saved_brands = 0
+        # Row ids in insertion order, for SQLiteProductList positions; dropped whenever rows change
+        self._product_ids = None
+
+    def _begin(self) -> None:
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE")
+
+    def _commit(self) -> None:
+        if self.conn.in_transaction:
+            self.conn.execute("COMMIT")
+
+    def is_empty(self) -> bool:
+        return not any(
+            self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+            for table in ("products", "categories", "brands")
+        )
+
+    def product_keys(self, product: dict) -> tuple:
+        """(dedup_key, url_key, alcampo_key) columns for product."""
+        name, brand, store, url = normalized_fields(product, self.normalize_brand)
+        alcampo_key = f"{store}\x1f{core_name(name)}" if brand == "alcampo" else None
+        return f"{name}\x1f{brand}\x1f{store}", url or None, alcampo_key
+
+    def _product_row(self, product: dict) -> tuple:
+        categoria = product.get("categoria")
+        extra = {key: value for key, value in product.items() if key not in PRODUCT_FIELDS}
+        return (
+            product.get("nombre"),
+            product.get("marca"),
+            product.get("precio"),
+            product.get("descripcion"),
+            product.get("unidad"),
+            product.get("tienda"),
+            product.get("url"),
+            product.get("imagen"),
+            json.dumps(categoria, ensure_ascii=False) if categoria is not None else None,
+            product.get("categoria_origen"),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+            " > ".join(categoria) if isinstance(categoria, list) else None,
+        ) + self.product_keys(product)
+
+    @staticmethod
+    def row_to_product(row) -> dict:
+        product = {}
+        for field in PRODUCT_FIELDS:
+            value = row[field]
+            if value is None:
+                continue
+            product[field] = json.loads(value) if field == "categoria" else value
+        if row["extra"]:
+            product.update(json.loads(row["extra"]))
+        return product
+
+    def product_ids(self) -> list:
+        if self._product_ids is None:
+            self._product_ids = [row[0] for row in self.conn.execute("SELECT id FROM products ORDER BY id")]
+        return self._product_ids
+
+    def insert_products(self, products) -> None:
+        """Insert products into the open transaction with a single executemany."""
+        self._product_ids = None
+        self._begin()
+        self.conn.executemany(
+            "INSERT INTO products (nombre, marca, precio, descripcion, unidad, tienda, url, imagen, categoria, "
+            "categoria_origen, extra, categoria_path, dedup_key, url_key, alcampo_key) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self._product_row(product) for product in products)
+        )
+
+    def iter_products(self, batch_size: int = 1000):
+        cursor = self.conn.execute("SELECT * FROM products ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self.row_to_product(row)
+
+    def reindex(self) -> None:
+        """Recompute the dedup key columns, e.g. after the brand aliases changed."""
+        self._begin()
+        rows = self.conn.execute("SELECT id, nombre, marca, tienda, url FROM products").fetchall()
+        self.conn.executemany(
+            "UPDATE products SET dedup_key = ?, url_key = ?, alcampo_key = ? WHERE id = ?",
+            (self.product_keys(dict(row)) + (row["id"],) for row in rows)
+        )
+        self._commit()
+
+    def sync_brand_rules(self, version: str) -> bool:
+        """Reindex the dedup keys if they were computed with other brand rules; return whether it did."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'brand_rules'").fetchone()
+        if row is not None and row["value"] == version:
+            return False
+        reindexed = row is not None or self.conn.execute("SELECT 1 FROM products LIMIT 1").fetchone() is not None
+        if reindexed:
+            self.reindex()
+            logger.info("Brand rules changed, recomputed the dedup keys")
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('brand_rules', ?)", (version,))
+        return reindexed
+
+    def load_categories(self) -> dict:
+        records = {}
+        tree = []
+        rows = self.conn.execute(
+            "SELECT id, parent_id, nombre, descripcion, extra FROM categories ORDER BY position"
+        ).fetchall()
+        for row in rows:
+            record = {"id": row["id"], "nombre": row["nombre"], "descripcion": row["descripcion"]}
+            if row["extra"]:
+                record.update(json.loads(row["extra"]))
+            record["subcategorias"] = []
+            records[row["id"]] = record
+        for row in rows:
+            parent = records.get(row["parent_id"])
+            (parent["subcategorias"] if parent else tree).append(records[row["id"]])
+        return {"categorias": tree}
+
+    def load_products(self) -> dict:
+        # Another process may have changed the table since the ids were read
+        self._product_ids = None
+        return {"products": SQLiteProductList(self)}
+
+    def load_brands(self) -> dict:
+        brands = []
+        for row in self.conn.execute("SELECT nombre, descripcion, extra FROM brands ORDER BY position"):
+            brand = {"nombre": row["nombre"], "descripcion": row["descripcion"]}
+            if row["extra"]:
+                brand.update(json.loads(row["extra"]))
+            brands.append(brand)
+        self._saved_brands = len(brands)
+        return {"marcas": brands}
+
+    def dedup_index(self, normalize_brand, products) -> SQLiteDedupIndex:
+        return SQLiteDedupIndex(self)
+
+    def _category_rows(self, tree: list):
+        stack = [(None, tree)]
+        while stack:
+            parent_id, records = stack.pop()
+            for position, record in enumerate(records):
+                extra = {key: value for key, value in record.items()
+                         if key not in ("id", "nombre", "descripcion", "subcategorias")}
+                yield (record["id"], parent_id, position, record["nombre"], record.get("descripcion"),
+                       json.dumps(extra, ensure_ascii=False) if extra else None)
+                stack.append((record["id"], record.get("subcategorias", [])))
+
+    def _brand_rows(self, brands: list, start: int = 0):
+        for position, brand in enumerate(brands[start:], start):
+            extra = {key: value for key, value in brand.items() if key not in ("nombre", "descripcion")}
+            yield (brand["nombre"], brand.get("descripcion"), position,
+                   json.dumps(extra, ensure_ascii=False) if extra else None)
+
+    def save(self, categories: dict, products: dict, brands: dict = None) -> None:
+        """Commit the inserted products together with the category tree and new brands."""
+        self._begin()
+        # The tree is small and the trie may merge or re-id nodes, so it is replaced whole
+        self.conn.execute("DELETE FROM categories")
+        self.conn.executemany(
+            "INSERT INTO categories (id, parent_id, position, nombre, descripcion, extra) VALUES (?, ?, ?, ?, ?, ?)",
+            self._category_rows(categories["categorias"])
+        )
+        if brands is not None:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO brands (nombre, descripcion, position, extra) VALUES (?, ?, ?, ?)",
+                self._brand_rows(brands["marcas"], self._saved_brands)
+            )
+            self._saved_brands = len(brands["marcas"])
+        self._commit()
+
+    def replace_products(self, products: dict, kept: list) -> None:
+        """Rewrite the products table inside the open transaction; save() commits it."""
+        self._begin()
+        self.conn.execute("DELETE FROM products")
+        self.insert_products(kept)
+
+    def find_product(self, products: dict, product: dict, normalize_brand):
+        """Row id of the stored product with product's URL, or else its dedup key; None if absent."""
+        dedup_key, url_key, _ = self.product_keys(product)
+        row = None
+        if url_key:
+            row = self.conn.execute(
+                "SELECT id FROM products WHERE url_key = ? ORDER BY id LIMIT 1", (url_key,)
+            ).fetchone()
+        if row is None:
+            row = self.conn.execute(
+                "SELECT id FROM products WHERE dedup_key = ? ORDER BY id LIMIT 1", (dedup_key,)
+            ).fetchone()
+        return row["id"] if row is not None else None
+
+    def get_product(self, products: dict, position) -> dict:
+        row = self.conn.execute("SELECT * FROM products WHERE id = ?", (position,)).fetchone()
+        return self.row_to_product(row)
+
+    def update_product(self, products: dict, position, changes: dict) -> None:
+        """Rewrite a product row inside the open transaction; save() commits it."""
+        product = self.get_product(products, position)
+        product.update(changes)
+        self._begin()
+        self.conn.execute(
+            "UPDATE products SET nombre = ?, marca = ?, precio = ?, descripcion = ?, unidad = ?, tienda = ?, "
+            "url = ?, imagen = ?, categoria = ?, categoria_origen = ?, extra = ?, categoria_path = ?, "
+            "dedup_key = ?, url_key = ?, alcampo_key = ? WHERE id = ?",
+            self._product_row(product) + (position,)
+        )
+
+    def signature(self) -> int:
+        # data_version only moves when another connection commits
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def import_json(self, categories_file: Path, products_file: Path, brands_file: Path) -> dict:
+        """Replace the store's contents with the JSON files, in one transaction."""
+        source = JSONStore(categories_file, products_file, brands_file)
+        categories = source.load_categories()
+        # The legacy tree repeats ids and case variants; the trie re-ids and merges them in place
+        CategoryTrie(categories["categorias"])
+        products = source.load_products()["products"]
+        brands = source.load_brands()
+        try:
+            self._begin()
+            for table in ("products", "categories", "brands"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self.insert_products(products)
+            self._saved_brands = 0
+            self.save(categories, {"products": products}, brands)
+        except Exception:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Imported {len(products)} products and {len(brands['marcas'])} brands into {self.path.name}")
+        return {"products": len(products), "brands": len(brands["marcas"])}
+
+    def export_json(self, categories_file: Path, products_file: Path, brands_file: Path) -> dict:
+        """Write the catalogue back out in the JSON file formats; call it after save()."""
+        products = list(self.iter_products())
+        brands = self.load_brands()
+        JSONStore(categories_file, products_file, brands_file).save(
+            self.load_categories(), {"products": products}, brands
+        )
+        logger.info(f"Exported {len(products)} products to {Path(products_file).name}")
+        return {"products": len(products), "brands": len(brands["marcas"])}
+
+    def close(self) -> None:
+        # Anything not saved yet is still in the journal
+        self.conn.close()
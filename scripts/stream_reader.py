@@ -0,0 +1,158 @@
+import json
+import codecs
+import logging
+from pathlib import Path
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789+-.eE"
+
+
+class ProductStream:
+    """Iterate the top-level `products` object of an upload without loading the whole file.
+
+    Yields (product_id, product) pairs one at a time, so memory stays flat
+    regardless of file size. Uses ijson when it is installed and an
+    incremental pure-Python tokenizer otherwise. `count` and `progress()`
+    give a running product count and the fraction of the file consumed,
+    which stands in for the total when logging progress.
+    """
+
+    def __init__(self, path: Path, chunk_size: int = 64 * 1024, use_ijson: bool = True):
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.use_ijson = use_ijson and ijson is not None
+        self.file_size = self.path.stat().st_size
+        self.bytes_read = 0
+        self.count = 0
+
+    def progress(self) -> float:
+        if not self.file_size:
+            return 1.0
+        return min(1.0, self.bytes_read / self.file_size)
+
+    def __iter__(self):
+        if self.use_ijson:
+            yield from self._iter_ijson()
+        else:
+            yield from self._iter_tokens()
+
+    def _iter_ijson(self):
+        with open(self.path, 'rb') as f:
+            for product_id, product in ijson.kvitems(f, 'products', use_float=True):
+                self.bytes_read = f.tell()
+                self.count += 1
+                yield product_id, product
+        if self.count == 0:
+            # kvitems is silent about a missing key, so confirm the structure cheaply
+            with open(self.path, 'rb') as f:
+                if not any(prefix == 'products' and event == 'start_map'
+                           for prefix, event, _ in ijson.parse(f)):
+                    raise ValueError("Input file must contain a 'products' dictionary")
+
+    # Pure-Python fallback: a tiny tokenizer for the top-level structure that
+    # hands each value to json's raw_decode once it is fully buffered.
+
+    def _iter_tokens(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        found = False
+
+        with open(self.path, 'rb') as f:
+            self._file = f
+            if self._next_char() != '{':
+                raise ValueError("Input file must contain a 'products' dictionary")
+
+            if self._peek_char() == '}':
+                self._pos += 1
+            else:
+                while True:
+                    key = self._read_value()
+                    if self._next_char() != ':':
+                        raise ValueError("Malformed JSON: expected ':' after key")
+                    if key == "products":
+                        found = True
+                        yield from self._iter_products()
+                    else:
+                        self._read_value()
+
+                    separator = self._next_char()
+                    if separator == '}':
+                        break
+                    if separator != ',':
+                        raise ValueError("Malformed JSON: expected ',' or '}'")
+
+        if not found:
+            raise ValueError("Input file must contain a 'products' dictionary")
+
+    def _iter_products(self):
+        if self._next_char() != '{':
+            raise ValueError("'products' must be a dictionary")
+        if self._peek_char() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            product_id = self._read_value()
+            if self._next_char() != ':':
+                raise ValueError("Malformed JSON: expected ':' after product id")
+            product = self._read_value()
+            self.count += 1
+            yield product_id, product
+
+            separator = self._next_char()
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError("Malformed JSON: expected ',' or '}' between products")
+
+    def _fill(self) -> None:
+        data = self._file.read(self.chunk_size)
+        self.bytes_read += len(data)
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(data, final=not data)
+        self._pos = 0
+        if not data:
+            self._eof = True
+
+    def _peek_char(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if self._eof:
+                raise ValueError("Unexpected end of file")
+            self._fill()
+
+    def _next_char(self) -> str:
+        char = self._peek_char()
+        self._pos += 1
+        return char
+
+    def _read_value(self):
+        self._peek_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            # A number cut at the buffer edge decodes fine but may continue in the next chunk,
+            # also when the cut leaves a dangling '.', 'e' or sign after the digits read so far
+            if (not self._eof and isinstance(value, (int, float)) and not isinstance(value, bool) and
+                    all(char in _NUMBER_CHARS for char in self._buffer[end:])):
+                self._fill()
+                continue
+            self._pos = end
+            return value
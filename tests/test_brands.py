@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from brands import DEFAULT_CORRECTIONS, BrandNormalizer
+
+
+def original_normalize(brand: str, corrections: dict) -> str:
+    """FileProcessor._normalize_brand before the trie, with its corrections table as a parameter."""
+    brand = brand.upper()
+    for wrong, correct in corrections.items():
+        if brand == wrong or brand.startswith(wrong + " "):
+            return correct
+    if "ALCAMPO" in brand:
+        return "ALCAMPO"
+    return brand
+
+
+# Aliases that overlap the defaults and each other, as an alias file can
+ALIASES = dict(DEFAULT_CORRECTIONS, **{
+    "NESTLE": "NESTLÉ ESPAÑA",
+    "COCA": "COCA-COLA",
+    "COCA COLA ZERO": "COCA-COLA",
+    "DANONE ACTIVIA": "ACTIVIA",
+    "DANONE": "DANONE",
+    "EL POZO": "ELPOZO",
+    "STRASSE": "STRASSE"
+})
+
+WORDS = [
+    "nestle", "NESTLE", "Nestlé", "nesltÉ", "alcampo", "ALCAMPO", "baby", "BABY", "ecológico", "ECOLÓGICO",
+    "producto", "económico", "economico", "yogolino", "nativa", "de", "auchan", "coca", "cola", "zero",
+    "danone", "activia", "el", "pozo", "strasse", "straße", "puleva", "hacendado", "ıstanbul", "",
+    "alcampoo", "xalcampo", "1L", "-", "&"
+]
+
+
+def random_brand(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(0, 5))]
+    brand = rng.choice([" ", "  ", "\t"]).join(words) if rng.random() < 0.1 else " ".join(words)
+    if rng.random() < 0.05:
+        brand = f" {brand} "
+    return brand
+
+
+@pytest.mark.parametrize("corrections", [DEFAULT_CORRECTIONS, ALIASES], ids=["defaults", "aliases"])
+def test_matches_original_normalizer(corrections):
+    rng = random.Random(12)
+    # A small memo also exercises clearing it
+    normalizer = BrandNormalizer(corrections, max_memo=1000)
+    for _ in range(100_000):
+        brand = random_brand(rng)
+        assert normalizer.normalize(brand) == original_normalize(brand, corrections), brand
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+import catalogue_summary
+from catalogue_summary import CatalogueSummary
+from product_records import ProductTable
+
+CATEGORIES = [["Bebidas", "Zumos"], ["Bebidas", "Aguas"], ["Alimentación", "Lácteos", "Yogures"], ["Limpieza"], []]
+UNITS = ["(2,08 € / Litro)", "(0,92 € / 100 ml.)", "(1.234,50 €/kg)", "", "(3 € / ud)", "raro", None]
+
+
+def catalogue(size: int, seed: int = 3) -> list:
+    rng = random.Random(seed)
+    products = [
+        {"nombre": f"producto {i}", "marca": rng.choice(["NESTLÉ", "ALCAMPO", "DANONE", ""]),
+         "precio": round(rng.uniform(0.5, 20), 2), "descripcion": "N/A", "unidad": rng.choice(UNITS),
+         "tienda": rng.choice(["alcampo", "carrefour"]), "url": f"https://x/{i}", "imagen": "",
+         "categoria": rng.choice(CATEGORIES), "categoria_origen": "llm"}
+        for i in range(size)
+    ]
+    # Values a ProductTable keeps outside its columns
+    products[1]["precio"] = 3
+    del products[2]["precio"]
+    products[3]["categoria"] = "Bebidas"
+    products[4]["marca"] = None
+    return products
+
+
+def summarize(tmp_path, products, name: str, growth: int = 0) -> dict:
+    summary = CatalogueSummary(tmp_path / f"{name}.json", tmp_path / f"{name}.state")
+    if growth:
+        summary.update(products[:len(products) - growth])
+    result = summary.update(products)
+    result.pop("generated_at")
+    return result
+
+
+@pytest.mark.parametrize("use_numpy", [True, False], ids=["numpy", "python"])
+def test_table_columns_match_product_dicts(tmp_path, monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(catalogue_summary, "_numpy", lambda: None)
+    products = catalogue(500)
+
+    expected = summarize(tmp_path, products, "dicts")
+    assert summarize(tmp_path, ProductTable(products), "table") == expected
+    # Only the new products' unit prices are parsed, with the same result
+    assert summarize(tmp_path, ProductTable(products), "grown", growth=120) == expected
+    assert expected["by_category"]["(sin categoría)"]["products"] >= 1
+    assert expected["by_brand"]["(sin marca)"]["products"] >= 1
+
+
+def test_numpy_and_python_statistics_agree(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    products = catalogue(300, seed=8)
+    expected = summarize(tmp_path, products, "numpy")
+    monkeypatch.setattr(catalogue_summary, "_numpy", lambda: None)
+    assert summarize(tmp_path, products, "python") == expected
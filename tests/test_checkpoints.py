@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from fileprocessing import FileProcessor
+
+
+class Crash(BaseException):
+    """Kills the run the way a SIGKILL would: nothing in process_file handles it."""
+
+
+class CrashingClient:
+    def __init__(self, crash_at: int = None):
+        self.calls = 0
+        self.crash_at = crash_at
+
+    def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        if self.calls == self.crash_at:
+            raise Crash()
+        return json.dumps({"category_path": ["Bebidas", "Zumos"], "marca": "MARCA"})
+
+
+def upload(path, count):
+    products = {
+        f"p{i}": {"name": f"ZUMOSOL sabor {i} 1L", "brand": "", "description": "N/A",
+                  "price": {"current": 1.5}, "store": "alcampo"}
+        for i in range(count)
+    }
+    path.write_text(json.dumps({"products": products}), encoding="utf-8")
+    return str(path)
+
+
+def make_processor(crash_at=None, fsync_every=2):
+    processor = FileProcessor(use_cache=False, use_classifier=False, metrics_format="none",
+                              fsync_every=fsync_every, fsync_interval=3600, checkpoint_every=5)
+    processor.llm = CrashingClient(crash_at)
+    return processor
+
+
+def crash(processor):
+    """Lose whatever the journal still buffered in the process, as a killed process would."""
+    journal = processor.journal
+    synced = journal.path.stat().st_size
+    journal._file.close()
+    journal._file = None
+    os.truncate(journal.path, synced)
+
+
+# fsync_every=2 syncs (and checkpoints) after every product; with fsync_every=50 only the
+# checkpoints every five products sync, while records already written reach the file before that
+@pytest.mark.parametrize("fsync_every", [2, 50])
+@pytest.mark.parametrize("crash_at", [4, 8, 13])
+def test_resume_after_crash_matches_clean_run(tmp_path, monkeypatch, crash_at, fsync_every):
+    monkeypatch.chdir(tmp_path)
+    path = upload(tmp_path / "zumos.json", 20)
+
+    processor = make_processor(crash_at, fsync_every)
+    with pytest.raises(Crash):
+        processor.process_file(path, upload_id="zumos")
+    # Worst case: every record written so far reached the OS, synced or not
+    processor.journal._file.flush()
+    crash(processor)
+
+    resumed = make_processor(fsync_every=fsync_every)
+    result = resumed.process_file(path, upload_id="zumos", resume=True)
+    assert result["success"]
+    assert (result["processed"], result["skipped"], result["errors"]) == (20, 0, 0)
+    # Only products not yet durable at the crash go back to the LLM
+    assert resumed.llm.calls == 20 - result["resumed_from"]
+    assert crash_at - 1 - result["resumed_from"] < (2 if fsync_every == 2 else 5)
+    with open(tmp_path / "app" / "database" / "products.json", encoding="utf-8") as f:
+        assert len(json.load(f)["products"]) == 20
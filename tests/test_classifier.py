@@ -0,0 +1,93 @@
+import json
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from category_classifier import CategoryClassifier
+from fileprocessing import FileProcessor
+
+
+class ZumoClient:
+    """Thread-safe stand-in for Ollama that always answers the same category."""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+        return json.dumps({"category_path": ["Bebidas", "Zumos"], "marca": "ZUMOSOL"})
+
+
+class ShelfClient:
+    """Categorizes the shipped products by what their prompt names."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        if "margarina" in prompt.lower() or "plantequilla" in prompt.lower():
+            category_path = ["Lácteos", "Margarinas"]
+        else:
+            category_path = ["Lácteos", "Batidos"]
+        return json.dumps({"category_path": category_path})
+
+
+def upload(path, flavours):
+    products = {
+        f"p{i}": {"name": f"ZUMOSOL zumo de {flavour} 1L", "brand": "", "description": "N/A",
+                  "price": {"current": 1.5}, "store": "alcampo"}
+        for i, flavour in enumerate(flavours)
+    }
+    path.write_text(json.dumps({"products": products}), encoding="utf-8")
+    return str(path)
+
+
+def test_snapshot_is_independent_of_later_training():
+    classifier = CategoryClassifier(min_support=1)
+    classifier.learn("zumo de naranja", "ZUMOSOL", ["Bebidas", "Zumos"])
+    snapshot = classifier.snapshot()
+    classifier.learn("agua mineral", "FONT VELLA", ["Bebidas", "Aguas"])
+    assert snapshot.documents == 1 and "agua" not in snapshot.vocabulary
+    assert snapshot.predict("agua mineral", "FONT VELLA")[0] == ["Bebidas", "Zumos"]
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_run_predicts_with_the_model_from_its_start(tmp_path, monkeypatch, concurrency):
+    monkeypatch.chdir(tmp_path)
+    processor = FileProcessor(use_cache=False, metrics_format="none", concurrency=concurrency)
+    processor.llm = ZumoClient()
+
+    flavours = ["naranja", "piña", "manzana", "melocotón", "uva", "limón", "pomelo", "mango"] * 5
+    result = processor.process_file(upload(tmp_path / "zumos_1.json", [f"{f} {i}" for i, f in enumerate(flavours)]))
+    # The run started with an empty model, so whatever it learned on the way is not used yet
+    assert result["llm_calls_avoided"] == 0 and processor.llm.calls == len(flavours)
+
+    result = processor.process_file(upload(tmp_path / "zumos_2.json", [f"{f} extra" for f in flavours[:8]]))
+    assert result["llm_calls_avoided"] > 0
+
+
+def test_labelled_shipped_products_train_a_fresh_classifier(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database_dir = tmp_path / "app" / "database"
+    database_dir.mkdir(parents=True)
+    shipped = Path(__file__).resolve().parent.parent / "app" / "database" / "products.json"
+    shutil.copy(shipped, database_dir / "products.json")
+
+    processor = FileProcessor(use_cache=False, metrics_format="none", concurrency=4)
+    assert processor.classifier.documents == 0
+    processor.llm = ShelfClient()
+    result = processor.label_products()
+    assert result["labelled"] == result["unlabelled"] == processor.llm.calls == 85
+    assert result["errors"] == 0
+
+    fresh = FileProcessor(use_cache=False, metrics_format="none")
+    assert all(product["categoria_origen"] == "llm" for product in fresh.products["products"])
+    assert fresh.classifier.confident("PULEVA batido de cacao botella 1 l", "PULEVA") == ["Lácteos", "Batidos"]
+    assert fresh.classifier.confident("TULIPAN margarina ligera tarrina 250 g", "TULIPAN") == ["Lácteos", "Margarinas"]
+    # Everything is labelled now, so a second pass asks for nothing
+    assert fresh.label_products()["unlabelled"] == 0
@@ -0,0 +1,122 @@
+import random
+
+from brands import BrandNormalizer
+from dedup_index import DedupIndex
+
+
+def similar_names(name1: str, name2: str) -> bool:
+    """FileProcessor._similar_names as it was before the index."""
+    prefixes = ["producto economico", "ecologico", "baby", "alcampo"]
+    for prefix in prefixes:
+        if name1.startswith(prefix):
+            name1 = name1[len(prefix):].strip()
+        if name2.startswith(prefix):
+            name2 = name2[len(prefix):].strip()
+    return name1 == name2
+
+
+def normalized(product: dict, normalize_brand) -> tuple:
+    """(name, brand, store, url) as FileProcessor._is_duplicate_product normalized them before the index."""
+    return (product["nombre"].lower().strip(), normalize_brand(product["marca"]).lower(),
+            product["tienda"].lower().strip(), product.get("url", "").lower().strip())
+
+
+def is_duplicate(stored: list, product: dict, normalize_brand) -> bool:
+    """FileProcessor._is_duplicate_product as it was before the index: a scan over every stored product.
+
+    stored holds the normalized() fields of the stored products, computed once for all candidates.
+    """
+    normalized_name, normalized_brand, normalized_store, normalized_url = normalized(product, normalize_brand)
+
+    for existing_name, existing_brand, existing_store, existing_url in stored:
+        if (normalized_name == existing_name and
+                normalized_brand == existing_brand and
+                normalized_store == existing_store):
+            return True
+        if normalized_url and existing_url and normalized_url == existing_url:
+            return True
+        if (normalized_brand == "alcampo" and existing_brand == "alcampo" and
+                normalized_store == existing_store and
+                similar_names(normalized_name, existing_name)):
+            return True
+    return False
+
+
+def generate_corpus(size: int, rng: random.Random) -> list:
+    """Products with the naming quirks the dedup rules care about."""
+    brands = ["PULEVA", "Nestle", "NESTLÉ", "Alcampo", "ALCAMPO BABY", "Auchan",
+              "Producto Económico Alcampo", "Coca-Cola", "Danone", "Hacendado"]
+    prefixes = ["", "producto economico ", "ecologico ", "baby ", "alcampo ", "Alcampo "]
+    nouns = ["batido de cacao", "leche entera", "zumo de naranja", "agua mineral",
+             "yogur natural", "galletas", "papilla de frutas", "cerveza", "aceite de oliva"]
+    stores = ["alcampo", "elcorteingles", "Alcampo ", "carrefour"]
+
+    corpus = []
+    for _ in range(size):
+        name = f"{rng.choice(prefixes)}{rng.choice(nouns)} {rng.randint(1, size // 10 + 1)} ud"
+        corpus.append({
+            "nombre": name if rng.random() > 0.1 else f"  {name.upper()} ",
+            "marca": rng.choice(brands),
+            "tienda": rng.choice(stores),
+            "url": f"https://example.com/p/{rng.randint(0, size * 4)}" if rng.random() > 0.3 else ""
+        })
+    return corpus
+
+
+def sample_candidates(corpus: list, count: int, rng: random.Random) -> list:
+    """Fresh products plus forced exact, URL and Alcampo-name hits and near misses of each."""
+    candidates = generate_corpus(count, rng)
+    for i, candidate in enumerate(candidates):
+        source = rng.choice([product for product in rng.sample(corpus, 50) if product["url"]])
+        kind = i % 7
+        if kind == 1:
+            candidate.update(nombre=source["nombre"].title(), marca=source["marca"], tienda=source["tienda"])
+        elif kind == 2:
+            # Same name and brand, another store
+            other = "carrefour" if source["tienda"].lower().strip() != "carrefour" else "alcampo"
+            candidate.update(nombre=source["nombre"], marca=source["marca"], tienda=other, url="")
+        elif kind == 3:
+            candidate["url"] = source["url"].upper()
+        elif kind == 4:
+            candidate["url"] = source["url"] + "0"
+        elif kind in (5, 6):
+            # The source is made an Alcampo product, and the candidate its name under another prefix
+            source["marca"] = "ALCAMPO"
+            core = source["nombre"].lower().strip()
+            for prefix in ["producto economico", "ecologico", "baby", "alcampo"]:
+                if core.startswith(prefix):
+                    core = core[len(prefix):].strip()
+            name = f"{rng.choice(['producto economico', 'ecologico', 'baby'])} {core}"
+            # A near miss differs in the core name
+            candidate.update(nombre=name if kind == 5 else name + " x", marca="Alcampo", tienda=source["tienda"])
+    return candidates
+
+
+def test_index_matches_linear_scan():
+    rng = random.Random(0)
+    corpus = generate_corpus(100_000, rng)
+    # The scan is O(n) per candidate, so it only checks a sample against the full-size index
+    candidates = sample_candidates(corpus, 140, rng)
+
+    normalize_brand = BrandNormalizer().normalize
+    index = DedupIndex(normalize_brand)
+    index.build(corpus)
+    stored = [normalized(product, normalize_brand) for product in corpus]
+
+    duplicates = 0
+    for candidate in candidates:
+        expected = is_duplicate(stored, candidate, normalize_brand)
+        assert (index.match(candidate) is not None) == expected, candidate
+        duplicates += expected
+    # Both outcomes have to be covered for the comparison to mean anything
+    assert 40 < duplicates < len(candidates) - 40
+
+
+def test_accepted_products_are_found_immediately():
+    index = DedupIndex(BrandNormalizer().normalize)
+    index.build([])
+    product = {"nombre": "Alcampo leche entera 1L", "marca": "Alcampo", "tienda": "alcampo", "url": ""}
+    assert index.match(product) is None
+    index.add(product)
+    assert index.match(dict(product, nombre=" ALCAMPO LECHE ENTERA 1L")) == "key"
+    assert index.match(dict(product, nombre="producto economico leche entera 1L")) == "alcampo"
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from fileprocessing import FileProcessor
+
+
+class CategoryClient:
+    """Stands in for Ollama: answers every prompt with the same category, or garbage."""
+
+    def __init__(self):
+        self.calls = 0
+        self.valid = True
+
+    def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        if not self.valid:
+            return "no sé"
+        return json.dumps({"category_path": ["Bebidas", "Zumos"], "marca": "MARCA"})
+
+
+def export(path, names, prices):
+    products = {
+        f"p{i}": {
+            "name": name,
+            "brand": "",
+            "description": "N/A",
+            "price": {"current": price},
+            "store": "alcampo",
+            "metadata": {"original_data": {"original_data": {
+                "price_per_unit": f"({price:.2f} € / Litro)".replace(".", ","),
+                "url": f"https://x/{i}",
+                "image_url": ""
+            }}}
+        }
+        for i, (name, price) in enumerate(zip(names, prices))
+    }
+    path.write_text(json.dumps({"products": products}, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    processor = FileProcessor(delta=True, use_cache=False, use_classifier=False, metrics_format="none")
+    processor.llm = CategoryClient()
+    return processor
+
+
+def test_changed_product_is_updated_in_place(processor, tmp_path):
+    names = ["ZUMOSOL naranja 1L", "ZUMOSOL piña 1L"]
+    processor.process_file(export(tmp_path / "zumos_2024-05-01.json", names, [1.5, 1.8]))
+    calls = processor.llm.calls
+
+    result = processor.process_file(
+        export(tmp_path / "zumos_2024-05-02.json", ["ZUMOSOL naranja sin pulpa 1L", names[1]], [1.6, 1.8])
+    )
+    assert result["delta"]["changed"] == 1 and result["delta"]["updated"] == 1
+    assert result["processed"] == 1 and result["skipped"] == 0
+    assert processor.llm.calls == calls + 1
+
+    stored = processor.products["products"]
+    assert len(stored) == 2
+    assert stored[0]["nombre"] == "ZUMOSOL naranja sin pulpa 1L"
+    assert stored[0]["precio"] == 1.6
+    assert stored[0]["historial_precios"][-1]["precio_anterior"] == 1.5
+
+    # The manifest now holds the new content, so nothing is left to do
+    again = processor.process_file(
+        export(tmp_path / "zumos_2024-05-03.json", ["ZUMOSOL naranja sin pulpa 1L", names[1]], [1.6, 1.8])
+    )
+    assert again["delta"]["unchanged"] == 2 and processor.llm.calls == calls + 1
+
+
+def test_failed_update_is_retried_next_run(processor, tmp_path):
+    processor.process_file(export(tmp_path / "zumos_2024-05-01.json", ["ZUMOSOL naranja 1L"], [1.5]))
+
+    processor.llm.valid = False
+    failed = processor.process_file(export(tmp_path / "zumos_2024-05-02.json", ["ZUMOSOL naranja bio 1L"], [1.5]))
+    assert failed["errors"] == 1
+    assert processor.products["products"][0]["nombre"] == "ZUMOSOL naranja 1L"
+
+    processor.llm.valid = True
+    retried = processor.process_file(export(tmp_path / "zumos_2024-05-03.json", ["ZUMOSOL naranja bio 1L"], [1.5]))
+    assert retried["delta"]["updated"] == 1
+    assert processor.products["products"][0]["nombre"] == "ZUMOSOL naranja bio 1L"
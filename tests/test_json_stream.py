@@ -0,0 +1,36 @@
+import pytest
+
+from json_stream import InvalidJSONStream, read_json_stream
+
+
+def tokens(*chunks):
+    yield from chunks
+
+
+def test_stream_that_ends_after_the_value_was_not_stopped_early():
+    # Ollama closes a finished stream with an empty chunk
+    text, count, stopped = read_json_stream(tokens('{"a": ', '1}', ''))
+    assert (text, count, stopped) == ('{"a": 1}', 3, False)
+    assert read_json_stream(tokens('{"a": 1}'))[2] is False
+
+
+def test_stream_that_keeps_generating_is_closed_early():
+    closed = []
+
+    def endless():
+        try:
+            yield "```json\n"
+            yield '{"a": [1, 2]}'
+            while True:
+                yield " "
+        finally:
+            closed.append(True)
+
+    text, count, stopped = read_json_stream(endless())
+    assert text == '{"a": [1, 2]}' and stopped and count == 4
+    assert closed == [True]
+
+
+def test_prose_instead_of_json_is_rejected():
+    with pytest.raises(InvalidJSONStream):
+        read_json_stream(tokens("Claro, aquí tienes la categoría " * 4, "{}"))
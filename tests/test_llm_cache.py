@@ -0,0 +1,77 @@
+import json
+
+from fileprocessing import FileProcessor
+from llm_cache import LLMResponseCache
+
+
+class FlakyClient:
+    """Answers garbage first, then a valid category."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, prompt: str) -> str:
+        self.calls += 1
+        if self.calls == 1:
+            return "no sé"
+        return json.dumps({"category_path": ["Bebidas", "Zumos"], "marca": "MARCA"})
+
+
+def test_invalid_answers_are_not_cached_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "zumos.json"
+    path.write_text(json.dumps({"products": {"p0": {
+        "name": "ZUMOSOL naranja 1L", "brand": "", "description": "N/A", "price": {"current": 1.5}, "store": "alcampo"
+    }}}), encoding="utf-8")
+    processor = FileProcessor(use_classifier=False, metrics_format="none", max_retries=0)
+    processor.llm = FlakyClient()
+
+    assert processor.process_file(str(path))["errors"] == 1
+    result = processor.process_file(str(path))
+    assert result["processed"] == 1 and result["cache"]["hits"] == 0
+    assert processor.llm.calls == 2
+
+
+def test_response_format_is_part_of_the_key(tmp_path):
+    plain = LLMResponseCache(tmp_path / "cache.sqlite", "model", {"temperature": 0})
+    plain.put("prompt", "answer")
+    json_mode = LLMResponseCache(tmp_path / "cache.sqlite", "model", {"temperature": 0},
+                                 response_format={"json": True, "stream": False})
+    assert json_mode.get("prompt") is None
+    assert plain.get("prompt") == "answer"
+
+
+class BatchClient:
+    """Answers batched and single prompts alike, counting each kind."""
+
+    def __init__(self):
+        self.batches = 0
+        self.singles = 0
+
+    def invoke(self, prompt: str) -> str:
+        answer = {"category_path": ["Bebidas", "Zumos"], "marca": "ZUMOSOL"}
+        numbers = [int(line.split(".")[0]) for line in prompt.splitlines() if line[:1].isdigit() and ". Producto:" in line]
+        if numbers:
+            self.batches += 1
+            return json.dumps([dict(answer, id=number) for number in numbers])
+        self.singles += 1
+        return json.dumps(answer)
+
+
+def test_batch_comparison_bypasses_the_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "zumos.json"
+    path.write_text(json.dumps({"products": {f"p{i}": {
+        "name": f"ZUMOSOL sabor {i} 1L", "brand": "", "description": "N/A", "price": {"current": 1.5}, "store": "alcampo"
+    } for i in range(8)}}), encoding="utf-8")
+    processor = FileProcessor(use_classifier=False, metrics_format="none", batch_prompts=4, batch_compare_every=1)
+    processor.llm = BatchClient()
+    assert processor.process_file(str(path))["batching"]["compared"] == 8
+    assert (processor.llm.batches, processor.llm.singles) == (2, 8)
+
+    # The batches come from the cache now and are not timed; the comparisons still ask the LLM
+    batching = processor.process_file(str(path))["batching"]
+    assert (processor.llm.batches, processor.llm.singles) == (2, 16)
+    assert batching["prompts"] == 0 and batching["seconds_per_item_batched"] is None
+    assert batching["compared"] == 8 and batching["agreement"] == 1.0
+    assert batching["seconds_per_item_single"] is not None
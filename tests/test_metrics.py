@@ -0,0 +1,21 @@
+import json
+
+from metrics import PipelineMetrics
+
+
+def test_jsonl_is_rotated_at_max_bytes(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = PipelineMetrics(path, max_bytes=1000, backup_count=2)
+    metrics.observe("llm", 0.25)
+    for i in range(60):
+        metrics.increment("products_processed")
+        metrics.flush()
+
+    files = sorted(file.name for file in tmp_path.iterdir())
+    assert files == ["metrics.jsonl", "metrics.jsonl.1", "metrics.jsonl.2"]
+    assert all((tmp_path / name).stat().st_size <= 1000 for name in files)
+    # Every file holds whole snapshots, and the newest one is in metrics.jsonl
+    snapshots = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert snapshots[-1]["counters"]["products_processed"] == 60
+    older = [json.loads(line) for line in (tmp_path / "metrics.jsonl.1").read_text(encoding="utf-8").splitlines()]
+    assert older[-1]["counters"]["products_processed"] == snapshots[0]["counters"]["products_processed"] - 1
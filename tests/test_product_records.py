@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from product_records import ProductTable
+
+# Objects with "nombre" and "tienda" that are not stored products: a product's nested offer
+# and a top-level member
+CATALOGUE = {
+    "fuente": {"nombre": "scraper", "tienda": "alcampo", "version": 3},
+    "products": [
+        {"nombre": "Zumo de naranja 1L", "marca": "ZUMOSOL", "precio": 1.5, "tienda": "alcampo",
+         "oferta": {"nombre": "2x1", "tienda": "alcampo"}, "categoria": ["Bebidas", "Zumos"]},
+        {"nombre": "Agua 1,5L", "marca": "FONT VELLA", "precio": 1, "tienda": "carrefour", "url": None}
+    ],
+    "total": 2
+}
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_load_json_encodes_only_the_products_list(tmp_path, indent):
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps(CATALOGUE, ensure_ascii=False, indent=indent), encoding="utf-8")
+
+    data = ProductTable.load_json(path)
+    assert isinstance(data["products"], ProductTable)
+    assert [product.copy() for product in data["products"]] == CATALOGUE["products"]
+    assert {key: value for key, value in data.items() if key != "products"} == {
+        "fuente": CATALOGUE["fuente"], "total": 2
+    }
+
+
+@pytest.mark.parametrize("text", ['{"products": []}', ' { } ', '{"products": [] , "x": {}}'])
+def test_load_json_empty_catalogues(tmp_path, text):
+    path = tmp_path / "products.json"
+    path.write_text(text, encoding="utf-8")
+    assert len(ProductTable.load_json(path)["products"]) == 0
+
+
+@pytest.mark.parametrize("text", ['{"products": [{}] "x": 1}', '{"products": [{},]}', '{"products": []} []',
+                                  '{"products": {"a": {}}}'])
+def test_load_json_rejects_malformed_files(tmp_path, text):
+    path = tmp_path / "products.json"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError):
+        ProductTable.load_json(path)
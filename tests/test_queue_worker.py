@@ -0,0 +1,61 @@
+import json
+import threading
+from types import SimpleNamespace
+
+from queue_worker import QueueWorker, uploads_lock
+
+
+class BrokenIngest:
+    def run(self, jobs):
+        raise RuntimeError("shard worker died")
+
+
+def make_worker(tmp_path, uploads, ingest=None):
+    uploads_file = tmp_path / "uploads.json"
+    uploads_file.write_text(json.dumps({"uploads": uploads}), encoding="utf-8")
+    processor = SimpleNamespace(base_dir=tmp_path, reload_if_changed=lambda: False)
+    return QueueWorker(processor, uploads_file, tmp_path / "heartbeat.json", ingest=ingest)
+
+
+def statuses(worker):
+    return {upload["id"]: upload["status"] for upload in worker._load_uploads()["uploads"]}
+
+
+def test_failed_batch_marks_every_upload_as_error(tmp_path):
+    (tmp_path / "a.json").write_text("{}", encoding="utf-8")
+    (tmp_path / "b.json").write_text("{}", encoding="utf-8")
+    uploads = [{"id": name, "queuePath": f"{name}.json", "status": "queued"} for name in ("a", "b", "missing")]
+    worker = make_worker(tmp_path, uploads, ingest=BrokenIngest())
+
+    results = worker.process_batch(uploads)
+    assert statuses(worker) == {"a": "error", "b": "error", "missing": "error"}
+    assert "shard worker died" in results["a"]["error"]
+    assert "File not found" in results["missing"]["error"]
+    assert worker.state == "idle"
+
+
+def test_concurrent_updates_are_not_lost(tmp_path):
+    uploads = [{"id": str(i), "status": "queued"} for i in range(8)]
+    worker = make_worker(tmp_path, uploads)
+
+    def update(upload_id):
+        for step in range(20):
+            worker._update_upload(upload_id, step=step)
+
+    threads = [threading.Thread(target=update, args=(upload["id"],)) for upload in uploads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [upload.get("step") for upload in worker._load_uploads()["uploads"]] == [19] * 8
+    assert not (tmp_path / "uploads.json.lock").exists()
+
+
+def test_stale_lock_is_broken(tmp_path, monkeypatch):
+    import queue_worker
+
+    monkeypatch.setattr(queue_worker, "LOCK_STALE_SECONDS", 0.0)
+    (tmp_path / "uploads.json.lock").write_text("", encoding="utf-8")
+    with uploads_lock(tmp_path / "uploads.json"):
+        pass
+    assert not (tmp_path / "uploads.json.lock").exists()
@@ -0,0 +1,130 @@
+import json
+import sqlite3
+
+import pytest
+
+from brands import BrandNormalizer
+from stores import SQLiteStore
+
+# Shaped like the legacy arvore_categorias.json: ids from the old len()+1 scheme repeat,
+# and the same category appears with different case and accents
+LEGACY_TREE = {
+    "categorias": [
+        {"id": "1", "nombre": "Bebidas", "descripcion": "Categoría de Bebidas", "subcategorias": [
+            {"id": "1.1", "nombre": "Zumos", "descripcion": "", "subcategorias": []},
+            {"id": "1.2", "nombre": "Refrescos", "descripcion": "", "subcategorias": []},
+            {"id": "1.2", "nombre": "Aguas", "descripcion": "", "subcategorias": []},
+            {"id": "1.3", "nombre": "zumos", "descripcion": "", "subcategorias": [
+                {"id": "1.2", "nombre": "Naranja", "descripcion": "", "subcategorias": []}
+            ]}
+        ]},
+        {"id": "1", "nombre": "Alimentación", "descripcion": "", "subcategorias": [
+            {"id": "1.2", "nombre": "Lácteos", "descripcion": "", "subcategorias": []}
+        ]},
+        {"id": "3", "nombre": "ALIMENTACION", "descripcion": "", "subcategorias": []}
+    ]
+}
+
+PRODUCTS = {
+    "products": [
+        {"nombre": "Zumo de naranja 1L", "marca": "Nestle", "precio": 1.5, "descripcion": "N/A",
+         "unidad": "(1,50 € / Litro)", "tienda": "alcampo", "url": "https://x/1", "imagen": "",
+         "categoria": ["Bebidas", "Zumos"], "categoria_origen": "llm"}
+    ]
+}
+
+
+def write_legacy_files(directory):
+    paths = [directory / name for name in ("arvore_categorias.json", "products.json", "marcas.json")]
+    for path, data in zip(paths, (LEGACY_TREE, PRODUCTS, {"marcas": [{"nombre": "NESTLÉ", "descripcion": ""}]})):
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return paths
+
+
+def tree_names(tree):
+    return {record["nombre"]: tree_names(record["subcategorias"]) for record in tree}
+
+
+def test_import_json_normalizes_colliding_category_ids(tmp_path):
+    store = SQLiteStore(tmp_path / "catalogue.sqlite", BrandNormalizer().normalize)
+    result = store.import_json(*write_legacy_files(tmp_path))
+    assert result == {"products": 1, "brands": 1}
+
+    ids = [row[0] for row in store.conn.execute("SELECT id FROM categories")]
+    assert len(ids) == len(set(ids))
+    # Case and accent variants are merged into the first sibling, with their children
+    assert tree_names(store.load_categories()["categorias"]) == {
+        "Bebidas": {"Zumos": {"Naranja": {}}, "Refrescos": {}, "Aguas": {}},
+        "Alimentación": {"Lácteos": {}}
+    }
+
+
+def test_sqlite_processor_adopts_legacy_json(tmp_path, monkeypatch):
+    from fileprocessing import FileProcessor
+
+    monkeypatch.chdir(tmp_path)
+    database_dir = tmp_path / "app" / "database"
+    database_dir.mkdir(parents=True)
+    write_legacy_files(database_dir)
+
+    processor = FileProcessor(storage="sqlite", use_cache=False, use_classifier=False, metrics_format="none")
+    assert len(processor.products["products"]) == 1
+    assert processor.category_trie.find(["Bebidas", "zumos", "naranja"]) is not None
+    processor.store.close()
+
+
+def test_brand_rule_change_reindexes_dedup_keys(tmp_path):
+    path = tmp_path / "catalogue.sqlite"
+    store = SQLiteStore(path, BrandNormalizer().normalize)
+    store.import_json(*write_legacy_files(tmp_path))
+    assert store.sync_brand_rules(BrandNormalizer().version())
+    assert not store.sync_brand_rules(BrandNormalizer().version())
+
+    renamed = BrandNormalizer({"NESTLE": "NESTLE SA"})
+    store.normalize_brand = renamed.normalize
+    assert store.sync_brand_rules(renamed.version())
+    assert store.dedup_index(renamed.normalize, None).match(PRODUCTS["products"][0]) == "key"
+
+    # The new keys are what a second connection sees
+    conn = sqlite3.connect(str(path))
+    assert conn.execute("SELECT dedup_key FROM products").fetchone()[0].split("\x1f")[1] == "nestle sa"
+
+
+def test_sqlite_product_list_indexes_by_position(tmp_path):
+    store = SQLiteStore(tmp_path / "catalogue.sqlite", BrandNormalizer().normalize)
+    products = store.load_products()["products"]
+    products.extend(dict(PRODUCTS["products"][0], nombre=f"Zumo {i}", url=f"https://x/{i}") for i in range(5))
+    assert [products[i]["nombre"] for i in range(len(products))] == [f"Zumo {i}" for i in range(5)]
+    assert products[-1]["nombre"] == "Zumo 4"
+
+    # Positions follow the rows after they change
+    store.replace_products({"products": products}, [dict(PRODUCTS["products"][0], nombre="Zumo 9")])
+    products.append(dict(PRODUCTS["products"][0], nombre="Zumo 10", url="https://x/10"))
+    assert [products[i]["nombre"] for i in range(len(products))] == ["Zumo 9", "Zumo 10"]
+    with pytest.raises(IndexError):
+        products[2]
+
+
+def test_new_categories_are_published_to_the_ui_categories_file(tmp_path, monkeypatch):
+    from fileprocessing import FileProcessor
+
+    monkeypatch.chdir(tmp_path)
+    database_dir = tmp_path / "app" / "database"
+    database_dir.mkdir(parents=True)
+    ui_file = database_dir / "categories.json"
+    curated = [{"id": "a7a1", "name": "BEBIDAS", "parentId": None, "metadata": {"color": "blue"}}]
+    ui_file.write_text(json.dumps({"categories": curated}), encoding="utf-8")
+
+    processor = FileProcessor(use_cache=False, use_classifier=False, metrics_format="none")
+    processor._find_or_create_category(["Bebidas", "Zumos"])
+    processor._commit()
+    categories = json.loads(ui_file.read_text(encoding="utf-8"))["categories"]
+    # The curated entry is kept and the new level hangs from it
+    assert categories[0] == curated[0]
+    assert [(entry["name"], entry["parentId"]) for entry in categories[1:]] == [("Zumos", "a7a1")]
+
+    # Nothing new, nothing written
+    ui_file.write_text("untouched", encoding="utf-8")
+    processor._find_or_create_category(["bebidas", "ZUMOS"])
+    processor._commit()
+    assert ui_file.read_text(encoding="utf-8") == "untouched"
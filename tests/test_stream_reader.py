@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from stream_reader import ProductStream
+
+# Numbers that can be cut after '.', 'e', 'E' or a sign, multi-byte characters and nested values
+FIXTURE = {
+    "source": "alcampo",
+    "count": 3,
+    "products": {
+        "a": {"name": "Zumo de naranja", "price": 1.5, "unit": "(1,50 € / Litro)", "stock": 12},
+        "b": {"name": "Café ñandú — 250 g", "price": 12.345e1, "weights": [0.25, -1.5E-3, 1e+2], "offer": None},
+        "c": {"name": "Agua", "price": -0.99, "ok": True, "tags": {"x": [1, 2.0, {"y": 3}]}}
+    },
+    "z": 1.5,
+    "exponent": -2.5e-10
+}
+
+
+def stream(path, chunk_size):
+    reader = ProductStream(path, chunk_size=chunk_size, use_ijson=False)
+    return dict(reader), reader
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 17))
+def test_every_chunk_size_matches_json_load(tmp_path, chunk_size):
+    path = tmp_path / "upload.json"
+    path.write_text(json.dumps(FIXTURE, ensure_ascii=False, indent=1), encoding="utf-8")
+    with open(path, encoding="utf-8") as f:
+        expected = json.load(f)["products"]
+
+    products, reader = stream(path, chunk_size)
+    assert products == expected
+    assert reader.count == len(expected)
+    assert reader.progress() == 1.0
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5])
+def test_number_after_products_is_not_truncated(tmp_path, chunk_size):
+    path = tmp_path / "upload.json"
+    path.write_text('{"products": {"a": 1}, "z": 1.5}', encoding="utf-8")
+    assert stream(path, chunk_size)[0] == {"a": 1}
+
+
+def test_missing_products_is_rejected(tmp_path):
+    path = tmp_path / "upload.json"
+    path.write_text('{"items": {"a": 1}}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        stream(path, 4)